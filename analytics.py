@@ -0,0 +1,163 @@
+import math
+import logging
+from collections import Counter, deque
+from dataclasses import dataclass, field
+
+from db import apply_analytics, get_user_baselines
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_KEY = "*"
+PEAK_BUCKET = 3600
+MIB = 1024 * 1024
+
+# Верхние границы корзин гистограмм (как le в Prometheus)
+DURATION_BUCKETS = (1, 5, 15, 30, 60, 120, 240, 480, 1440, math.inf)
+TRAFFIC_BUCKETS = tuple(size * MIB for size in (1, 10, 100, 500, 1024, 5 * 1024, 10 * 1024)) + (math.inf,)
+HISTOGRAMS = {"duration_minutes": DURATION_BUCKETS, "traffic_bytes": TRAFFIC_BUCKETS}
+
+
+def format_le(value):
+    return "+Inf" if value == math.inf else str(int(value))
+
+
+def histogram_bucket(buckets, value):
+    for le in buckets:
+        if value <= le:
+            return format_le(le)
+    return format_le(buckets[-1])
+
+
+def session_traffic(session):
+    return (session["bytes_received"] or 0) + (session["bytes_sent"] or 0)
+
+
+@dataclass
+class AnalyticsUpdate:
+    # (common_name, час) -> пик одновременных сессий
+    peaks: dict = field(default_factory=dict)
+    # (сутки, метрика, le) -> число сессий
+    histograms: Counter = field(default_factory=Counter)
+    # common_name -> (samples, traffic_mean, traffic_var, updated_at)
+    baselines: dict = field(default_factory=dict)
+    # (at, server_id, common_name, kind, value, baseline)
+    flags: list = field(default_factory=list)
+
+    def peak(self, common_name, at, value):
+        key = (common_name, int(at) // PEAK_BUCKET * PEAK_BUCKET)
+        if value > self.peaks.get(key, 0):
+            self.peaks[key] = value
+
+
+class SessionAnalytics:
+    # Агрегаты обновляются по событиям цикла поллера (открытия и закрытия сессий), история не пересчитывается.
+    # Одновременные сессии считаются заметанием: события цикла сортируются по времени и применяются к счётчикам,
+    # начальное значение которых берётся из открытых сессий до цикла
+    def __init__(self, storm_window=600, storm_threshold=10, spike_factor=4.0, spike_min_bytes=100 * MIB,
+                 baseline_alpha=0.1, baseline_min_samples=5):
+        self.storm_window = storm_window
+        self.storm_threshold = storm_threshold
+        self.spike_factor = spike_factor
+        self.spike_min_bytes = spike_min_bytes
+        self.baseline_alpha = baseline_alpha
+        self.baseline_min_samples = baseline_min_samples
+        self.baselines = None
+        self._connects = {}
+        self._storm_flagged = {}
+        self._hour = None
+        self.stats = {"cycles": 0, "flags": 0, "last_error": None}
+
+    async def record_cycle(self, open_sessions, plan, now):
+        try:
+            if self.baselines is None:
+                self.baselines = await get_user_baselines()
+            update = self.process(open_sessions, plan, now)
+            await apply_analytics(update.peaks, update.histograms, update.baselines, update.flags)
+        except Exception as e:
+            self.stats["last_error"] = str(e)
+            logger.error(f"Failed to update session analytics: {e}")
+            return None
+        self.stats["cycles"] += 1
+        self.stats["flags"] += len(update.flags)
+        self.stats["last_error"] = None
+        if update.flags:
+            kinds = Counter(flag[3] for flag in update.flags)
+            logger.warning(f"Flagged {len(update.flags)} sessions: "
+                           f"{', '.join(f'{kind}: {count}' for kind, count in kinds.items())}")
+        return update
+
+    def process(self, open_sessions, plan, now):
+        update = AnalyticsUpdate()
+        sessions = {session["id"]: session for session in open_sessions}
+        concurrent = Counter(session["common_name"] for session in open_sessions)
+        total = len(open_sessions)
+
+        # Закрытие раньше открытия с тем же временем: переподключение не даёт ложного пика
+        events = []
+        for disconnected_at, duration, _, session_id in plan.disconnects:
+            session = sessions.get(session_id)
+            if session is not None:
+                events.append((disconnected_at, -1, session, duration))
+        for connection in plan.new_connections:
+            events.append((connection[1], 1, {"common_name": connection[0], "server_id": connection[5]}, None))
+        events.sort(key=lambda event: (event[0], event[1]))
+
+        for at, delta, session, duration in events:
+            common_name = session["common_name"]
+            concurrent[common_name] += delta
+            total += delta
+            if delta > 0:
+                update.peak(common_name, at, concurrent[common_name])
+                update.peak(GLOBAL_KEY, at, total)
+                self._check_storm(update, session, at)
+            else:
+                self._close_session(update, session, at, duration, now)
+
+        # Сессии, открытые через границу часа, тоже входят в пик нового часа
+        hour = int(now) // PEAK_BUCKET
+        if hour != self._hour:
+            for common_name, count in concurrent.items():
+                if count > 0:
+                    update.peak(common_name, now, count)
+            self._hour = hour
+        update.peak(GLOBAL_KEY, now, total)
+        return update
+
+    def _close_session(self, update, session, at, duration, now):
+        day = int(at) // 86400 * 86400
+        traffic = session_traffic(session)
+        update.histograms[(day, "duration_minutes", histogram_bucket(DURATION_BUCKETS, duration or 0))] += 1
+        update.histograms[(day, "traffic_bytes", histogram_bucket(TRAFFIC_BUCKETS, traffic))] += 1
+
+        # Базовый уровень трафика пользователя - экспоненциальное скользящее среднее и дисперсия по сессиям
+        common_name = session["common_name"]
+        samples, mean, var, _ = self.baselines.get(common_name, (0, 0.0, 0.0, 0))
+        threshold = mean + self.spike_factor * math.sqrt(var)
+        if samples >= self.baseline_min_samples and traffic > max(threshold, self.spike_min_bytes):
+            update.flags.append((int(at), session["server_id"], common_name, "traffic_spike", traffic, mean))
+        if samples == 0:
+            mean, var = traffic, 0.0
+        else:
+            diff = traffic - mean
+            mean += self.baseline_alpha * diff
+            var = (1 - self.baseline_alpha) * (var + self.baseline_alpha * diff * diff)
+        self.baselines[common_name] = update.baselines[common_name] = (samples + 1, mean, var, int(now))
+
+    def _check_storm(self, update, session, at):
+        # Частые переподключения: не меньше storm_threshold новых сессий за storm_window секунд
+        common_name = session["common_name"]
+        connects = self._connects.setdefault(common_name, deque())
+        connects.append(at)
+        while connects and connects[0] <= at - self.storm_window:
+            connects.popleft()
+        if len(connects) >= self.storm_threshold and self._storm_flagged.get(common_name, 0) <= at - self.storm_window:
+            self._storm_flagged[common_name] = at
+            update.flags.append((int(at), session["server_id"], common_name, "reconnect_storm", len(connects), None))
+
+    def evict(self, now):
+        # Очередь подключений и отметки флагов нужны только в пределах окна
+        for common_name in [name for name, connects in self._connects.items()
+                            if not connects or connects[-1] <= now - self.storm_window]:
+            del self._connects[common_name]
+        for common_name in [name for name, at in self._storm_flagged.items() if at <= now - self.storm_window]:
+            del self._storm_flagged[common_name]
@@ -1,4 +1,6 @@
 import os
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
@@ -7,13 +9,18 @@ from fastapi import Depends, HTTPException, status, Request
 from fastapi.security import OAuth2PasswordBearer
 from pydantic import BaseModel
 
-from db import get_credentials_from_db
+from db import get_credentials_from_db, set_sysadmin_disabled
 
 # Конфигурация
 SECRET_KEY = os.environ.get("AKELLAVK_TKN", "supermario")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# Кэш проверенных токенов: token -> (User, действителен до)
+TOKEN_CACHE_TTL = 60
+TOKEN_CACHE_SIZE = 1024
+_token_cache = OrderedDict()
+
 # Хеширование паролей
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -50,6 +57,31 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def _get_cached_user(token: str):
+    entry = _token_cache.get(token)
+    if entry is None:
+        return None
+    user, valid_until = entry
+    if valid_until <= time.time():
+        _token_cache.pop(token, None)
+        return None
+    _token_cache.move_to_end(token)
+    return user
+
+def _cache_user(token: str, user: "User", expires_at: float):
+    _token_cache[token] = (user, min(time.time() + TOKEN_CACHE_TTL, expires_at))
+    _token_cache.move_to_end(token)
+    while len(_token_cache) > TOKEN_CACHE_SIZE:
+        _token_cache.popitem(last=False)
+
+def invalidate_user(username: str):
+    for token in [token for token, (user, _) in _token_cache.items() if user.username == username]:
+        _token_cache.pop(token, None)
+
+async def set_user_disabled(username: str, disabled: bool):
+    await set_sysadmin_disabled(username, disabled)
+    invalidate_user(username)
+
 # Dependency для извлечения токена из cookie
 async def get_token(request: Request):
     return request.cookies.get("access_token")
@@ -64,6 +96,10 @@ async def get_current_user(token: Optional[str] = Depends(get_token)):
         if token is None:
             return None
 
+        cached_user = _get_cached_user(token)
+        if cached_user is not None:
+            return cached_user
+
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
         if username is None:
@@ -71,10 +107,12 @@ async def get_current_user(token: Optional[str] = Depends(get_token)):
 
         # Проверяем существование пользователя в БД
         user_data = await get_credentials_from_db(username)
-        if not user_data:
+        if not user_data or user_data["disabled"]:
             return None
 
-        return User(username=username)
+        user = User(username=username)
+        _cache_user(token, user, payload["exp"])
+        return user
     except JWTError:
         return None
 
@@ -82,4 +120,10 @@ async def get_current_user(token: Optional[str] = Depends(get_token)):
 async def get_current_active_user(current_user: User = Depends(get_current_user)):
     if current_user.disabled:
         raise HTTPException(status_code=400, detail="Inactive user")
-    return current_user
\ No newline at end of file
+    return current_user
+
+
+async def get_api_user(current_user: Optional[User] = Depends(get_current_user)):
+    if current_user is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
+    return current_user
@@ -0,0 +1,85 @@
+# Конкурентная нагрузка на дашборд и API в процессе (ASGI без сети), пока поллер работает в фоне:
+#   python -m benchmarks.bench_api [--clients 1000] [--requests 500] [--concurrency 32] [--output api.json]
+import argparse
+import asyncio
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.common import report, measure, summarize
+from benchmarks.environment import BenchEnvironment
+
+ENDPOINTS = (
+    "/",
+    "/api/dashboard",
+    "/api/users",
+    "/api/status",
+    "/api/connections?limit=50",
+    "/api/connections?limit=50&state=closed",
+    "/api/traffic/top",
+    "/api/traffic/series",
+    "/api/certificates",
+    "/metrics",
+)
+
+
+async def poll_in_background(env, interval, latencies, stop):
+    while not stop.is_set():
+        env.advance(churn=0.01)
+        started = time.perf_counter()
+        await env.main.update_connections()
+        latencies.append(time.perf_counter() - started)
+        try:
+            await asyncio.wait_for(stop.wait(), interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run(args):
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        env = await BenchEnvironment(tmp, args.clients, args.history_days).start()
+        try:
+            token = await env.create_admin()
+            await env.main.update_connections()
+            transport = httpx.ASGITransport(app=env.main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench",
+                                         cookies={"access_token": token}) as client:
+                stop = asyncio.Event()
+                poll_latencies = []
+                poller = asyncio.create_task(poll_in_background(env, args.poll_interval, poll_latencies, stop))
+
+                async def request(path):
+                    response = await client.get(path)
+                    if response.status_code != 200:
+                        raise RuntimeError(f"{path} returned {response.status_code}")
+
+                for path in ENDPOINTS:
+                    results.append(await measure(f"api{path}", lambda i, path=path: request(path), args.requests,
+                                                 args.concurrency, clients=args.clients))
+                # Смешанная нагрузка: все эндпоинты одновременно
+                results.append(await measure("api/mixed", lambda i: request(ENDPOINTS[i % len(ENDPOINTS)]),
+                                             args.requests * 2, args.concurrency, clients=args.clients))
+                stop.set()
+                await poller
+                results.append(summarize("poll/under-load", poll_latencies, clients=args.clients))
+        finally:
+            await env.stop()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--history-days", type=int, default=7)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--poll-interval", type=float, default=0.5)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+    report("api", args, asyncio.run(run(args)), args.output)
+
+
+if __name__ == "__main__":
+    main()
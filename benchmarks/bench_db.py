@@ -0,0 +1,65 @@
+# Сравнение пула соединений db.py с прежним подключением на каждый вызов:
+#   python -m benchmarks.bench_db [--ops 2000] [--concurrency 16] [--output db.json]
+import argparse
+import asyncio
+import os
+import tempfile
+
+import aiosqlite
+
+import db
+from benchmarks.common import measure, report
+
+
+async def legacy_credentials(username):
+    async with aiosqlite.connect(db.DB_PATH) as conn:
+        conn.row_factory = aiosqlite.Row
+        async with conn.execute("SELECT username, password, disabled FROM sysadmin WHERE username = ?", (username,)) as cursor:
+            row = await cursor.fetchone()
+            return dict(row) if row else None
+
+
+async def legacy_traffic(session_id, value):
+    async with aiosqlite.connect(db.DB_PATH) as conn:
+        await conn.execute(
+            "UPDATE connections SET bytes_received = ?, bytes_sent = ?, counter_received = ?, counter_sent = ?, "
+            "last_updated = ?, client_id = ? WHERE id = ?",
+            (value, value, value, value, 1735689600, session_id, session_id)
+        )
+        await conn.commit()
+
+
+async def pooled_traffic(session_id, value):
+    await db.apply_connection_changes([(value, value, value, value, 1735689600, session_id, session_id)], [], [])
+
+
+async def run(ops, concurrency):
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, "bench.db")
+        await db.init_db()
+        await db.apply_connection_changes([], [(f"user{i}", 1735689600, 0, 0, 1735689600, "default", i + 1) for i in range(100)], [])
+        async with db.writer() as conn:
+            await conn.execute("INSERT INTO sysadmin (username, password, disabled) VALUES ('admin', 'x', 0)")
+            await conn.commit()
+
+        results = [
+            await measure("credentials/per-call-connect", lambda i: legacy_credentials("admin"), ops, concurrency),
+            await measure("credentials/pool", lambda i: db.get_credentials_from_db("admin"), ops, concurrency),
+            await measure("traffic/per-call-connect", lambda i: legacy_traffic(i % 100 + 1, i), ops, concurrency),
+            await measure("traffic/pool", lambda i: pooled_traffic(i % 100 + 1, i), ops, concurrency),
+        ]
+        await db.close_db()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ops", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+    report("db", args, asyncio.run(run(args.ops, args.concurrency)), args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# Переизбрание поллера при падении лидера: несколько процессов-воркеров борются за блокировку,
+# лидер убивается SIGKILL, замеряется время до избрания следующего:
+#   python -m benchmarks.bench_failover [--workers 4] [--rounds 10] [--poll-interval 5] [--output failover.json]
+# Код возврата 1, если хотя бы одно переизбрание дольше интервала опроса
+import argparse
+import asyncio
+import os
+import selectors
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.common import ROOT, report, summarize
+from leader import LeaderElection
+
+
+def worker(path, retry_interval):
+    # Отдельный интерпретатор, как воркер uvicorn; лидер держит блокировку до смерти процесса
+    election = LeaderElection(path, retry_interval)
+    asyncio.run(election.wait_for_leadership())
+    print(time.time(), flush=True)
+    signal.pause()
+
+
+def run(args):
+    takeovers = []
+    selector = selectors.DefaultSelector()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "poller.lock")
+        command = [sys.executable, "-m", "benchmarks.bench_failover", "--worker", path,
+                   "--retry-interval", str(args.retry_interval)]
+
+        def spawn():
+            process = subprocess.Popen(command, cwd=ROOT, stdout=subprocess.PIPE, text=True)
+            selector.register(process.stdout, selectors.EVENT_READ, process)
+
+        def wait_leader(timeout):
+            events = selector.select(timeout)
+            if not events:
+                raise RuntimeError(f"No leader elected within {timeout}s")
+            process = events[0][0].data
+            return process, float(process.stdout.readline())
+
+        try:
+            for _ in range(args.workers):
+                spawn()
+            leader, _ = wait_leader(10)
+            for _ in range(args.rounds):
+                killed_at = time.time()
+                leader.kill()
+                leader.wait()
+                selector.unregister(leader.stdout)
+                leader.stdout.close()
+                leader, elected_at = wait_leader(args.poll_interval * 4)
+                takeovers.append(elected_at - killed_at)
+                # Вместо убитого воркера uvicorn поднимает новый
+                spawn()
+        finally:
+            for key in list(selector.get_map().values()):
+                key.data.kill()
+                key.data.wait()
+                key.data.stdout.close()
+    return takeovers
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--retry-interval", type=float, default=1.0)
+    parser.add_argument("--poll-interval", type=float, default=5.0)
+    parser.add_argument("--output")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        worker(args.worker, args.retry_interval)
+        return
+
+    takeovers = run(args)
+    report("failover", args, [summarize("leader/takeover", takeovers, workers=args.workers)], args.output)
+    slow = [t for t in takeovers if t > args.poll_interval]
+    if slow:
+        print(f"{len(slow)} of {len(takeovers)} takeovers took longer than {args.poll_interval}s", file=sys.stderr)
+    sys.exit(1 if slow else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# Разбор файла статуса и чтение лога событий на синтетических данных:
+#   python -m benchmarks.bench_parse [--clients 100 1000 10000] [--event-log-mb 256] [--output parse.json]
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks import generators
+from benchmarks.common import report, summarize, time_sync, quiet_logging
+from eventlog import EventLogTailer
+from inventory import CertificateInventory
+from sources import parse_status_file
+
+
+def bench_status(tmp, clients, repeat):
+    path = os.path.join(tmp, f"status-{clients}.log")
+    generators.write_status(path, clients)
+    return time_sync("status/parse", lambda: parse_status_file(path), repeat, clients=clients,
+                     file_bytes=os.path.getsize(path))
+
+
+def bench_index(tmp, certs, repeat):
+    path = os.path.join(tmp, f"index-{certs}.txt")
+    generators.write_index(path, certs)
+    inventory = CertificateInventory(path)
+    return time_sync("index/load", inventory._load, repeat, certs=certs)
+
+
+def bench_event_log(tmp, size_mb, clients, repeat):
+    path = os.path.join(tmp, "openvpn.log")
+    generators.write_event_log(path, size_mb * generators.MIB, clients)
+    results = []
+
+    # Первое чтение: хвост лога (INITIAL_BACKLOG) целиком
+    def cold():
+        tailer = EventLogTailer(path)
+        tailer.poll()
+        tailer._close()
+    results.append(time_sync("eventlog/cold-start", cold, repeat, file_mb=size_mb))
+
+    # Цикл поллера: дочитывание того, что дописано с прошлого раза (запись в замер не входит)
+    tailer = EventLogTailer(path)
+    tailer.poll()
+    latencies = []
+    start = generators.BASE_TIME + 86400
+    for i in range(repeat):
+        generators.write_event_log(path, 64 * 1024, clients, i, start + i * 60, mode="a")
+        started = time.perf_counter()
+        tailer.poll()
+        latencies.append(time.perf_counter() - started)
+    results.append(summarize("eventlog/incremental-64k", latencies, file_mb=size_mb))
+    tailer._close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--event-log-mb", type=int, default=64)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+    quiet_logging()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for clients in args.clients:
+            results.append(bench_status(tmp, clients, args.repeat))
+            results.append(bench_index(tmp, clients, args.repeat))
+        results.extend(bench_event_log(tmp, args.event_log_mb, max(args.clients), args.repeat))
+    report("parse", args, results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+# Полный цикл поллера (update_connections) в процессе при разном числе клиентов:
+#   python -m benchmarks.bench_poll [--clients 100 1000 10000] [--cycles 50] [--history-days 30] [--output poll.json]
+import argparse
+import asyncio
+import os
+import tempfile
+
+from benchmarks.common import report, summarize
+from benchmarks.environment import BenchEnvironment
+
+STAGES = ("parse_ms", "reconcile_ms", "commit_ms", "export_ms")
+# Сценарии: неизменный файл, рост счётчиков у всех клиентов, переподключение 10% клиентов за цикл
+SCENARIOS = (("idle", None), ("steady", 0.0), ("churn", 0.1))
+
+
+async def bench_clients(tmp, clients, cycles, history_days):
+    env = await BenchEnvironment(os.path.join(tmp, str(clients)), clients, history_days).start()
+    results = []
+    try:
+        # Первый цикл открывает сессии всех клиентов
+        await env.main.update_connections()
+        for name, churn in SCENARIOS:
+            latencies = []
+            stages = {stage: 0.0 for stage in STAGES}
+            for _ in range(cycles):
+                if churn is not None:
+                    env.advance(churn=churn)
+                timings = await env.main.update_connections()
+                latencies.append(timings["total_ms"] / 1000)
+                for stage in STAGES:
+                    stages[stage] += timings[stage]
+            result = summarize(f"poll/{name}", latencies, clients=clients, history_days=history_days)
+            result.update({f"mean_{stage}": round(total / cycles, 3) for stage, total in stages.items()})
+            results.append(result)
+    finally:
+        await env.stop()
+    return results
+
+
+async def run(args):
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for clients in args.clients:
+            results.extend(await bench_clients(tmp, clients, args.cycles, args.history_days))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--cycles", type=int, default=50)
+    parser.add_argument("--history-days", type=int, default=0)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+    report("poll", args, asyncio.run(run(args)), args.output)
+
+
+if __name__ == "__main__":
+    main()
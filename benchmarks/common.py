@@ -0,0 +1,98 @@
+import asyncio
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def quiet_logging():
+    # Логи поллера на каждом цикле искажают замеры
+    logging.getLogger().setLevel(logging.WARNING)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(len(sorted_values) * fraction)) - 1))
+    return sorted_values[index]
+
+
+def summarize(name, latencies, elapsed=None, **params):
+    latencies = sorted(latencies)
+    result = {
+        "name": name,
+        **params,
+        "ops": len(latencies),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else None,
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 3) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3) if latencies else None,
+        "max_ms": round(latencies[-1] * 1000, 3) if latencies else None,
+    }
+    if elapsed:
+        result["ops_per_sec"] = round(len(latencies) / elapsed, 1)
+    return result
+
+
+def time_sync(name, func, repeat, **params):
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - started)
+    return summarize(name, latencies, **params)
+
+
+async def time_async(name, func, repeat, **params):
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await func()
+        latencies.append(time.perf_counter() - started)
+    return summarize(name, latencies, **params)
+
+
+async def measure(name, func, ops, concurrency, **params):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i):
+        async with semaphore:
+            started = time.perf_counter()
+            await func(i)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(ops)))
+    return summarize(name, latencies, time.perf_counter() - started, concurrency=concurrency, **params)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def report(benchmark, args, results, output=None):
+    # Результаты одного запуска: сравниваются между коммитами через benchmarks.compare
+    document = {
+        "benchmark": benchmark,
+        "commit": git_commit(),
+        "created_at": int(time.time()),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "params": vars(args),
+        "results": results,
+    }
+    text = json.dumps(document, indent=2)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+    return document
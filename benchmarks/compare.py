@@ -0,0 +1,58 @@
+# Сравнение двух JSON-отчётов бенчмарков (например, до и после коммита):
+#   python -m benchmarks.compare base.json new.json [--threshold 10]
+# Код возврата 1, если хотя бы одна метрика ухудшилась больше порога
+import argparse
+import json
+import sys
+
+# Для *_ms меньше - лучше, для ops_per_sec - больше
+COMPARED = ("p50_ms", "p99_ms", "mean_ms", "ops_per_sec")
+PARAM_KEYS = ("clients", "certs", "file_mb", "history_days", "concurrency")
+
+
+def result_key(result):
+    return (result["name"],) + tuple(result.get(key) for key in PARAM_KEYS)
+
+
+def compare(base, new, threshold):
+    base_results = {result_key(r): r for r in base["results"]}
+    rows = []
+    regressions = 0
+    for result in new["results"]:
+        previous = base_results.get(result_key(result))
+        if previous is None:
+            continue
+        for metric in COMPARED:
+            before, after = previous.get(metric), result.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before * 100
+            worse = -change if metric == "ops_per_sec" else change
+            regressed = worse > threshold
+            regressions += regressed
+            rows.append((result_key(result), metric, before, after, change, regressed))
+    return rows, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("base")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=10.0, help="допустимое ухудшение, %%")
+    args = parser.parse_args()
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+
+    rows, regressions = compare(base, new, args.threshold)
+    print(f"{base.get('commit')} -> {new.get('commit')} ({base['benchmark']})")
+    for key, metric, before, after, change, regressed in rows:
+        params = ", ".join(f"{k}={v}" for k, v in zip(PARAM_KEYS, key[1:]) if v is not None)
+        mark = "REGRESSION" if regressed else ""
+        print(f"{key[0]:<45} {params:<30} {metric:<12} {before:>12} {after:>12} {change:>+8.1f}% {mark}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import importlib
+import json
+import os
+import random
+import sys
+
+from benchmarks import generators
+from benchmarks.common import ROOT, quiet_logging
+
+
+class BenchEnvironment:
+    # Приложение в процессе бенчмарка: временная база, сгенерированные файл статуса, лог событий и index.txt.
+    # main импортируется после настройки окружения, так как читает SERVERS_CONFIG при импорте
+    def __init__(self, workdir, clients, history_days=0, event_log_mb=1, certs=None, seed=0):
+        self.workdir = workdir
+        os.makedirs(workdir, exist_ok=True)
+        self.clients = clients
+        self.rng = random.Random(seed)
+        self.now = generators.BASE_TIME
+        self.status_path = os.path.join(workdir, "server.log")
+        self.event_log_path = os.path.join(workdir, "openvpn.log")
+        self.index_path = os.path.join(workdir, "index.txt")
+        self.db_path = os.path.join(workdir, "connections.db")
+        self.history_days = history_days
+        self.entries = generators.write_status(self.status_path, clients, seed, self.now)
+        self.next_name = clients
+        generators.write_event_log(self.event_log_path, event_log_mb * generators.MIB, max(clients, 1), seed, self.now - 86400)
+        generators.write_index(self.index_path, certs if certs is not None else clients, seed, self.now)
+        self.main = None
+        self.db = None
+
+    async def start(self):
+        config = os.path.join(self.workdir, "servers.json")
+        with open(config, "w") as f:
+            json.dump([{"id": "default", "status_path": self.status_path, "event_log_path": self.event_log_path}], f)
+        os.environ["SERVERS_CONFIG"] = config
+        if ROOT not in sys.path:
+            sys.path.insert(0, ROOT)
+        # main ищет templates/ и static/ относительно рабочего каталога
+        for name in ("templates", "static"):
+            if not os.path.exists(os.path.join(self.workdir, name)):
+                os.symlink(os.path.join(ROOT, name), os.path.join(self.workdir, name))
+        os.chdir(self.workdir)
+
+        self.db = importlib.import_module("db")
+        self.db.DB_PATH = self.db_path
+        await self.db.init_db()
+        if self.history_days:
+            await self.db.close_db()
+            generators.populate_history(self.db_path, self.clients, self.history_days, now=self.now)
+        # Для каждого размера main перезагружается, чтобы источники собрались из нового SERVERS_CONFIG
+        os.environ["LOG_FILE"] = os.path.join(self.workdir, "app.log")
+        os.environ["LEADER_LOCK"] = os.path.join(self.workdir, "poller.lock")
+        self.main = importlib.reload(sys.modules["main"]) if "main" in sys.modules else importlib.import_module("main")
+        quiet_logging()
+        inventory = importlib.import_module("inventory")
+        self.main.cert_inventory = inventory.CertificateInventory(self.index_path)
+        await self.db.open_db()
+        return self
+
+    async def stop(self):
+        if self.db is not None:
+            await self.db.close_db()
+
+    async def create_admin(self, username="bench"):
+        async with self.db.writer() as conn:
+            await conn.execute("INSERT OR IGNORE INTO sysadmin (username, password, disabled) VALUES (?, 'x', 0)", (username,))
+            await conn.commit()
+        auth = importlib.import_module("auth")
+        return auth.create_access_token({"sub": username})
+
+    def advance(self, seconds=5, churn=0.0):
+        # Следующее состояние файла статуса: счётчики растут, доля клиентов churn переподключается
+        self.now += seconds
+        for entry in self.entries:
+            entry["bytes_received"] += self.rng.randint(0, 4 * generators.MIB)
+            entry["bytes_sent"] += self.rng.randint(0, 16 * generators.MIB)
+        for _ in range(int(len(self.entries) * churn)):
+            i = self.rng.randrange(len(self.entries))
+            entry = dict(self.entries[i])
+            entry.update(common_name=generators.client_name(self.next_name), connected_at=self.now,
+                         bytes_received=0, bytes_sent=0, client_id=self.next_name)
+            self.entries[i] = entry
+            self.next_name += 1
+        generators.write_status(self.status_path, self.entries, now=self.now)
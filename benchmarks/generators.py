@@ -0,0 +1,220 @@
+# Синтетические данные OpenVPN для бенчмарков. Генераторы детерминированы (seed) и пишут потоково,
+# поэтому лог событий может быть размером в гигабайты:
+#   python -m benchmarks.generators status /tmp/server.log --clients 10000
+#   python -m benchmarks.generators events /tmp/openvpn.log --size-mb 2048
+#   python -m benchmarks.generators index /tmp/index.txt --certs 10000
+#   python -m benchmarks.generators history /tmp/connections.db --clients 1000 --days 30
+import argparse
+import asyncio
+import random
+import sqlite3
+import time
+from datetime import datetime
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+BASE_TIME = 1735689600  # 2025-01-01 00:00:00 UTC
+MIB = 1024 * 1024
+
+
+def client_name(i):
+    return f"user{i:05d}"
+
+
+def _address(rng):
+    return f"{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}:{rng.randint(1024, 65535)}"
+
+
+def _virtual(i):
+    return f"10.{8 + i // 65536}.{i // 256 % 256}.{i % 256}"
+
+
+def status_clients(clients, seed=0, now=BASE_TIME, names=None):
+    rng = random.Random(seed)
+    names = names if names is not None else [client_name(i) for i in range(clients)]
+    result = []
+    for i, name in enumerate(names):
+        connected = now - rng.randint(60, 7 * 86400)
+        result.append({
+            "common_name": name,
+            "real_address": _address(rng),
+            "virtual_address": _virtual(i + 2),
+            "bytes_received": rng.randint(0, 4096) * MIB + rng.randint(0, MIB),
+            "bytes_sent": rng.randint(0, 16384) * MIB + rng.randint(0, MIB),
+            "connected_at": connected,
+            "client_id": i,
+        })
+    return result
+
+
+def write_status(path, clients, seed=0, now=BASE_TIME, names=None):
+    # Формат --status-version 2: CLIENT_LIST, ROUTING_TABLE и GLOBAL_STATS
+    entries = clients if isinstance(clients, list) else status_clients(clients, seed, now, names)
+    updated = datetime.fromtimestamp(now).strftime(TIME_FORMAT)
+    with open(path, "w") as f:
+        f.write("TITLE,OpenVPN 2.6.12 x86_64-pc-linux-gnu [SSL (OpenSSL)] [LZO] [LZ4] [EPOLL] [MH/PKTINFO] [AEAD]\n")
+        f.write(f"TIME,{updated},{now}\n")
+        f.write("HEADER,CLIENT_LIST,Common Name,Real Address,Virtual Address,Virtual IPv6 Address,Bytes Received,"
+                "Bytes Sent,Connected Since,Connected Since (time_t),Username,Client ID,Peer ID,Data Channel Cipher\n")
+        for c in entries:
+            connected = datetime.fromtimestamp(c["connected_at"]).strftime(TIME_FORMAT)
+            f.write(f"CLIENT_LIST,{c['common_name']},{c['real_address']},{c['virtual_address']},,{c['bytes_received']},"
+                    f"{c['bytes_sent']},{connected},{c['connected_at']},UNDEF,{c['client_id']},{c['client_id']},AES-256-GCM\n")
+        f.write("HEADER,ROUTING_TABLE,Virtual Address,Common Name,Real Address,Last Ref,Last Ref (time_t)\n")
+        for c in entries:
+            f.write(f"ROUTING_TABLE,{c['virtual_address']},{c['common_name']},{c['real_address']},{updated},{now}\n")
+        f.write("GLOBAL_STATS,Max bcast/mcast queue length,0\n")
+        f.write("END\n")
+    return entries
+
+
+NOISE_MESSAGES = (
+    "MULTI: Learn: {virtual} -> {cn}/{address}",
+    "MULTI_sva: pool returned IPv4={virtual}, IPv6=(Not enabled)",
+    "SENT CONTROL [{cn}]: 'PUSH_REPLY,route-gateway 10.8.0.1,topology subnet,ping 10,ping-restart 120' (status=1)",
+    "PUSH: Received control message: 'PUSH_REQUEST'",
+    "Data Channel: using negotiated cipher 'AES-256-GCM'",
+    "Outgoing Data Channel: Cipher 'AES-256-GCM' initialized with 256 bit key",
+    "Control Channel: TLSv1.3, cipher TLSv1.3 TLS_AES_256_GCM_SHA384, peer certificate: 2048 bit RSA",
+)
+DISCONNECT_MESSAGES = (
+    "Inactivity timeout (--ping-restart), restarting",
+    "SIGTERM[soft,remote-exit] received, client-instance exiting",
+    "SIGUSR1[soft,connection-reset] received, client-instance restarting",
+    "Connection reset, restarting [0]",
+    "TLS Error: TLS handshake failed",
+)
+
+
+def event_lines(clients, seed=0, start=BASE_TIME, disconnect_ratio=0.05):
+    # Бесконечный поток строк лога: в основном служебные сообщения, часть - отключения клиентов
+    rng = random.Random(seed)
+    now = start
+    while True:
+        now += rng.random() * 0.5
+        i = rng.randrange(clients)
+        cn = client_name(i)
+        stamp = datetime.fromtimestamp(int(now)).strftime(TIME_FORMAT)
+        prefix = f"{stamp} us={rng.randint(0, 999999)} {cn}/{_address(rng)}"
+        if rng.random() < disconnect_ratio:
+            yield f"{prefix} [{cn}] {rng.choice(DISCONNECT_MESSAGES)}\n"
+        else:
+            message = rng.choice(NOISE_MESSAGES).format(virtual=_virtual(i + 2), cn=cn, address=_address(rng))
+            yield f"{prefix} {message}\n"
+
+
+def write_event_log(path, size_bytes, clients=1000, seed=0, start=BASE_TIME, mode="w"):
+    written = 0
+    block = []
+    block_size = 0
+    with open(path, mode) as f:
+        for line in event_lines(clients, seed, start):
+            block.append(line)
+            block_size += len(line)
+            if block_size >= min(MIB, size_bytes - written):
+                f.write("".join(block))
+                written += block_size
+                block, block_size = [], 0
+                if written >= size_bytes:
+                    break
+        if block:
+            f.write("".join(block))
+            written += block_size
+    return written
+
+
+def _asn1(epoch):
+    return time.strftime("%y%m%d%H%M%SZ", time.gmtime(epoch))
+
+
+def write_index(path, certs, seed=0, now=BASE_TIME, revoked_ratio=0.1):
+    # index.txt easy-rsa: статус, срок действия, дата отзыва, серийный номер, файл, DN
+    rng = random.Random(seed)
+    with open(path, "w") as f:
+        for i in range(certs):
+            expires = now + rng.randint(-30, 3 * 365) * 86400
+            serial = f"{i + 1:032X}"
+            dn = f"/C=RU/ST=MSK/L=Moscow/O=Example/OU=VPN/CN={client_name(i)}/emailAddress={client_name(i)}@example.com"
+            if rng.random() < revoked_ratio:
+                f.write(f"R\t{_asn1(expires)}\t{_asn1(now - rng.randint(1, 365) * 86400)},keyCompromise\t{serial}\tunknown\t{dn}\n")
+            else:
+                status = "V" if expires > now else "E"
+                f.write(f"{status}\t{_asn1(expires)}\t\t{serial}\tunknown\t{dn}\n")
+        f.write(f"V\t{_asn1(now + 3650 * 86400)}\t\t{certs + 1:032X}\tunknown\t/CN=server\n")
+
+
+def populate_history(path, clients, days, sessions_per_day=4, seed=0, now=BASE_TIME, server_id="default"):
+    # Заполняет уже мигрированную базу (db.init_db) закрытыми сессиями и корзинами трафика
+    rng = random.Random(seed)
+    start = now - days * 86400
+    conn = sqlite3.connect(path)
+    try:
+        sessions = []
+        for i in range(clients):
+            cn = client_name(i)
+            at = start
+            for _ in range(days * sessions_per_day):
+                at += rng.randint(60, 2 * 86400 // sessions_per_day)
+                if at >= now:
+                    break
+                duration = rng.randint(60, 86400 // sessions_per_day)
+                received = rng.randint(0, 512) * MIB
+                sent = rng.randint(0, 2048) * MIB
+                sessions.append((server_id, cn, at, at + duration, duration // 60,
+                                 received, sent, at + duration))
+                at += duration
+            if len(sessions) >= 100000:
+                conn.executemany(
+                    "INSERT INTO connections (server_id, common_name, connected_at, disconnected_at, duration_minutes, "
+                    "bytes_received, bytes_sent, last_updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", sessions)
+                sessions = []
+        conn.executemany(
+            "INSERT INTO connections (server_id, common_name, connected_at, disconnected_at, duration_minutes, "
+            "bytes_received, bytes_sent, last_updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", sessions)
+
+        for table, size, retention in (("traffic_1h", 3600, 90 * 86400), ("traffic_1d", 86400, 3 * 365 * 86400)):
+            first = max(start, now - retention) // size * size
+            rows = []
+            for bucket in range(first, now, size):
+                for i in rng.sample(range(clients), max(1, clients // 4)):
+                    rows.append((bucket, client_name(i), rng.randint(0, 64 * MIB), rng.randint(0, 256 * MIB)))
+                if len(rows) >= 100000:
+                    conn.executemany(f"INSERT OR IGNORE INTO {table} VALUES (?, ?, ?, ?)", rows)
+                    rows = []
+            conn.executemany(f"INSERT OR IGNORE INTO {table} VALUES (?, ?, ?, ?)", rows)
+        conn.commit()
+        return conn.execute("SELECT COUNT(*) FROM connections").fetchone()[0]
+    finally:
+        conn.close()
+
+
+async def create_history_db(path, clients, days, seed=0, now=BASE_TIME):
+    import db
+    db.DB_PATH = path
+    await db.init_db()
+    await db.close_db()
+    return populate_history(path, clients, days, seed=seed, now=now)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("kind", choices=("status", "events", "index", "history"))
+    parser.add_argument("path")
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--size-mb", type=int, default=100)
+    parser.add_argument("--certs", type=int, default=1000)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.kind == "status":
+        write_status(args.path, args.clients, args.seed)
+    elif args.kind == "events":
+        write_event_log(args.path, args.size_mb * MIB, args.clients, args.seed)
+    elif args.kind == "index":
+        write_index(args.path, args.certs, args.seed)
+    else:
+        print(f"{asyncio.run(create_history_db(args.path, args.clients, args.days, args.seed))} sessions")
+
+
+if __name__ == "__main__":
+    main()
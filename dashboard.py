@@ -0,0 +1,89 @@
+import hashlib
+import json
+import os
+import logging
+
+from fastapi import Request
+from fastapi.responses import Response
+from fastapi.staticfiles import StaticFiles
+
+logger = logging.getLogger(__name__)
+
+STATIC_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Ответ можно сохранить, но перед использованием браузер обязан перепроверить его по ETag
+REVALIDATE_CACHE_CONTROL = "private, no-cache"
+
+
+def client_label(client):
+    # Совпадает с clientLabel в static/dashboard.js
+    if client["server_id"] == "default":
+        return client["common_name"]
+    return f"{client['common_name']} ({client['server_id']})"
+
+
+def content_etag(body):
+    return f'"{hashlib.sha1(body).hexdigest()[:20]}"'
+
+
+def etag_matches(request: Request, etag):
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    return header.strip() == "*" or etag in (tag.strip().removeprefix("W/") for tag in header.split(","))
+
+
+def cached_response(request: Request, body, etag, media_type):
+    headers = {"ETag": etag, "Cache-Control": REVALIDATE_CACHE_CONTROL}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
+class DashboardData:
+    # Данные дашборда собираются один раз за цикл поллера, а не на каждый запрос: пока версии снимков серверов
+    # не изменились, тело и ETag не пересчитываются. ETag - хеш содержимого, поэтому у всех воркеров uvicorn
+    # с одними и теми же снимками он совпадает, и 304 вернёт любой из них
+    def __init__(self):
+        self.key = None
+        self.etag = None
+        self.body = b""
+
+    def update(self, snapshots):
+        key = tuple((server_id, snapshot.version) for server_id, snapshot in snapshots.items())
+        if key == self.key:
+            return False
+        stats = [dict(client) for snapshot in snapshots.values() for client in snapshot.stats]
+        payload = {
+            "clients": len(stats),
+            "stats": stats,
+            "chart": {
+                "labels": [client_label(c) for c in stats],
+                "bytes_received": [c["bytes_received"] for c in stats],
+                "bytes_sent": [c["bytes_sent"] for c in stats],
+            },
+        }
+        self.body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode()
+        self.etag = content_etag(self.body)
+        self.key = key
+        return True
+
+    def response(self, request: Request):
+        return cached_response(request, self.body, self.etag, "application/json")
+
+
+class CachedStaticFiles(StaticFiles):
+    # Ссылки на статику содержат хеш содержимого (?v=...), поэтому файлы можно кешировать надолго
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = STATIC_CACHE_CONTROL
+        return response
+
+
+def asset_versions(directory):
+    versions = {}
+    for name in sorted(os.listdir(directory)) if os.path.isdir(directory) else ():
+        path = os.path.join(directory, name)
+        if os.path.isfile(path):
+            with open(path, "rb") as f:
+                versions[name] = hashlib.sha1(f.read()).hexdigest()[:10]
+    return versions
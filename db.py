@@ -1,20 +1,97 @@
 import os
+import asyncio
+from contextlib import asynccontextmanager
 
 import aiosqlite
 import logging
 
-from security import get_password_hash
+from security import get_password_hash_async
+from metrics import db_timed
 
 DB_PATH = "/app/db/connections.db"
+AUTO_VACUUM_INCREMENTAL = 2
 logger = logging.getLogger(__name__)
 
+READ_POOL_SIZE = 4
+EXPORT_BATCH_SIZE = 1000
+CACHED_STATEMENTS = 256
+PRAGMAS = (
+    # Новая база создаётся сразу в режиме incremental; у существующей режим меняет только VACUUM
+    f"PRAGMA auto_vacuum={AUTO_VACUUM_INCREMENTAL}",
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+)
+
+# Одно соединение на запись (сериализуется блокировкой) и небольшой пул соединений на чтение
+_writer = None
+_write_lock = asyncio.Lock()
+_readers = None
+_start_lock = asyncio.Lock()
+
+
+async def _connect(read_only=False):
+    db = await aiosqlite.connect(DB_PATH, cached_statements=CACHED_STATEMENTS)
+    db.row_factory = aiosqlite.Row
+    for pragma in PRAGMAS:
+        await db.execute(pragma)
+    if read_only:
+        await db.execute("PRAGMA query_only=ON")
+    return db
+
+async def open_db():
+    global _writer, _readers
+    async with _start_lock:
+        if _writer is not None:
+            return
+        _writer = await _connect()
+        _readers = asyncio.Queue()
+        for _ in range(READ_POOL_SIZE):
+            _readers.put_nowait(await _connect(read_only=True))
+        logger.info(f"Opened database pool at {DB_PATH}: 1 writer, {READ_POOL_SIZE} readers")
+
+async def close_db():
+    global _writer, _readers
+    async with _start_lock:
+        if _writer is None:
+            return
+        while not _readers.empty():
+            await _readers.get_nowait().close()
+        await _writer.close()
+        _writer = None
+        _readers = None
+
+@asynccontextmanager
+async def writer():
+    if _writer is None:
+        await open_db()
+    async with _write_lock:
+        try:
+            yield _writer
+        except Exception:
+            await _writer.rollback()
+            raise
+
+@asynccontextmanager
+async def reader():
+    if _readers is None:
+        await open_db()
+    readers = _readers
+    db = await readers.get()
+    try:
+        yield db
+    finally:
+        readers.put_nowait(db)
+
 
 async def init_admin_user():
     try:
         admin_username = os.environ.get("ADMIN_USERNAME")
-        admin_password = get_password_hash(os.environ.get("ADMIN_PASSWORD"))
+        admin_password = await get_password_hash_async(os.environ.get("ADMIN_PASSWORD"))
 
-        async with aiosqlite.connect(DB_PATH) as db:
+        async with writer() as db:
             # Проверяем, существует ли администратор
             cursor = await db.execute(
                 "SELECT username FROM sysadmin WHERE username = ?",
@@ -32,90 +109,815 @@ async def init_admin_user():
     except Exception as e:
         logger.error(f"Error initializing admin user: {e}")
 
+BASE_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS connections (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        common_name TEXT NOT NULL,
+        connected_at TEXT NOT NULL,
+        disconnected_at TEXT,
+        duration_minutes INTEGER,
+        bytes_received REAL,
+        bytes_sent REAL,
+        last_updated TEXT
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS users (
+        common_name TEXT PRIMARY KEY,
+        email TEXT,
+        description TEXT
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS sysadmin (
+        username TEXT PRIMARY KEY,
+        password TEXT,
+        disabled BOOLEAN NOT NULL DEFAULT FALSE
+    )
+    ''',
+]
+
+# Строки "%Y-%m-%d %H:%M:%S" записывались в локальном времени, модификатор 'utc' переводит их в epoch
+EPOCH_TIMESTAMPS = [
+    '''
+    CREATE TABLE connections_new (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        common_name TEXT NOT NULL,
+        connected_at INTEGER NOT NULL,
+        disconnected_at INTEGER,
+        duration_minutes INTEGER,
+        bytes_received REAL,
+        bytes_sent REAL,
+        last_updated INTEGER
+    )
+    ''',
+    '''
+    INSERT INTO connections_new (id, common_name, connected_at, disconnected_at, duration_minutes, bytes_received, bytes_sent, last_updated)
+    SELECT id, common_name,
+           CAST(strftime('%s', connected_at, 'utc') AS INTEGER),
+           CAST(strftime('%s', disconnected_at, 'utc') AS INTEGER),
+           duration_minutes, bytes_received, bytes_sent,
+           CAST(strftime('%s', last_updated, 'utc') AS INTEGER)
+    FROM connections
+    ''',
+    "DROP TABLE connections",
+    "ALTER TABLE connections_new RENAME TO connections",
+]
+
+CONNECTION_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_connections_open ON connections (common_name) WHERE disconnected_at IS NULL",
+    "CREATE INDEX IF NOT EXISTS idx_connections_cn_connected ON connections (common_name, connected_at)",
+    "CREATE INDEX IF NOT EXISTS idx_connections_last_updated ON connections (last_updated)",
+]
+
+# Разрешения хранилища трафика: таблица, размер корзины и срок хранения в секундах
+TRAFFIC_RESOLUTIONS = (
+    ("traffic_1m", 60, 2 * 86400),
+    ("traffic_1h", 3600, 90 * 86400),
+    ("traffic_1d", 86400, 3 * 365 * 86400),
+)
+
+TRAFFIC_TABLES = [
+    statement
+    for table, _, _ in TRAFFIC_RESOLUTIONS
+    for statement in (
+        f'''
+        CREATE TABLE IF NOT EXISTS {table} (
+            bucket INTEGER NOT NULL,
+            common_name TEXT NOT NULL,
+            bytes_received INTEGER NOT NULL DEFAULT 0,
+            bytes_sent INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (bucket, common_name)
+        ) WITHOUT ROWID
+        ''',
+        f"CREATE INDEX IF NOT EXISTS idx_{table}_cn_bucket ON {table} (common_name, bucket)",
+    )
+]
+
+# Сессии нескольких экземпляров OpenVPN различаются идентификатором сервера
+SERVER_COLUMN = [
+    "ALTER TABLE connections ADD COLUMN server_id TEXT NOT NULL DEFAULT 'default'",
+]
+
+# Суточные сводки по пользователям (сутки по UTC, по времени подключения) для сессий, перенесённых в архив
+DAILY_USAGE = [
+    '''
+    CREATE TABLE IF NOT EXISTS daily_usage (
+        day INTEGER NOT NULL,
+        server_id TEXT NOT NULL,
+        common_name TEXT NOT NULL,
+        sessions INTEGER NOT NULL DEFAULT 0,
+        duration_minutes INTEGER NOT NULL DEFAULT 0,
+        bytes_received REAL NOT NULL DEFAULT 0,
+        bytes_sent REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, server_id, common_name)
+    ) WITHOUT ROWID
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_daily_usage_cn_day ON daily_usage (common_name, day)",
+    "CREATE INDEX IF NOT EXISTS idx_connections_disconnected ON connections (disconnected_at) WHERE disconnected_at IS NOT NULL",
+]
+
+# Выгрузка сессий по времени подключения идёт в порядке индекса, без сортировки во временной таблице
+EXPORT_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_connections_connected ON connections (connected_at)",
+]
+
+# Предвычисленная аналитика сессий (analytics.py): пики одновременных сессий по часам ("*" - все пользователи),
+# гистограммы длительности и трафика по суткам, скользящие базовые уровни пользователей и флаги аномалий
+ANALYTICS_TABLES = [
+    '''
+    CREATE TABLE IF NOT EXISTS concurrency_peaks (
+        common_name TEXT NOT NULL,
+        bucket INTEGER NOT NULL,
+        peak INTEGER NOT NULL,
+        PRIMARY KEY (common_name, bucket)
+    ) WITHOUT ROWID
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_concurrency_peaks_bucket ON concurrency_peaks (bucket)",
+    '''
+    CREATE TABLE IF NOT EXISTS session_histograms (
+        day INTEGER NOT NULL,
+        metric TEXT NOT NULL,
+        le TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (day, metric, le)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS user_baselines (
+        common_name TEXT PRIMARY KEY,
+        samples INTEGER NOT NULL,
+        traffic_mean REAL NOT NULL,
+        traffic_var REAL NOT NULL,
+        updated_at INTEGER NOT NULL
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS session_flags (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        at INTEGER NOT NULL,
+        server_id TEXT NOT NULL,
+        common_name TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        value REAL,
+        baseline REAL
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_session_flags_at ON session_flags (at)",
+    "CREATE INDEX IF NOT EXISTS idx_session_flags_cn_at ON session_flags (common_name, at)",
+]
+
+# Снимки статуса серверов, опубликованные воркером-лидером, для остальных воркеров uvicorn
+PUBLISHED_SNAPSHOTS = [
+    '''
+    CREATE TABLE IF NOT EXISTS status_snapshots (
+        server_id TEXT PRIMARY KEY,
+        version INTEGER NOT NULL,
+        clients INTEGER NOT NULL,
+        stats TEXT NOT NULL,
+        parsed_at REAL NOT NULL,
+        parse_ms REAL NOT NULL,
+        published_by TEXT NOT NULL
+    ) WITHOUT ROWID
+    ''',
+]
+
+# Трафик хранился в МБ с округлением: пересборка таблиц с целыми байтами. В открытых сессиях появляются
+# последние значения счётчиков OpenVPN (counter_*) и Client ID, по которым поллер отличает переподключения
+# Округлённые МБ не годятся как прежнее значение счётчика: живой счётчик почти всегда чуть меньше и выглядел бы
+# сбросом. counter_* остаются NULL, первый цикл поллера берёт текущие счётчики без прибавки к итогам
+RAW_BYTE_COUNTERS = [
+    '''
+    CREATE TABLE connections_new (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        common_name TEXT NOT NULL,
+        connected_at INTEGER NOT NULL,
+        disconnected_at INTEGER,
+        duration_minutes INTEGER,
+        bytes_received INTEGER,
+        bytes_sent INTEGER,
+        last_updated INTEGER,
+        server_id TEXT NOT NULL DEFAULT 'default',
+        client_id INTEGER,
+        counter_received INTEGER,
+        counter_sent INTEGER
+    )
+    ''',
+    '''
+    INSERT INTO connections_new (id, common_name, connected_at, disconnected_at, duration_minutes, bytes_received,
+                                 bytes_sent, last_updated, server_id, counter_received, counter_sent)
+    SELECT id, common_name, connected_at, disconnected_at, duration_minutes,
+           CAST(ROUND(bytes_received * 1048576) AS INTEGER), CAST(ROUND(bytes_sent * 1048576) AS INTEGER),
+           last_updated, server_id, NULL, NULL
+    FROM connections
+    ''',
+    "DROP TABLE connections",
+    "ALTER TABLE connections_new RENAME TO connections",
+    *CONNECTION_INDEXES,
+    "CREATE INDEX IF NOT EXISTS idx_connections_disconnected ON connections (disconnected_at) WHERE disconnected_at IS NOT NULL",
+    *EXPORT_INDEXES,
+    '''
+    CREATE TABLE daily_usage_new (
+        day INTEGER NOT NULL,
+        server_id TEXT NOT NULL,
+        common_name TEXT NOT NULL,
+        sessions INTEGER NOT NULL DEFAULT 0,
+        duration_minutes INTEGER NOT NULL DEFAULT 0,
+        bytes_received INTEGER NOT NULL DEFAULT 0,
+        bytes_sent INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, server_id, common_name)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    INSERT INTO daily_usage_new
+    SELECT day, server_id, common_name, sessions, duration_minutes,
+           CAST(ROUND(bytes_received * 1048576) AS INTEGER), CAST(ROUND(bytes_sent * 1048576) AS INTEGER)
+    FROM daily_usage
+    ''',
+    "DROP TABLE daily_usage",
+    "ALTER TABLE daily_usage_new RENAME TO daily_usage",
+    "CREATE INDEX IF NOT EXISTS idx_daily_usage_cn_day ON daily_usage (common_name, day)",
+]
+
+# Общее состояние воркеров uvicorn: задачи PKI (статус виден с любого воркера), журнал открытий и закрытий
+# сессий, который последователи читают по курсору seq для рассылки SSE, и метрики поллера от лидера
+WORKER_SHARED_STATE = [
+    '''
+    CREATE TABLE IF NOT EXISTS jobs (
+        id TEXT PRIMARY KEY,
+        created_at REAL NOT NULL,
+        data TEXT NOT NULL
+    ) WITHOUT ROWID
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_jobs_created ON jobs (created_at)",
+    '''
+    CREATE TABLE IF NOT EXISTS session_events (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        server_id TEXT NOT NULL,
+        common_name TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        at INTEGER NOT NULL,
+        recorded_at INTEGER NOT NULL
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_session_events_recorded ON session_events (recorded_at)",
+    '''
+    CREATE TABLE IF NOT EXISTS published_metrics (
+        name TEXT PRIMARY KEY,
+        body TEXT NOT NULL,
+        published_at REAL NOT NULL,
+        published_by TEXT NOT NULL
+    ) WITHOUT ROWID
+    ''',
+]
+
+# Версия схемы хранится в PRAGMA user_version, каждая миграция применяется в своей транзакции
+MIGRATIONS = [
+    (1, "base schema", BASE_SCHEMA),
+    (2, "epoch timestamps in connections", EPOCH_TIMESTAMPS),
+    (3, "connections indexes", CONNECTION_INDEXES),
+    (4, "traffic rollup tables", TRAFFIC_TABLES),
+    (5, "server id in connections", SERVER_COLUMN),
+    (6, "daily usage summaries", DAILY_USAGE),
+    (7, "export index on connected_at", EXPORT_INDEXES),
+    (8, "session analytics tables", ANALYTICS_TABLES),
+    (9, "published status snapshots", PUBLISHED_SNAPSHOTS),
+    (10, "raw byte counters", RAW_BYTE_COUNTERS),
+    (11, "state shared between workers", WORKER_SHARED_STATE),
+]
+
+async def migrate(db):
+    async with db.execute("PRAGMA user_version") as cursor:
+        current = (await cursor.fetchone())[0]
+    for version, description, statements in MIGRATIONS:
+        if version <= current:
+            continue
+        try:
+            await db.execute("BEGIN IMMEDIATE")
+            # Другой процесс мог применить миграцию, пока мы ждали блокировку записи
+            async with db.execute("PRAGMA user_version") as cursor:
+                current = (await cursor.fetchone())[0]
+            if version <= current:
+                await db.rollback()
+                continue
+            for statement in statements:
+                await db.execute(statement)
+            await db.execute(f"PRAGMA user_version = {version}")
+            await db.commit()
+            logger.info(f"Applied migration {version}: {description}")
+        except Exception as e:
+            await db.rollback()
+            logger.error(f"Migration {version} ({description}) failed: {e}")
+            raise
+    return MIGRATIONS[-1][0]
+
 async def init_db():
     try:
-        async with aiosqlite.connect(DB_PATH) as db:
-            await db.execute('''
-                CREATE TABLE IF NOT EXISTS connections (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    common_name TEXT NOT NULL,
-                    connected_at TEXT NOT NULL,
-                    disconnected_at TEXT,
-                    duration_minutes INTEGER,
-                    bytes_received REAL,
-                    bytes_sent REAL,
-                    last_updated TEXT
+        async with writer() as db:
+            version = await migrate(db)
+            logger.info(f"Database initialized at {DB_PATH}, schema version {version}")
+    except Exception as e:
+        logger.error(f"Failed to initialize database at {DB_PATH}: {e}")
+        raise
+
+# Запросы поллера и дашборда; планы проверяет tests/test_query_plans.py, полного сканирования быть не должно
+OPEN_CONNECTIONS_QUERY = (
+    "SELECT id, server_id, common_name, client_id, connected_at, bytes_received, bytes_sent, counter_received, "
+    "counter_sent FROM connections WHERE disconnected_at IS NULL"
+)
+TRAFFIC_UPDATE_QUERY = (
+    "UPDATE connections SET bytes_received = ?, bytes_sent = ?, counter_received = ?, counter_sent = ?, "
+    "last_updated = ?, client_id = ? WHERE id = ?"
+)
+# Итоги новой сессии равны её счётчикам
+NEW_CONNECTION_QUERY = (
+    "INSERT INTO connections (common_name, connected_at, bytes_received, bytes_sent, last_updated, server_id, "
+    "client_id, counter_received, counter_sent) VALUES (?1, ?2, ?3, ?4, ?5, ?6, ?7, ?3, ?4)"
+)
+DISCONNECT_QUERY = "UPDATE connections SET disconnected_at = ?, duration_minutes = ?, last_updated = ? WHERE id = ?"
+CREDENTIALS_QUERY = "SELECT username, password, disabled FROM sysadmin WHERE username = ?"
+ARCHIVABLE_QUERY = "SELECT * FROM connections WHERE disconnected_at < ? ORDER BY disconnected_at LIMIT ?"
+CONCURRENCY_PEAKS_QUERY = (
+    "SELECT bucket, peak FROM concurrency_peaks WHERE common_name = ? AND bucket >= ? AND bucket < ? ORDER BY bucket"
+)
+
+
+def connections_page_query(limit=50, cursor=None, common_name=None, since=None, until=None, state=None, server_id=None):
+    # Keyset-пагинация по (last_updated, id): страница не зависит от размера истории
+    conditions = []
+    params = []
+    if cursor is not None:
+        conditions.append("(last_updated, id) < (?, ?)")
+        params.extend(cursor)
+    if common_name:
+        conditions.append("common_name = ?")
+        params.append(common_name)
+    if server_id:
+        conditions.append("server_id = ?")
+        params.append(server_id)
+    if since is not None:
+        conditions.append("connected_at >= ?")
+        params.append(since)
+    if until is not None:
+        conditions.append("connected_at < ?")
+        params.append(until)
+    if state == "open":
+        conditions.append("disconnected_at IS NULL")
+    elif state == "closed":
+        conditions.append("disconnected_at IS NOT NULL")
+
+    query = "SELECT * FROM connections"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY last_updated DESC, id DESC LIMIT ?"
+    params.append(limit)
+    return query, params
+
+@db_timed
+async def get_connections_page(limit=50, cursor=None, common_name=None, since=None, until=None, state=None, server_id=None):
+    query, params = connections_page_query(limit, cursor, common_name, since, until, state, server_id)
+    async with reader() as db, db.execute(query, params) as cur:
+        rows = [dict(row) for row in await cur.fetchall()]
+    next_cursor = (rows[-1]["last_updated"], rows[-1]["id"]) if len(rows) == limit else None
+    return rows, next_cursor
+
+@db_timed
+async def get_open_connections():
+    async with reader() as db, db.execute(OPEN_CONNECTIONS_QUERY) as cursor:
+        return [dict(row) for row in await cursor.fetchall()]
+
+@db_timed
+async def apply_connection_changes(traffic_updates, new_connections, disconnects, traffic_deltas=(), sampled_at=None,
+                                   session_events=()):
+    # Все изменения цикла применяются одной транзакцией
+    try:
+        async with writer() as db:
+            if traffic_deltas:
+                for table, size, _ in TRAFFIC_RESOLUTIONS:
+                    bucket = int(sampled_at) // size * size
+                    await db.executemany(
+                        f"INSERT INTO {table} (bucket, common_name, bytes_received, bytes_sent) VALUES (?, ?, ?, ?) "
+                        "ON CONFLICT (bucket, common_name) DO UPDATE SET "
+                        "bytes_received = bytes_received + excluded.bytes_received, bytes_sent = bytes_sent + excluded.bytes_sent",
+                        [(bucket, name, received, sent) for name, received, sent in traffic_deltas]
+                    )
+            if traffic_updates:
+                await db.executemany(TRAFFIC_UPDATE_QUERY, traffic_updates)
+            if new_connections:
+                await db.executemany(NEW_CONNECTION_QUERY, new_connections)
+            if disconnects:
+                await db.executemany(DISCONNECT_QUERY, disconnects)
+            if session_events:
+                await db.executemany(
+                    "INSERT INTO session_events (server_id, common_name, kind, at, recorded_at) VALUES (?, ?, ?, ?, ?)",
+                    session_events
+                )
+            await db.commit()
+    except Exception as e:
+        logger.error(f"Error applying connection changes: {e}")
+        raise
+
+@db_timed
+async def evict_traffic(now):
+    try:
+        async with writer() as db:
+            for table, _, retention in TRAFFIC_RESOLUTIONS:
+                await db.execute(f"DELETE FROM {table} WHERE bucket < ?", (int(now) - retention,))
+            await db.commit()
+    except Exception as e:
+        logger.error(f"Error evicting traffic buckets: {e}")
+
+def traffic_resolution(since, until):
+    # Самое мелкое разрешение, у которого окно помещается в срок хранения и даёт не больше ~1500 точек
+    for table, size, retention in TRAFFIC_RESOLUTIONS:
+        if (until - since) / size <= 1500 and since >= until - retention:
+            return table, size
+    table, size, _ = TRAFFIC_RESOLUTIONS[-1]
+    return table, size
+
+def top_talkers_query(since, until, limit=10):
+    table, size = traffic_resolution(since, until)
+    query = (f"SELECT common_name, SUM(bytes_received) AS bytes_received, SUM(bytes_sent) AS bytes_sent FROM {table} "
+             "WHERE bucket >= ? AND bucket < ? GROUP BY common_name "
+             "ORDER BY SUM(bytes_received) + SUM(bytes_sent) DESC LIMIT ?")
+    return query, [since // size * size, until, limit]
+
+@db_timed
+async def get_top_talkers(since, until, limit=10):
+    async with reader() as db, db.execute(*top_talkers_query(since, until, limit)) as cursor:
+        return [dict(row) for row in await cursor.fetchall()]
+
+def traffic_series_query(since, until, common_name=None):
+    table, size = traffic_resolution(since, until)
+    query = f"SELECT bucket, SUM(bytes_received) AS bytes_received, SUM(bytes_sent) AS bytes_sent FROM {table} WHERE bucket >= ? AND bucket < ?"
+    params = [since // size * size, until]
+    if common_name:
+        query += " AND common_name = ?"
+        params.append(common_name)
+    query += " GROUP BY bucket ORDER BY bucket"
+    return size, query, params
+
+@db_timed
+async def get_traffic_series(since, until, common_name=None):
+    size, query, params = traffic_series_query(since, until, common_name)
+    async with reader() as db, db.execute(query, params) as cursor:
+        return size, [dict(row) for row in await cursor.fetchall()]
+
+@db_timed
+async def get_archivable_connections(cutoff, limit):
+    async with reader() as db, db.execute(ARCHIVABLE_QUERY, (cutoff, limit)) as cursor:
+        return [dict(row) for row in await cursor.fetchall()]
+
+@db_timed
+async def delete_archived_connections(rows):
+    # Сводка и удаление - одной транзакцией: сессия не попадёт в сводку дважды и не пропадёт без неё
+    summary = {}
+    for row in rows:
+        key = (row["connected_at"] // 86400 * 86400, row["server_id"], row["common_name"])
+        sessions, minutes, received, sent = summary.get(key, (0, 0, 0, 0))
+        summary[key] = (sessions + 1, minutes + (row["duration_minutes"] or 0),
+                        received + (row["bytes_received"] or 0), sent + (row["bytes_sent"] or 0))
+    try:
+        async with writer() as db:
+            await db.executemany(
+                "INSERT INTO daily_usage (day, server_id, common_name, sessions, duration_minutes, bytes_received, bytes_sent) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (day, server_id, common_name) DO UPDATE SET "
+                "sessions = sessions + excluded.sessions, duration_minutes = duration_minutes + excluded.duration_minutes, "
+                "bytes_received = bytes_received + excluded.bytes_received, bytes_sent = bytes_sent + excluded.bytes_sent",
+                [key + values for key, values in summary.items()]
+            )
+            await db.executemany("DELETE FROM connections WHERE id = ?", [(row["id"],) for row in rows])
+            await db.commit()
+    except Exception as e:
+        logger.error(f"Error removing archived connections: {e}")
+        raise
+
+@db_timed
+async def get_daily_usage(since, until, common_name=None, server_id=None):
+    # Архивные сутки берутся из сводок, остальные считаются по таблице connections
+    since = since // 86400 * 86400
+    summary_conditions = ["day >= ?", "day < ?"]
+    session_conditions = ["disconnected_at IS NOT NULL", "connected_at >= ?", "connected_at < ?"]
+    params = [since, until]
+    if common_name:
+        summary_conditions.append("common_name = ?")
+        session_conditions.append("common_name = ?")
+        params.append(common_name)
+    if server_id:
+        summary_conditions.append("server_id = ?")
+        session_conditions.append("server_id = ?")
+        params.append(server_id)
+    query = (
+        "SELECT day, server_id, common_name, SUM(sessions) AS sessions, SUM(duration_minutes) AS duration_minutes, "
+        "SUM(bytes_received) AS bytes_received, SUM(bytes_sent) AS bytes_sent FROM ("
+        "SELECT day, server_id, common_name, sessions, duration_minutes, bytes_received, bytes_sent "
+        f"FROM daily_usage WHERE {' AND '.join(summary_conditions)} "
+        "UNION ALL "
+        "SELECT connected_at / 86400 * 86400, server_id, common_name, 1, COALESCE(duration_minutes, 0), "
+        f"bytes_received, bytes_sent FROM connections WHERE {' AND '.join(session_conditions)}"
+        ") GROUP BY day, server_id, common_name ORDER BY day, common_name"
+    )
+    async with reader() as db, db.execute(query, params + params) as cursor:
+        return [dict(row) for row in await cursor.fetchall()]
+
+@db_timed
+async def apply_analytics(peaks, histograms, baselines, flags):
+    # Изменения аналитики за цикл поллера - одной транзакцией
+    try:
+        async with writer() as db:
+            if peaks:
+                await db.executemany(
+                    "INSERT INTO concurrency_peaks (common_name, bucket, peak) VALUES (?, ?, ?) "
+                    "ON CONFLICT (common_name, bucket) DO UPDATE SET peak = MAX(peak, excluded.peak)",
+                    [(name, bucket, peak) for (name, bucket), peak in peaks.items()]
                 )
-            ''')
-            await db.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    common_name TEXT PRIMARY KEY,
-                    email TEXT,
-                    description TEXT
+            if histograms:
+                await db.executemany(
+                    "INSERT INTO session_histograms (day, metric, le, count) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (day, metric, le) DO UPDATE SET count = count + excluded.count",
+                    [key + (count,) for key, count in histograms.items()]
+                )
+            if baselines:
+                await db.executemany(
+                    "INSERT OR REPLACE INTO user_baselines (common_name, samples, traffic_mean, traffic_var, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    [(name,) + tuple(values) for name, values in baselines.items()]
+                )
+            if flags:
+                await db.executemany(
+                    "INSERT INTO session_flags (at, server_id, common_name, kind, value, baseline) VALUES (?, ?, ?, ?, ?, ?)",
+                    flags
                 )
-            ''')
-            await db.execute('''
-                 CREATE TABLE IF NOT EXISTS sysadmin (
-                     username TEXT PRIMARY KEY,
-                     password TEXT,
-                     disabled BOOLEAN NOT NULL DEFAULT FALSE
-                 )
-             ''')
             await db.commit()
-            logger.info(f"Database initialized at {DB_PATH}")
     except Exception as e:
-        logger.error(f"Failed to initialize database at {DB_PATH}: {e}")
+        logger.error(f"Error applying session analytics: {e}")
         raise
 
-async def add_connection(common_name, connected_at, last_updated):
+@db_timed
+async def get_user_baselines():
+    async with reader() as db, db.execute(
+        "SELECT common_name, samples, traffic_mean, traffic_var, updated_at FROM user_baselines"
+    ) as cursor:
+        return {row[0]: tuple(row[1:]) for row in await cursor.fetchall()}
+
+@db_timed
+async def get_concurrency_peaks(since, until, common_name="*"):
+    async with reader() as db, db.execute(CONCURRENCY_PEAKS_QUERY, (common_name, since // 3600 * 3600, until)) as cursor:
+        return [dict(row) for row in await cursor.fetchall()]
+
+@db_timed
+async def get_session_histograms(since, until):
+    async with reader() as db, db.execute(
+        "SELECT metric, le, SUM(count) AS count FROM session_histograms WHERE day >= ? AND day < ? GROUP BY metric, le",
+        (since // 86400 * 86400, until)
+    ) as cursor:
+        return [dict(row) for row in await cursor.fetchall()]
+
+def session_flags_query(since, limit=100, common_name=None, kind=None):
+    query = "SELECT * FROM session_flags WHERE at >= ?"
+    params = [since]
+    if common_name:
+        query += " AND common_name = ?"
+        params.append(common_name)
+    if kind:
+        query += " AND kind = ?"
+        params.append(kind)
+    query += " ORDER BY at DESC, id DESC LIMIT ?"
+    params.append(limit)
+    return query, params
+
+@db_timed
+async def get_session_flags(since, limit=100, common_name=None, kind=None):
+    async with reader() as db, db.execute(*session_flags_query(since, limit, common_name, kind)) as cursor:
+        return [dict(row) for row in await cursor.fetchall()]
+
+@db_timed
+async def evict_analytics(now, retention):
     try:
-        async with aiosqlite.connect(DB_PATH) as db:
-            await db.execute(
-                "INSERT INTO connections (common_name, connected_at, last_updated) VALUES (?, ?, ?)",
-                (common_name, connected_at, last_updated)
+        async with writer() as db:
+            cutoff = int(now) - retention
+            await db.execute("DELETE FROM concurrency_peaks WHERE bucket < ?", (cutoff,))
+            await db.execute("DELETE FROM session_histograms WHERE day < ?", (cutoff,))
+            await db.execute("DELETE FROM session_flags WHERE at < ?", (cutoff,))
+            await db.commit()
+    except Exception as e:
+        logger.error(f"Error evicting session analytics: {e}")
+
+@db_timed
+async def publish_snapshots(rows):
+    # rows: (server_id, version, clients, stats JSON, parsed_at, parse_ms, published_by)
+    try:
+        async with writer() as db:
+            await db.executemany(
+                "INSERT OR REPLACE INTO status_snapshots (server_id, version, clients, stats, parsed_at, parse_ms, "
+                "published_by) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows
             )
             await db.commit()
-            logger.info(f"Added connection for {common_name}")
     except Exception as e:
-        logger.error(f"Error adding connection for {common_name}: {e}")
+        logger.error(f"Error publishing status snapshots: {e}")
+        raise
+
+@db_timed
+async def get_snapshot_versions():
+    async with reader() as db, db.execute("SELECT server_id, version FROM status_snapshots") as cursor:
+        return {row[0]: row[1] for row in await cursor.fetchall()}
 
-async def update_connection_disconnect(common_name, disconnected_at, duration_minutes, bytes_received, bytes_sent):
+@db_timed
+async def get_published_snapshots(server_ids):
+    if not server_ids:
+        return []
+    async with reader() as db, db.execute(
+        "SELECT * FROM status_snapshots WHERE server_id IN "
+        f"({', '.join('?' * len(server_ids))})",
+        list(server_ids)
+    ) as cursor:
+        return [dict(row) for row in await cursor.fetchall()]
+
+@db_timed
+async def get_session_events(after, limit=1000):
+    async with reader() as db, db.execute(
+        "SELECT * FROM session_events WHERE seq > ? ORDER BY seq LIMIT ?", (after, limit)
+    ) as cursor:
+        return [dict(row) for row in await cursor.fetchall()]
+
+@db_timed
+async def get_last_session_event():
+    async with reader() as db, db.execute("SELECT MAX(seq) FROM session_events") as cursor:
+        return (await cursor.fetchone())[0] or 0
+
+@db_timed
+async def evict_session_events(before):
+    try:
+        async with writer() as db:
+            await db.execute("DELETE FROM session_events WHERE recorded_at < ?", (int(before),))
+            await db.commit()
+    except Exception as e:
+        logger.error(f"Error evicting session events: {e}")
+
+@db_timed
+async def publish_metrics(name, body, published_at, published_by):
     try:
-        async with aiosqlite.connect(DB_PATH) as db:
+        async with writer() as db:
             await db.execute(
-                "UPDATE connections SET disconnected_at = ?, duration_minutes = ?, bytes_received = ?, bytes_sent = ?, last_updated = ? WHERE common_name = ? AND disconnected_at IS NULL",
-                (disconnected_at, duration_minutes, bytes_received, bytes_sent, disconnected_at, common_name)
+                "INSERT OR REPLACE INTO published_metrics (name, body, published_at, published_by) VALUES (?, ?, ?, ?)",
+                (name, body, published_at, published_by)
             )
             await db.commit()
-            logger.info(f"Updated disconnect for {common_name}: {disconnected_at}")
     except Exception as e:
-        logger.error(f"Error updating disconnect for {common_name}: {e}")
+        logger.error(f"Error publishing metrics: {e}")
+        raise
 
-async def update_connection_traffic(common_name, bytes_received, bytes_sent, last_updated):
+@db_timed
+async def get_published_metrics(name):
+    async with reader() as db, db.execute("SELECT * FROM published_metrics WHERE name = ?", (name,)) as cursor:
+        row = await cursor.fetchone()
+        return dict(row) if row else None
+
+@db_timed
+async def save_job(job_id, created_at, data, history):
+    # Хранятся последние history задач, старые удаляются при каждой записи
     try:
-        async with aiosqlite.connect(DB_PATH) as db:
+        async with writer() as db:
             await db.execute(
-                "UPDATE connections SET bytes_received = ?, bytes_sent = ?, last_updated = ? WHERE common_name = ? AND disconnected_at IS NULL",
-                (bytes_received, bytes_sent, last_updated, common_name)
+                "INSERT INTO jobs (id, created_at, data) VALUES (?, ?, ?) "
+                "ON CONFLICT (id) DO UPDATE SET data = excluded.data",
+                (job_id, created_at, data)
+            )
+            await db.execute(
+                "DELETE FROM jobs WHERE created_at < (SELECT created_at FROM jobs ORDER BY created_at DESC LIMIT 1 OFFSET ?)",
+                (history - 1,)
             )
             await db.commit()
-            logger.info(f"Updated traffic for {common_name}: received={bytes_received}, sent={bytes_sent}")
     except Exception as e:
-        logger.error(f"Error updating traffic for {common_name}: {e}")
+        logger.error(f"Error saving job {job_id}: {e}")
+        raise
+
+@db_timed
+async def get_job_data(job_id):
+    async with reader() as db, db.execute("SELECT data FROM jobs WHERE id = ?", (job_id,)) as cursor:
+        row = await cursor.fetchone()
+        return row[0] if row else None
 
-async def get_all_connections():
+SESSION_EXPORT_COLUMNS = ("id", "server_id", "common_name", "client_id", "connected_at", "disconnected_at",
+                          "duration_minutes", "bytes_received", "bytes_sent")
+USAGE_REPORT_COLUMNS = ("period", "server_id", "common_name", "sessions", "duration_minutes", "bytes_received",
+                        "bytes_sent")
+USAGE_PERIODS = {"day": "%Y-%m-%d", "month": "%Y-%m"}
+
+async def stream_rows(query, params, batch_size=EXPORT_BATCH_SIZE):
+    # Серверный курсор на отдельном соединении: строки приходят пачками, выгрузка не занимает пул читателей,
+    # а читатель в режиме WAL не блокирует запись поллера
+    db = await _connect(read_only=True)
     try:
-        async with aiosqlite.connect(DB_PATH) as db:
-            db.row_factory = aiosqlite.Row
-            async with db.execute("SELECT * FROM connections ORDER BY last_updated DESC") as cursor:
-                return [dict(row) for row in await cursor.fetchall()]
-    except Exception as e:
-        logger.error(f"Error fetching connections: {e}")
-        return []
+        async with db.execute(query, params) as cursor:
+            while True:
+                rows = await cursor.fetchmany(batch_size)
+                if not rows:
+                    return
+                yield rows
+    finally:
+        await db.close()
+
+def sessions_export_query(since=None, until=None, common_name=None, server_id=None, state=None):
+    conditions = []
+    params = []
+    if since is not None:
+        conditions.append("connected_at >= ?")
+        params.append(since)
+    if until is not None:
+        conditions.append("connected_at < ?")
+        params.append(until)
+    if common_name:
+        conditions.append("common_name = ?")
+        params.append(common_name)
+    if server_id:
+        conditions.append("server_id = ?")
+        params.append(server_id)
+    if state == "open":
+        conditions.append("disconnected_at IS NULL")
+    elif state == "closed":
+        conditions.append("disconnected_at IS NOT NULL")
+
+    query = f"SELECT {', '.join(SESSION_EXPORT_COLUMNS)} FROM connections"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY connected_at, id"
+    return query, params
+
+def stream_sessions(since=None, until=None, common_name=None, server_id=None, state=None):
+    return stream_rows(*sessions_export_query(since, until, common_name, server_id, state))
+
+def stream_usage_report(since, until, period="month", common_name=None, server_id=None):
+    # Агрегация по периоду (UTC) целиком в SQL: в Python приходят только итоговые строки.
+    # Как и в get_daily_usage, архивные сессии берутся из сводок daily_usage, открытые не учитываются
+    period_format = USAGE_PERIODS[period]
+    summary_conditions = ["day >= ?", "day < ?"]
+    summary_params = [period_format, since // 86400 * 86400, until]
+    session_conditions = ["disconnected_at IS NOT NULL", "connected_at >= ?", "connected_at < ?"]
+    session_params = [period_format, since, until]
+    if common_name:
+        summary_conditions.append("common_name = ?")
+        session_conditions.append("common_name = ?")
+        summary_params.append(common_name)
+        session_params.append(common_name)
+    if server_id:
+        summary_conditions.append("server_id = ?")
+        session_conditions.append("server_id = ?")
+        summary_params.append(server_id)
+        session_params.append(server_id)
+    query = (
+        "SELECT period, server_id, common_name, SUM(sessions), SUM(duration_minutes), SUM(bytes_received), "
+        "SUM(bytes_sent) FROM ("
+        "SELECT strftime(?, day, 'unixepoch') AS period, server_id, common_name, sessions, duration_minutes, "
+        f"bytes_received, bytes_sent FROM daily_usage WHERE {' AND '.join(summary_conditions)} "
+        "UNION ALL "
+        "SELECT strftime(?, connected_at, 'unixepoch'), server_id, common_name, 1, COALESCE(duration_minutes, 0), "
+        f"bytes_received, bytes_sent FROM connections WHERE {' AND '.join(session_conditions)}"
+        ") GROUP BY common_name, period, server_id ORDER BY common_name, period, server_id"
+    )
+    return stream_rows(query, summary_params + session_params)
 
+async def get_auto_vacuum():
+    async with reader() as db, db.execute("PRAGMA auto_vacuum") as cursor:
+        return (await cursor.fetchone())[0]
+
+async def enable_incremental_vacuum():
+    # auto_vacuum существующей базы меняется только полным VACUUM, который держит блокировку записи всё время работы.
+    # Поэтому это отдельная команда обслуживания (python retention.py enable-incremental-vacuum), а не шаг запуска
+    async with writer() as db:
+        async with db.execute("PRAGMA auto_vacuum") as cursor:
+            mode = (await cursor.fetchone())[0]
+        if mode == AUTO_VACUUM_INCREMENTAL:
+            return False
+        logger.warning(f"Converting {DB_PATH} to incremental auto_vacuum, running a one-time full VACUUM")
+        await db.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        await db.execute("VACUUM")
+        return True
+
+@db_timed
+async def incremental_vacuum(pages):
+    # Освобождает не больше pages страниц за раз, чтобы не держать блокировку записи
+    # (pages <= 0 у SQLite означает весь список свободных страниц)
+    async with writer() as db:
+        async with db.execute("PRAGMA freelist_count") as cursor:
+            before = (await cursor.fetchone())[0]
+        async with db.execute(f"PRAGMA incremental_vacuum({max(1, int(pages))})") as cursor:
+            await cursor.fetchall()
+        await db.commit()
+        async with db.execute("PRAGMA freelist_count") as cursor:
+            after = (await cursor.fetchone())[0]
+        return before - after, after
+
+async def checkpoint_wal():
+    async with writer() as db:
+        await db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+@db_timed
 async def add_user_db(common_name, email, description):
     try:
-        async with aiosqlite.connect(DB_PATH) as db:
+        async with writer() as db:
             # Проверяем, существует ли пользователь
             cursor = await db.execute("SELECT common_name FROM users WHERE common_name = ?", (common_name,))
             existing_user = await cursor.fetchone()
@@ -134,37 +936,73 @@ async def add_user_db(common_name, email, description):
         logger.error(f"Error adding/updating user {common_name}: {e}")
         raise
 
+@db_timed
+async def add_users_db(rows):
+    if not rows:
+        return
+    try:
+        async with writer() as db:
+            await db.executemany(
+                "INSERT OR REPLACE INTO users (common_name, email, description) VALUES (?, ?, ?)",
+                rows
+            )
+            await db.commit()
+            logger.info(f"Added/Updated {len(rows)} users in database")
+    except Exception as e:
+        logger.error(f"Error adding users in bulk: {e}")
+        raise
+
+@db_timed
+async def remove_users_db(common_names):
+    if not common_names:
+        return
+    try:
+        async with writer() as db:
+            await db.executemany("DELETE FROM users WHERE common_name = ?", [(name,) for name in common_names])
+            await db.commit()
+            logger.info(f"Removed {len(common_names)} users")
+    except Exception as e:
+        logger.error(f"Error removing users in bulk: {e}")
+        raise
+
+@db_timed
 async def remove_user_db(common_name):
     try:
-        async with aiosqlite.connect(DB_PATH) as db:
+        async with writer() as db:
             await db.execute("DELETE FROM users WHERE common_name = ?", (common_name,))
             await db.commit()
             logger.info(f"Removed user {common_name}")
     except Exception as e:
         logger.error(f"Error removing user {common_name}: {e}")
 
+@db_timed
 async def get_all_users_from_db():
     try:
-        async with aiosqlite.connect(DB_PATH) as db:
-            db.row_factory = aiosqlite.Row
-            async with db.execute("SELECT * FROM users") as cursor:
-                return [dict(row) for row in await cursor.fetchall()]
+        async with reader() as db, db.execute("SELECT * FROM users") as cursor:
+            return [dict(row) for row in await cursor.fetchall()]
     except Exception as e:
         logger.error(f"Error fetching users: {e}")
         return []
 
+@db_timed
 async def get_credentials_from_db(username: str):
     try:
-        async with aiosqlite.connect(DB_PATH) as db:
-            db.row_factory = aiosqlite.Row
-            async with db.execute(
-                "SELECT username, password, disabled FROM sysadmin WHERE username = ?",
-                (username,)
-            ) as cursor:
-                row = await cursor.fetchone()
-                if row:
-                    return dict(row)
-                return None
+        async with reader() as db, db.execute(CREDENTIALS_QUERY, (username,)) as cursor:
+            row = await cursor.fetchone()
+            if row:
+                return dict(row)
+            return None
     except Exception as e:
         logger.error(f"Error fetching credentials: {e}")
-        return None
\ No newline at end of file
+        return None
+
+@db_timed
+async def set_sysadmin_disabled(username: str, disabled: bool):
+    try:
+        async with writer() as db:
+            await db.execute("UPDATE sysadmin SET disabled = ? WHERE username = ?", (disabled, username))
+            await db.commit()
+            logger.info(f"Set disabled={disabled} for admin {username}")
+    except Exception as e:
+        logger.error(f"Error updating admin {username}: {e}")
+        raise
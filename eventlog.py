@@ -0,0 +1,120 @@
+import os
+import re
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+# При первом открытии читаем только хвост лога, а не весь файл
+INITIAL_BACKLOG = 16 * 1024 * 1024
+MAX_EVENTS = 10000
+
+# Строки вида: "2025-08-15 18:12:59 us=133072 akellavk_m/192.168.1.1:4716 [akellavk_m] Inactivity timeout (--ping-restart), restarting"
+LINE_PATTERN = re.compile(
+    r"^(?P<time>\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})(?: us=\d+)? (?P<cn>[^/\s]+)/\S+ (?:\[\S+\] )?(?P<message>.*)$"
+)
+REASON_PATTERNS = (
+    ("inactivity-timeout", re.compile(r"Inactivity timeout")),
+    ("client-exit", re.compile(r"SIGTERM\[[^\]]*(?:remote-exit|delayed-exit)[^\]]*\] received")),
+    ("sigterm", re.compile(r"SIGTERM\[[^\]]*\] received")),
+    ("sigusr1", re.compile(r"SIGUSR1\[[^\]]*\] received, client-instance restarting")),
+    ("tls-error", re.compile(r"TLS Error|TLS handshake failed")),
+    ("connection-reset", re.compile(r"Connection reset")),
+)
+
+
+def parse_event_line(line):
+    match = LINE_PATTERN.match(line)
+    if not match:
+        return None
+    message = match.group("message")
+    for reason, pattern in REASON_PATTERNS:
+        if pattern.search(message):
+            return match.group("cn"), match.group("time"), reason
+    return None
+
+
+class EventLogTailer:
+    def __init__(self, path, max_events=MAX_EVENTS, chunk_size=CHUNK_SIZE, initial_backlog=INITIAL_BACKLOG):
+        self.path = path
+        self.max_events = max_events
+        self.chunk_size = chunk_size
+        self.initial_backlog = initial_backlog
+        self._file = None
+        self._inode = None
+        self._offset = 0
+        self._partial = b""
+        # common_name -> (время отключения, причина), самые свежие в конце
+        self._events = OrderedDict()
+
+    def _open(self, st, from_start):
+        self._close()
+        self._file = open(self.path, "rb")
+        self._inode = st.st_ino
+        self._partial = b""
+        self._offset = 0
+        if not from_start and st.st_size > self.initial_backlog:
+            self._offset = st.st_size - self.initial_backlog
+            self._file.seek(self._offset)
+            # Первая строка после seek почти всегда неполная
+            skipped = self._file.readline()
+            self._offset += len(skipped)
+
+    def _close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _read_new(self):
+        while True:
+            chunk = self._file.read(self.chunk_size)
+            if not chunk:
+                return
+            self._offset += len(chunk)
+            data = self._partial + chunk
+            lines = data.split(b"\n")
+            self._partial = lines.pop()
+            for raw in lines:
+                self._handle_line(raw.decode("utf-8", errors="replace"))
+
+    def _handle_line(self, line):
+        event = parse_event_line(line.rstrip("\r"))
+        if event is None:
+            return
+        common_name, timestamp, reason = event
+        self._events[common_name] = (timestamp, reason)
+        self._events.move_to_end(common_name)
+        if len(self._events) > self.max_events:
+            self._events.popitem(last=False)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Parsed disconnect for {common_name}: {timestamp} ({reason})")
+
+    def poll(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            logger.error(f"Event log {self.path} does not exist")
+            return self.disconnect_times()
+
+        if self._file is None:
+            self._open(st, from_start=False)
+        elif st.st_ino != self._inode:
+            # Ротация: дочитываем старый файл и переходим на новый с начала
+            self._read_new()
+            logger.info(f"Event log {self.path} rotated, reopening")
+            self._open(st, from_start=True)
+        elif st.st_size < self._offset:
+            logger.info(f"Event log {self.path} truncated, reading from start")
+            self._open(st, from_start=True)
+
+        self._read_new()
+        return self.disconnect_times()
+
+    def disconnect_times(self):
+        return {cn: timestamp for cn, (timestamp, _) in self._events.items()}
+
+    def reason(self, common_name):
+        event = self._events.get(common_name)
+        return event[1] if event else None
+
@@ -0,0 +1,72 @@
+import asyncio
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+def client_key(client):
+    # При duplicate-cn подключения с одним CN различаются только Client ID; без него (старый формат статуса)
+    # ключом остаются сервер и CN
+    key = f"{client.get('server_id', 'default')}/{client['common_name']}"
+    return key if client.get("client_id") is None else f"{key}/{client['client_id']}"
+
+
+def diff_status(previous, current):
+    # Изменения между двумя снимками статуса: подключившиеся, отключившиеся и изменившийся трафик
+    before = {client_key(c): c for c in previous}
+    after = {client_key(c): c for c in current}
+    joined = [dict(after[name]) for name in after.keys() - before.keys()]
+    left = sorted(before.keys() - after.keys())
+    traffic = {
+        name: {"bytes_received": c["bytes_received"], "bytes_sent": c["bytes_sent"]}
+        for name, c in after.items()
+        if name in before and (before[name]["bytes_received"], before[name]["bytes_sent"]) != (c["bytes_received"], c["bytes_sent"])
+    }
+    return {"joined": joined, "left": left, "traffic": traffic}
+
+
+class Subscriber:
+    def __init__(self, maxsize):
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+
+class EventBroadcaster:
+    # Один цикл поллера рассылает изменения всем подписчикам; у каждого своя ограниченная очередь
+    def __init__(self, queue_size=SUBSCRIBER_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers = set()
+        self.version = 0
+
+    @property
+    def subscribers(self):
+        return len(self._subscribers)
+
+    def subscribe(self):
+        subscriber = Subscriber(self.queue_size)
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self._subscribers.discard(subscriber)
+
+    def publish(self, event, data):
+        self.version += 1
+        message = (event, self.version, data)
+        for subscriber in self._subscribers:
+            try:
+                subscriber.queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # Медленный клиент: сбрасываем его очередь и просим перечитать состояние целиком
+                subscriber.dropped += subscriber.queue.qsize()
+                while not subscriber.queue.empty():
+                    subscriber.queue.get_nowait()
+                subscriber.queue.put_nowait(("resync", self.version, {}))
+                logger.debug(f"Subscriber lagged, dropped {subscriber.dropped} events so far")
+
+
+def format_sse(event, event_id, data):
+    return f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
@@ -0,0 +1,109 @@
+import asyncio
+import os
+import re
+import time
+import logging
+from dataclasses import dataclass, asdict
+from datetime import datetime, timezone
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+CN_PATTERN = re.compile(r"/CN=([^/]+)")
+STATUS_NAMES = {"V": "valid", "R": "revoked", "E": "expired"}
+
+
+@dataclass(frozen=True)
+class Certificate:
+    common_name: str
+    status: str
+    expires_at: Optional[int]
+    revoked_at: Optional[int]
+    serial: str
+
+    def as_dict(self):
+        return asdict(self)
+
+
+def parse_asn1_time(value):
+    # Даты в index.txt: YYMMDDHHMMSSZ (UTCTime) или YYYYMMDDHHMMSSZ (GeneralizedTime)
+    value = value.split(",")[0].strip()
+    if not value:
+        return None
+    fmt = "%y%m%d%H%M%SZ" if len(value) == 13 else "%Y%m%d%H%M%SZ"
+    try:
+        return int(datetime.strptime(value, fmt).replace(tzinfo=timezone.utc).timestamp())
+    except ValueError:
+        return None
+
+
+def parse_index_line(line):
+    parts = line.rstrip("\n").split("\t")
+    if len(parts) < 6 or parts[0] not in STATUS_NAMES:
+        return None
+    match = CN_PATTERN.search(parts[5])
+    if not match:
+        return None
+    return Certificate(
+        common_name=match.group(1).strip(),
+        status=STATUS_NAMES[parts[0]],
+        expires_at=parse_asn1_time(parts[1]),
+        revoked_at=parse_asn1_time(parts[2]),
+        serial=parts[3],
+    )
+
+
+def _prefer(current, candidate):
+    # Для CN с перевыпущенными сертификатами оставляем действующий, иначе самый свежий
+    if current is None:
+        return candidate
+    if (candidate.status == "valid") != (current.status == "valid"):
+        return candidate if candidate.status == "valid" else current
+    return candidate if (candidate.expires_at or 0) >= (current.expires_at or 0) else current
+
+
+class CertificateInventory:
+    # Разбирает index.txt в словарь по CN и перечитывает его только при изменении файла
+    def __init__(self, path):
+        self.path = path
+        self._signature = None
+        self.certificates = {}
+
+    def _load(self):
+        certificates = {}
+        with open(self.path, "r") as f:
+            for line in f:
+                cert = parse_index_line(line)
+                if cert is not None:
+                    certificates[cert.common_name] = _prefer(certificates.get(cert.common_name), cert)
+        return certificates
+
+    async def refresh(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            logger.error(f"Index file {self.path} does not exist")
+            return False
+        signature = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if signature == self._signature:
+            return False
+        try:
+            self.certificates = await asyncio.to_thread(self._load)
+        except Exception as e:
+            logger.error(f"Error reading index file: {e}")
+            return False
+        self._signature = signature
+        logger.info(f"Loaded {len(self.certificates)} certificates from {self.path}")
+        return True
+
+    def by_status(self, status):
+        return [c for c in self.certificates.values() if c.status == status]
+
+    def expiring_within(self, days, now=None):
+        now = now or time.time()
+        deadline = now + days * 86400
+        return sorted(
+            (c for c in self.certificates.values()
+             if c.status == "valid" and c.expires_at is not None and c.expires_at <= deadline),
+            key=lambda c: c.expires_at
+        )
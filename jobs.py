@@ -0,0 +1,156 @@
+import asyncio
+import fcntl
+import json
+import os
+import time
+import uuid
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass, field, asdict
+from typing import Optional
+
+from db import save_job, get_job_data
+
+logger = logging.getLogger(__name__)
+
+# easy-rsa правит index.txt и serial без блокировок, поэтому команды PKI по умолчанию идут по одной
+JOB_CONCURRENCY = 1
+JOB_HISTORY = 500
+COMMAND_TIMEOUT = 300
+PKI_LOCK_RETRY = 0.2
+
+
+class CommandError(Exception):
+    def __init__(self, cmd, returncode, stderr):
+        super().__init__(f"Command failed with exit code {returncode}: {stderr}")
+        self.cmd = cmd
+        self.returncode = returncode
+        self.stderr = stderr
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    status: str = "queued"
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    total: int = 0
+    done: int = 0
+    results: list = field(default_factory=list)
+    error: Optional[str] = None
+
+    def as_dict(self):
+        return asdict(self)
+
+
+class JobRunner:
+    # Выполняет долгие команды easy-rsa в фоне с ограничением параллельности и хранит их статус.
+    # Статус пишется в базу, чтобы /api/jobs/{id} отвечал с любого воркера; семафор действует внутри процесса,
+    # а между воркерами команды PKI разводит flock на каталоге lock_path
+    def __init__(self, concurrency=JOB_CONCURRENCY, history=JOB_HISTORY, lock_path=None):
+        self.concurrency = concurrency
+        self.history = history
+        self.lock_path = lock_path
+        self._slots = None
+        self._jobs = OrderedDict()
+        self._tasks = set()
+
+    @property
+    def slots(self):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.concurrency)
+        return self._slots
+
+    async def _lock_pki(self):
+        fd = os.open(self.lock_path, os.O_RDONLY)
+        try:
+            while True:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    return fd
+                except BlockingIOError:
+                    await asyncio.sleep(PKI_LOCK_RETRY)
+        except BaseException:
+            os.close(fd)
+            raise
+
+    async def run_command(self, cmd, input=None, timeout=COMMAND_TIMEOUT):
+        async with self.slots:
+            try:
+                lock_fd = await self._lock_pki() if self.lock_path else None
+            except OSError as e:
+                raise CommandError(cmd, -1, f"cannot lock {self.lock_path}: {e}")
+            try:
+                stdout, stderr, returncode = await self._exec(cmd, input, timeout)
+            finally:
+                if lock_fd is not None:
+                    # Закрытие дескриптора снимает flock
+                    os.close(lock_fd)
+        if returncode != 0:
+            raise CommandError(cmd, returncode, stderr.decode(errors="replace").strip())
+        return stdout.decode(errors="replace")
+
+    async def _exec(self, cmd, input, timeout):
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.PIPE if input is not None else asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(
+                process.communicate(input.encode() if input is not None else None), timeout
+            )
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            raise CommandError(cmd, -1, f"timed out after {timeout}s")
+        return stdout, stderr, process.returncode
+
+    async def submit(self, kind, func, total=1):
+        job = Job(id=uuid.uuid4().hex, kind=kind, total=total)
+        await self._save(job)
+        self._jobs[job.id] = job
+        while len(self._jobs) > self.history:
+            self._jobs.popitem(last=False)
+        task = asyncio.create_task(self._run(job, func))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    async def record(self, job, result):
+        job.results.append(result)
+        job.done += 1
+        await self._save(job)
+
+    async def _save(self, job):
+        await save_job(job.id, job.created_at, json.dumps(job.as_dict()), self.history)
+
+    async def _run(self, job, func):
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            await self._save(job)
+            await func(job)
+            job.status = "failed" if any(r.get("status") == "failed" for r in job.results) else "succeeded"
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+            logger.error(f"Job {job.kind} {job.id} failed: {e}")
+        finally:
+            job.finished_at = time.time()
+            logger.info(f"Job {job.kind} {job.id} {job.status}: {job.done}/{job.total}")
+            try:
+                await self._save(job)
+            except Exception as e:
+                logger.error(f"Error saving job {job.id} result: {e}")
+
+    async def get(self, job_id):
+        # Задачи этого воркера - из памяти, задачи других воркеров - из базы
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job.as_dict()
+        data = await get_job_data(job_id)
+        return json.loads(data) if data else None
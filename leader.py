@@ -0,0 +1,78 @@
+import asyncio
+import fcntl
+import os
+import socket
+import time
+import logging
+from contextlib import asynccontextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderElection:
+    # Лидер - процесс, удерживающий flock на файле рядом с базой. Блокировку снимает ядро при завершении
+    # процесса, поэтому после падения лидера её получает следующий воркер при ближайшей попытке
+    def __init__(self, path, retry_interval=1.0):
+        self.path = path
+        self.retry_interval = retry_interval
+        self.holder_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._fd = None
+        self.stats = {"role": "follower", "holder": self.holder_id, "elected_at": None, "attempts": 0}
+
+    @property
+    def is_leader(self):
+        return self._fd is not None
+
+    def try_acquire(self):
+        if self._fd is not None:
+            return True
+        self.stats["attempts"] += 1
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        # Кто держит блокировку - для диагностики, на выборы содержимое файла не влияет
+        os.ftruncate(fd, 0)
+        os.write(fd, f"{self.holder_id} {int(time.time())}\n".encode())
+        self._fd = fd
+        self.stats.update(role="leader", elected_at=time.time())
+        return True
+
+    def current_leader(self):
+        try:
+            with open(self.path) as f:
+                return f.read().split(" ")[0] or None
+        except OSError:
+            return None
+
+    async def wait_for_leadership(self):
+        while not self.try_acquire():
+            await asyncio.sleep(self.retry_interval)
+        logger.info(f"Elected as poller leader ({self.holder_id}) via {self.path}")
+
+    def release(self):
+        if self._fd is None:
+            return
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+        self._fd = None
+        self.stats["role"] = "follower"
+
+    def info(self):
+        return {**self.stats, "leader": self.holder_id if self.is_leader else self.current_leader()}
+
+
+@asynccontextmanager
+async def startup_lock(path):
+    # Миграции при старте выполняет один воркер за раз: остальные ждут flock и находят схему уже обновлённой.
+    # Блокирующий flock ждёт в потоке, чтобы не останавливать event loop
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        await asyncio.to_thread(fcntl.flock, fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
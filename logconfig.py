@@ -0,0 +1,122 @@
+import atexit
+import copy
+import fcntl
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import time
+
+from metrics import LOG_RECORDS_DROPPED
+
+TEXT_FORMAT = '%(asctime)s - [%(levelname)s] [M: %(module)s] [Fun: %(funcName)s] - %(message)s'
+DATE_FORMAT = '%d.%m.%Y %H:%M:%S'
+QUEUE_SIZE = 10000
+
+_listener = None
+_rotation_fd = None
+_exception_formatter = logging.Formatter()
+
+
+class JsonFormatter(logging.Formatter):
+    # Одна запись - одна JSON-строка, для сборщиков логов (Loki, Elasticsearch)
+    def format(self, record):
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "function": record.funcName,
+            "message": record.getMessage(),
+        }
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    # Запись в лог не должна блокировать event loop: при переполненной очереди запись отбрасывается
+    def prepare(self, record):
+        # Сообщение и трассировка форматируются здесь (аргументы могут измениться после вызова),
+        # но трассировка остаётся отдельным полем для JSON-формата
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+
+def parse_levels(value):
+    # "db=DEBUG,sources=WARNING,uvicorn.access=WARNING"
+    levels = {}
+    for item in filter(None, (part.strip() for part in (value or "").split(","))):
+        name, _, level = item.partition("=")
+        levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def acquire_rotation(path):
+    # Файл лога общий для всех воркеров uvicorn, а ротирует его только процесс, удержавший flock на path.lock.
+    # Остальные пишут через WatchedFileHandler и переоткрывают файл, когда владелец его переименует
+    global _rotation_fd
+    if _rotation_fd is not None:
+        return True
+    fd = os.open(f"{path}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        return False
+    _rotation_fd = fd
+    return True
+
+
+def setup_logging(path, level="INFO", fmt="text", module_levels=None, max_bytes=10 * 1024 * 1024, backups=5):
+    # Обработчики с файловым вводом-выводом работают в потоке QueueListener, в event loop только постановка в очередь
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+
+    formatter = JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT, datefmt=DATE_FORMAT)
+    handlers = [logging.StreamHandler()]
+    if path:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if acquire_rotation(path):
+            handlers.append(logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups,
+                                                                 encoding='utf-8'))
+        else:
+            handlers.append(logging.handlers.WatchedFileHandler(path, encoding='utf-8'))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(QUEUE_SIZE)
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(DroppingQueueHandler(log_queue))
+    root.setLevel(level.upper())
+    for name, module_level in (module_levels or {}).items():
+        logging.getLogger(name).setLevel(module_level)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers)
+    _listener.start()
+    return _listener
+
+
+def stop_logging():
+    # Дописывает оставшиеся в очереди записи
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
@@ -1,311 +1,874 @@
 from starlette import status as statushttp
-from auth import create_access_token, get_current_active_user, User, get_current_user
-from security import verify_password
+from auth import create_access_token, get_current_active_user, User, get_current_user, get_api_user
+from security import verify_password_async, HashingBusy
 from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
-from fastapi import FastAPI, Request, Form, HTTPException, Depends
-from fastapi.responses import RedirectResponse
+from typing import Optional
+from fastapi import FastAPI, Request, Form, HTTPException, Depends, Query, UploadFile, File
+from fastapi.responses import RedirectResponse, StreamingResponse, Response
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.templating import Jinja2Templates
-from fastapi.staticfiles import StaticFiles
-from db import init_db, add_connection, update_connection_disconnect, update_connection_traffic, get_all_connections, \
-    add_user_db, remove_user_db, get_all_users_from_db, get_credentials_from_db
-import subprocess
+from fastapi.middleware.gzip import GZipMiddleware
+from db import open_db, init_db, close_db, get_connections_page, get_open_connections, apply_connection_changes, \
+    evict_traffic, get_top_talkers, get_traffic_series, get_daily_usage, stream_sessions, stream_usage_report, \
+    SESSION_EXPORT_COLUMNS, USAGE_REPORT_COLUMNS, evict_analytics, get_concurrency_peaks, get_session_histograms, \
+    get_session_flags, publish_snapshots, get_snapshot_versions, get_published_snapshots, add_user_db, add_users_db, remove_user_db, remove_users_db, \
+    get_all_users_from_db, get_credentials_from_db, get_session_events, get_last_session_event, evict_session_events, \
+    publish_metrics, get_published_metrics
+from reconcile import TIME_FORMAT, ReconcilePlan, build_plan, sessions_to_close
+from sources import load_sources
+from snapshot import StatusSnapshot
+from leader import LeaderElection, startup_lock
+from zabbix import ZabbixExporter
+from events import EventBroadcaster, diff_status, format_sse
+from jobs import JobRunner, CommandError
+from scheduler import PollScheduler, TaskSupervisor
+from analytics import SessionAnalytics, HISTOGRAMS, GLOBAL_KEY, format_le
+from retention import RetentionJob, parse_window, list_archives, query_archive
+from metrics import REGISTRY, CONTENT_TYPE as METRICS_CONTENT_TYPE, CLIENT_RECEIVED_BYTES, CLIENT_SENT_BYTES, \
+    CONNECTED_CLIENTS, SERVER_UP, OPEN_SESSIONS, SESSIONS_OPENED, SESSIONS_CLOSED, POLL_STAGE_SECONDS, \
+    TEMPLATE_RENDER_SECONDS, POLLER_METRICS, measure_loop_lag
+from inventory import CertificateInventory
+from dashboard import DashboardData, CachedStaticFiles, asset_versions, cached_response, content_etag
+from logconfig import setup_logging, parse_levels
 import os
-import asyncio
+import io
 import re
+import csv
+import json
+import shutil
+import asyncio
+import time
 import logging
-
-# Настройка логирования
-LOG_PATH = "/app/log/server.log"
-print("Log dir: {}".format(os.path.dirname(LOG_PATH)))
-os.makedirs(os.path.dirname(LOG_PATH), exist_ok=True)
-file_log = logging.FileHandler(LOG_PATH, encoding='utf-8')
-console_out = logging.StreamHandler()
-logging.basicConfig(handlers=(file_log, console_out), level=logging.INFO,
-                    format='%(asctime)s - [%(levelname)s] [M: %(module)s] [Fun: %(funcName)s] - %(message)s',
-                    datefmt='%d.%m.%Y %H:%M:%S')
+from collections import Counter
+from types import MappingProxyType
+
+# Настройка логирования: запись в файл и консоль идёт в отдельном потоке через очередь
+APP_LOG_PATH = os.environ.get("LOG_FILE", "/app/log/server.log")
+setup_logging(
+    APP_LOG_PATH,
+    level=os.environ.get("LOG_LEVEL", "INFO"),
+    fmt=os.environ.get("LOG_FORMAT", "text"),
+    # Уровни отдельных модулей: LOG_LEVELS="db=DEBUG,sources=WARNING"
+    module_levels=parse_levels(os.environ.get("LOG_LEVELS")),
+    max_bytes=int(os.environ.get("LOG_MAX_BYTES", str(10 * 1024 * 1024))),
+    backups=int(os.environ.get("LOG_BACKUPS", "5")),
+)
 logger = logging.getLogger(__name__)
 
+def format_epoch(value):
+    if value is None:
+        return None
+    return datetime.fromtimestamp(value).strftime(TIME_FORMAT)
+
 #Token Scheme
 sysadmin_scheme = OAuth2PasswordBearer(tokenUrl="Akellavk")
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     try:
-        await init_db()
+        await open_db()
+        # Все воркеры uvicorn стартуют одновременно; схему обновляет тот, кто первым взял блокировку
+        async with startup_lock(f"{LEADER_LOCK_PATH}.migrate"):
+            await init_db()
         logger.info("Database initialized successfully")
     except Exception as e:
         logger.error(f"Failed to initialize database: {e}")
         raise
-    asyncio.create_task(update_connections_periodically())
+    # Упавшая фоновая задача перезапускается, а не останавливает опрос до рестарта контейнера
+    supervisor.start("loop_lag", measure_loop_lag)
+    # При uvicorn --workers N опрос, экспорт и обслуживание базы выполняет только избранный воркер
+    supervisor.start("leadership", run_leadership)
     yield
+    await supervisor.stop()
+    election.release()
+    await close_db()
+
+def start_leader_tasks():
+    global leader_tasks_started
+    if leader_tasks_started:
+        return
+    leader_tasks_started = True
+    supervisor.start("poller", poll_scheduler.run)
+    supervisor.start("traffic_eviction", evict_traffic_periodically)
+    supervisor.start("zabbix", zabbix_exporter.run)
+    supervisor.start("retention", retention_job.run)
+    for source in sources:
+        if source.management is not None:
+            supervisor.start(f"management:{source.id}", source.management.run)
+
+async def run_leadership():
+    if not election.is_leader:
+        follower = asyncio.create_task(follow_leader())
+        try:
+            await election.wait_for_leadership()
+        finally:
+            follower.cancel()
+            await asyncio.gather(follower, return_exceptions=True)
+        # Новый лидер продолжает версии снимков предыдущего, чтобы ETag и рассылка воркеров не путались,
+        # и рассылает события, записанные прежним лидером после последней синхронизации
+        await sync_from_leader()
+    start_leader_tasks()
+    await asyncio.Event().wait()
+
+async def follow_leader():
+    while True:
+        try:
+            await sync_from_leader()
+        except Exception as e:
+            logger.error(f"Failed to read state published by the leader: {e}")
+        await asyncio.sleep(FOLLOWER_SYNC_INTERVAL)
 
 app = FastAPI(lifespan=lifespan)
 templates = Jinja2Templates(directory="templates")
-app.mount("/static", StaticFiles(directory="static"), name="static")
+app.mount("/static", CachedStaticFiles(directory="static"), name="static")
+# SSE (text/event-stream) GZipMiddleware не сжимает
+app.add_middleware(GZipMiddleware, minimum_size=1024)
 
 LOG_PATH = "/var/log/openvpn/server.log"
 EVENT_LOG_PATH = "/var/log/openvpn.log"
 INDEX_PATH = "/etc/openvpn/easy-rsa/keys/index.txt"
-ZABBIX_SENDER = "/usr/bin/zabbix_sender"
 ZABBIX_SERVER = os.environ.get("ZABBIX_SERVER", "your-zabbix-server-ip:10051")
 ZABBIX_HOSTNAME = os.environ.get("ZABBIX_HOSTNAME", "vpn-server")
-
-async def update_connections_periodically():
+ZABBIX_INTERVAL = int(os.environ.get("ZABBIX_INTERVAL", "60"))
+POLL_INTERVAL = float(os.environ.get("POLL_INTERVAL", "5"))
+# changes - цикл выполняется только при изменении файла статуса или уведомлении management-интерфейса,
+# interval - на каждом тике
+POLL_MODE = os.environ.get("POLL_MODE", "changes")
+# Даже без изменений цикл выполняется не реже этого интервала (закрытие сессий по таймауту, восстановление источников)
+POLL_MAX_IDLE = float(os.environ.get("POLL_MAX_IDLE", "60"))
+MANAGEMENT_ADDRESS = os.environ.get("MANAGEMENT_ADDRESS")
+MANAGEMENT_PASSWORD = os.environ.get("MANAGEMENT_PASSWORD")
+# JSON-файл со списком серверов OpenVPN; без него используется один сервер с путями выше
+SERVERS_CONFIG = os.environ.get("SERVERS_CONFIG")
+# Сколько ждать файл статуса или лог одного сервера, прежде чем пропустить его в этом цикле
+SOURCE_TIMEOUT = float(os.environ.get("SOURCE_TIMEOUT", "3"))
+# Блокировка, которой воркеры uvicorn выбирают единственного поллера, и как часто её пытаются взять остальные
+LEADER_LOCK_PATH = os.environ.get("LEADER_LOCK", "/app/db/poller.lock")
+LEADER_RETRY = float(os.environ.get("LEADER_RETRY", str(min(1.0, POLL_INTERVAL / 2))))
+# Как часто воркер-последователь проверяет новые снимки лидера
+FOLLOWER_SYNC_INTERVAL = float(os.environ.get("FOLLOWER_SYNC_INTERVAL", "1"))
+# Как часто лидер публикует метрики поллера для /metrics остальных воркеров
+METRICS_PUBLISH_INTERVAL = float(os.environ.get("METRICS_PUBLISH_INTERVAL", "15"))
+# Сколько хранятся события открытия и закрытия сессий, по которым последователи рассылают history
+SESSION_EVENTS_RETENTION = 86400
+# Сколько имён клиентов приводить в сводках лога
+LOG_SAMPLE_SIZE = 10
+# Пауза после уведомления management-интерфейса, чтобы собрать пачку событий в один цикл
+MANAGEMENT_DEBOUNCE = 0.2
+
+STREAM_KEEPALIVE = 15
+KEYS_DIR = "/etc/openvpn/easy-rsa/keys"
+ADDCLIENT_CMD = os.environ.get("OPENVPN_ADDCLIENT", "/usr/local/bin/openvpn-addclient")
+REVOKE_CMD = os.environ.get("OPENVPN_REVOKE", "/usr/local/bin/openvpn-revoke")
+# Массовый отзыв вызывает easy-rsa напрямую, чтобы пересобрать CRL один раз на пачку
+EASYRSA_BIN = os.environ.get("EASYRSA_BIN", "/usr/share/easy-rsa/easyrsa")
+OPENVPN_CRL = os.environ.get("OPENVPN_CRL", "/etc/openvpn/crl.pem")
+USERNAME_PATTERN = re.compile(r"^[A-Za-z0-9_.@][A-Za-z0-9_.@-]*$")
+MAX_BULK_USERS = 1000
+TRAFFIC_EVICTION_INTERVAL = 3600
+# Аналитика сессий: сколько хранить пики и флаги, пороги переподключений и всплесков трафика
+ANALYTICS_RETENTION_DAYS = int(os.environ.get("ANALYTICS_RETENTION_DAYS", "400"))
+ANALYTICS_STORM_THRESHOLD = int(os.environ.get("ANALYTICS_STORM_THRESHOLD", "10"))
+ANALYTICS_SPIKE_FACTOR = float(os.environ.get("ANALYTICS_SPIKE_FACTOR", "4"))
+# Закрытые сессии старше RETENTION_DAYS переносятся в помесячные архивы (0 - хранить всё в основной базе)
+RETENTION_DAYS = int(os.environ.get("RETENTION_DAYS", "180"))
+ARCHIVE_DIR = os.environ.get("ARCHIVE_DIR", "/app/db/archive")
+# Часы низкой нагрузки (локальное время), в которые работают архивация и сжатие базы
+RETENTION_WINDOW = os.environ.get("RETENTION_WINDOW", "2-5")
+RETENTION_BATCH = int(os.environ.get("RETENTION_BATCH", "5000"))
+# /metrics отдаёт CN и трафик клиентов, поэтому требует вход в панель или заголовок Authorization: Bearer <METRICS_TOKEN>.
+# Анонимный сбор - только при явном METRICS_PUBLIC=1
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+METRICS_PUBLIC = os.environ.get("METRICS_PUBLIC", "0") == "1"
+# Одновременных потоковых выгрузок; каждая держит своё соединение с базой
+EXPORT_MAX_CONCURRENT = int(os.environ.get("EXPORT_MAX_CONCURRENT", "2"))
+EXPORT_MEDIA_TYPES = {"csv": "text/csv; charset=utf-8", "ndjson": "application/x-ndjson"}
+
+broadcaster = EventBroadcaster()
+dashboard_data = DashboardData()
+election = LeaderElection(LEADER_LOCK_PATH, LEADER_RETRY)
+leader_tasks_started = False
+# Версии снимков, уже записанных в status_snapshots
+stored_snapshot_versions = {}
+# Последнее разосланное событие из session_events; None - ещё не читали
+session_event_cursor = None
+metrics_published_at = 0
+shell_pages = {}
+active_exports = 0
+job_runner = JobRunner(lock_path=os.path.dirname(INDEX_PATH))
+zabbix_exporter = ZabbixExporter(ZABBIX_SERVER, ZABBIX_HOSTNAME, interval=ZABBIX_INTERVAL)
+
+# Если у сервера задан адрес management-интерфейса, его сессии отслеживаются по уведомлениям, а не по файлу статуса.
+# Уведомления всех серверов будят общий цикл поллера
+sources_changed = asyncio.Event()
+published_snapshots = {}
+EMPTY_SNAPSHOT = StatusSnapshot()
+sources = load_sources(SERVERS_CONFIG, LOG_PATH, EVENT_LOG_PATH, MANAGEMENT_ADDRESS, MANAGEMENT_PASSWORD,
+                       wakeup=sources_changed)
+
+async def evict_traffic_periodically():
     while True:
-        await update_connections()
-        await asyncio.sleep(5)
-
-async def update_connections():
-    status = await parse_openvpn_status()
-    now = datetime.now()
-    now_str = now.strftime("%Y-%m-%d %H:%M:%S")
-    logger.info(f"Updating connections at {now_str}, active clients: {len(status['stats'])}")
-
-    for client in status["stats"]:
-        await update_connection_traffic(
-            client["common_name"],
-            client["bytes_received"],
-            client["bytes_sent"],
-            client["updated"]
-        )
+        now = time.time()
+        await evict_traffic(now)
+        await evict_analytics(now, ANALYTICS_RETENTION_DAYS * 86400)
+        session_analytics.evict(now)
+        await evict_session_events(now - SESSION_EVENTS_RETENTION)
+        await asyncio.sleep(TRAFFIC_EVICTION_INTERVAL)
 
-        connections = await get_all_connections()
-        if not any(c["common_name"] == client["common_name"] and c["disconnected_at"] is None for c in connections):
-            await add_connection(
-                client["common_name"],
-                client["connected_since"],
-                client["updated"]
-            )
-            logger.info(f"Added new connection for {client['common_name']} at {client['connected_since']}")
-
-    active_users = {c["common_name"] for c in status["stats"]}
-    connections = await get_all_connections()
-    disconnect_times = await parse_disconnect_times()
-
-    for c in connections:
-        if c["disconnected_at"] is None and c["common_name"] not in active_users:
-            disconnected_at = disconnect_times.get(c["common_name"], None)
-            if disconnected_at:
-                disconnected_at_dt = datetime.strptime(disconnected_at, "%Y-%m-%d %H:%M:%S")
-                logger.info(f"Found disconnect time for {c['common_name']}: {disconnected_at}")
-            else:
-                # Корректировка на keepalive (30 секунд)
-                disconnected_at_dt = now - timedelta(seconds=15)
-                disconnected_at = disconnected_at_dt.strftime("%Y-%m-%d %H:%M:%S")
-                logger.warning(f"No disconnect time found for {c['common_name']}, using {disconnected_at}")
-
-            connected_at_dt = datetime.strptime(c["connected_at"], "%Y-%m-%d %H:%M:%S")
-            duration_minutes = max(0, int((disconnected_at_dt - connected_at_dt).total_seconds() // 60))
-
-            await update_connection_disconnect(
-                c["common_name"],
-                disconnected_at,
-                duration_minutes,
-                c["bytes_received"],
-                c["bytes_sent"]
-            )
-            logger.info(f"Updated disconnect for {c['common_name']}: {disconnected_at}, duration: {duration_minutes} minutes")
-
-async def parse_disconnect_times():
-    disconnect_times = {}
-    if not os.path.exists(EVENT_LOG_PATH):
-        logger.error(f"Event log {EVENT_LOG_PATH} does not exist")
-        return disconnect_times
+async def sources_have_changes():
+    changes = await asyncio.gather(*(source.has_changes(SOURCE_TIMEOUT) for source in sources))
+    return any(changes)
 
+async def update_connections():
+    started = time.perf_counter()
+    # Серверы опрашиваются параллельно; зависший или недоступный не задерживает остальные
+    refreshed = await asyncio.gather(*(source.refresh(SOURCE_TIMEOUT) for source in sources))
+    # Сессии сервера, статус которого не удалось получить, не трогаем до следующего цикла
+    live = [source for source, ok in zip(sources, refreshed) if ok]
+    for source, ok in zip(sources, refreshed):
+        if not ok:
+            logger.warning(f"Skipping server {source.id} in this cycle, its sessions stay open")
+    parsed = time.perf_counter()
+    now = time.time()
+
+    open_sessions = {}
+    for session in await get_open_connections():
+        open_sessions.setdefault(session["server_id"], []).append(session)
+
+    async def plan_for(source):
+        sessions = open_sessions.get(source.id, [])
+        stats = source.snapshots.current.stats
+        # Лог событий читаем только если есть сессии для закрытия
+        disconnect_times = await source.disconnect_times(SOURCE_TIMEOUT) if sessions_to_close(sessions, stats) else {}
+        return build_plan(sessions, stats, disconnect_times, now, source.id)
+
+    # Планы серверов объединяются и применяются одной транзакцией
+    plan = ReconcilePlan("*")
+    for server_plan in await asyncio.gather(*(plan_for(source) for source in live)):
+        plan.extend(server_plan)
+    planned = time.perf_counter()
+
+    history = plan_history(plan)
     try:
-        with open(EVENT_LOG_PATH, 'r') as f:
-            lines = f.readlines()
+        await apply_connection_changes(plan.traffic_updates, plan.new_connections, plan.disconnects,
+                                       plan.traffic_deltas, now, [(*event, int(now)) for event in history])
     except Exception as e:
-        logger.error(f"Error reading event log: {e}")
-        return disconnect_times
-
-    # Парсим строки вида: "2025-08-15 18:12:59 us=133072 akellavk_m/192.168.1.1:4716 [akellavk_m] Inactivity timeout (--ping-restart), restarting"
-    pattern = re.compile(r"(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}).*? (\S+?)(?:/\d+\.\d+\.\d+\.\d+:\d+)? \[(\S+?)] Inactivity timeout")
-    for line in lines:
-        match = pattern.search(line)
-        if match:
-            timestamp = datetime.strptime(match.group(1), "%Y-%m-%d %H:%M:%S")
-            common_name = match.group(2).split('/')[-1]  # Извлекаем common_name
-            disconnect_times[common_name] = timestamp.strftime("%Y-%m-%d %H:%M:%S")
-            logger.debug(f"Parsed disconnect for {common_name}: {disconnect_times[common_name]}")
-
-    return disconnect_times
-
-async def parse_openvpn_status():
-    if not os.path.exists(LOG_PATH):
-        logger.error(f"Log file {LOG_PATH} does not exist")
-        return {"clients": 0, "stats": []}
-
+        logger.error(f"Failed to apply reconcile cycle: {e}")
+        return None
+    finished = time.perf_counter()
+
+    log_closed_sessions(plan)
+
+    status = current_status()
+    publish_changes(history)
+    dashboard_data.update({source.id: source.snapshots.current for source in sources})
+    await store_snapshots()
+    metrics = {
+        "vpn.connected_clients": status["clients"],
+        "vpn.sessions.open": sum(len(s) for s in open_sessions.values()) + len(plan.new_connections) - len(plan.disconnects),
+        "vpn.sessions.new": len(plan.new_connections),
+        "vpn.sessions.closed": len(plan.disconnects),
+        "vpn.poll.duration_ms": round((finished - started) * 1000, 2),
+        "vpn.servers.unavailable": len(sources) - len(live),
+    }
+    for source in sources:
+        metrics[f"vpn.server.clients[{source.id}]"] = source.snapshots.current.clients
+    zabbix_exporter.collect(metrics)
+    zabbix_exporter.collect_traffic(status["stats"])
+    update_metrics(live, plan, status, metrics["vpn.sessions.open"])
+    await store_poller_metrics(now)
+    await session_analytics.record_cycle([s for server in open_sessions.values() for s in server], plan, now)
+    exported = time.perf_counter()
+
+    timings = {
+        "parse_ms": round((parsed - started) * 1000, 2),
+        "reconcile_ms": round((planned - parsed) * 1000, 2),
+        "commit_ms": round((finished - planned) * 1000, 2),
+        "export_ms": round((exported - finished) * 1000, 2),
+        "total_ms": round((exported - started) * 1000, 2),
+    }
+    # Циклы без подключений и отключений пишутся только на уровне DEBUG
+    level = logging.INFO if plan.new_connections or plan.disconnects else logging.DEBUG
+    logger.log(
+        level,
+        f"Reconcile cycle: {len(live)}/{len(sources)} servers, {status['clients']} active, {len(plan.new_connections)} new, "
+        f"{len(plan.traffic_updates)} traffic updates, {len(plan.disconnects)} closed in {timings['total_ms']} ms "
+        f"(parse {timings['parse_ms']} ms, reconcile {timings['reconcile_ms']} ms, commit {timings['commit_ms']} ms, "
+        f"export {timings['export_ms']} ms)"
+    )
+    for stage in ("parse", "reconcile", "commit", "export", "total"):
+        POLL_STAGE_SECONDS.observe(timings[f"{stage}_ms"] / 1000, stage=stage)
+    if exported - started > POLL_INTERVAL / 2:
+        logger.warning(f"Reconcile cycle took {timings['total_ms']} ms, more than half of the {POLL_INTERVAL}s poll interval")
+    return timings
+
+def log_closed_sessions(plan):
+    # Одна сводка за цикл вместо строки на каждого клиента; подробности по сессиям - на уровне DEBUG
+    if plan.estimated:
+        names = [f"{common_name}@{server_id}" for server_id, common_name in plan.estimated]
+        logger.warning(f"No disconnect time found for {len(names)} sessions, using keepalive fallback: "
+                       f"{', '.join(names[:LOG_SAMPLE_SIZE])}{' ...' if len(names) > LOG_SAMPLE_SIZE else ''}")
+    if not plan.closed:
+        return
+    by_id = {source.id: source for source in sources}
+    reasons = Counter()
+    for server_id, common_name, disconnected_at in plan.closed:
+        reason = by_id[server_id].disconnect_reason(common_name) or "unknown reason"
+        reasons[reason] += 1
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Closed session for {common_name} on {server_id} at {format_epoch(disconnected_at)} ({reason})")
+    logger.info(f"Closed {len(plan.closed)} sessions: "
+                f"{', '.join(f'{reason}: {count}' for reason, count in reasons.most_common())}")
+
+def update_metrics(live, plan, status, open_sessions):
+    # Метрики обновляет поллер, /metrics только отдаёт готовые значения
+    # Подключения с одним CN (duplicate-cn) различаются только Client ID, в метрике их счётчики складываются
+    received, sent = Counter(), Counter()
+    for c in status["stats"]:
+        received[(c["server_id"], c["common_name"])] += c["bytes_received"]
+        sent[(c["server_id"], c["common_name"])] += c["bytes_sent"]
+    CLIENT_RECEIVED_BYTES.replace(({"server": server, "common_name": name}, value) for (server, name), value in received.items())
+    CLIENT_SENT_BYTES.replace(({"server": server, "common_name": name}, value) for (server, name), value in sent.items())
+    live_ids = {source.id for source in live}
+    for source in sources:
+        CONNECTED_CLIENTS.set(source.snapshots.current.clients, server=source.id)
+        SERVER_UP.set(1 if source.id in live_ids else 0, server=source.id)
+    OPEN_SESSIONS.set(open_sessions)
+    for connection in plan.new_connections:
+        SESSIONS_OPENED.inc(server=connection[5])
+    for server_id, _, _ in plan.closed:
+        SESSIONS_CLOSED.inc(server=server_id)
+
+async def store_snapshots():
+    # Лидер публикует изменившиеся снимки в базу, остальные воркеры читают их оттуда
+    changed = [source for source in sources
+               if source.snapshots.current.version != stored_snapshot_versions.get(source.id)]
+    if not changed:
+        return
+    rows = [(source.id, snapshot.version, snapshot.clients, json.dumps([dict(c) for c in snapshot.stats], ensure_ascii=False),
+             snapshot.parsed_at, snapshot.parse_ms, election.holder_id)
+            for source, snapshot in ((source, source.snapshots.current) for source in changed)]
     try:
-        with open(LOG_PATH, 'r') as f:
-            lines = f.readlines()
+        await publish_snapshots(rows)
     except Exception as e:
-        logger.error(f"Error reading log file: {e}")
-        return {"clients": 0, "stats": []}
-
-    clients = []
-    in_clients = False
-    total_clients = 0
-    logger.debug(f"Log lines: {lines[:10]}")
-
-    for line in lines:
-        line = line.strip()
-        if line.startswith("HEADER,ROUTING_TABLE"):
-            break
-        if in_clients:
-            if line.startswith("CLIENT_LIST"):
-                try:
-                    parts = line.split(',')
-                    if len(parts) >= 9:
-                        bytes_received = int(parts[5]) / (1024 * 1024)
-                        bytes_sent = int(parts[6]) / (1024 * 1024)
-                        updated = datetime.fromtimestamp(int(parts[8])).strftime("%Y-%m-%d %H:%M:%S") if len(parts) > 8 and parts[8].isdigit() else datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                        clients.append({
-                            "common_name": parts[1],
-                            "real_address": parts[2],
-                            "bytes_received": round(bytes_received, 2),
-                            "bytes_sent": round(bytes_sent, 2),
-                            "connected_since": parts[7],
-                            "updated": updated
-                        })
-                        total_clients += 1
-                    else:
-                        logger.warning(f"Skipping invalid line: {line}")
-                except Exception as e:
-                    logger.error(f"Error parsing line '{line}': {e}")
-        if line.startswith("HEADER,CLIENT_LIST"):
-            in_clients = True
-
-    logger.info(f"Parsed {total_clients} clients: {clients}")
-    return {"clients": total_clients, "stats": clients}
-
-async def get_all_users():
-    users = []
-    if not os.path.exists(INDEX_PATH):
-        logger.error(f"Index file {INDEX_PATH} does not exist")
-        return users
-
+        logger.error(f"Failed to publish status snapshots for other workers: {e}")
+        return
+    for row in rows:
+        stored_snapshot_versions[row[0]] = row[1]
+
+async def sync_published_snapshots():
+    versions = await get_snapshot_versions()
+    changed = {source.id: source for source in sources
+               if source.id in versions and versions[source.id] != source.snapshots.current.version}
+    if not changed:
+        return False
+    for row in await get_published_snapshots(list(changed)):
+        changed[row["server_id"]].snapshots.adopt(StatusSnapshot(
+            version=row["version"],
+            clients=row["clients"],
+            stats=tuple(MappingProxyType(client) for client in json.loads(row["stats"])),
+            parsed_at=row["parsed_at"],
+            parse_ms=row["parse_ms"],
+        ))
+        stored_snapshot_versions[row["server_id"]] = row["version"]
+    return True
+
+async def sync_from_leader():
+    # События читаются по курсору seq; при первом чтении курсор встаёт на последнее событие, старые не рассылаются
+    global session_event_cursor
+    if session_event_cursor is None:
+        session_event_cursor = await get_last_session_event()
+    events = await get_session_events(session_event_cursor)
+    if events:
+        session_event_cursor = events[-1]["seq"]
+    if await sync_published_snapshots() or events:
+        publish_changes([(e["server_id"], e["common_name"], e["kind"], e["at"]) for e in events])
+        dashboard_data.update({source.id: source.snapshots.current for source in sources})
+
+async def store_poller_metrics(now):
+    global metrics_published_at
+    if now - metrics_published_at < METRICS_PUBLISH_INTERVAL:
+        return
     try:
-        with open(INDEX_PATH, 'r') as f:
-            for line in f:
-                if line.startswith("V"):
-                    parts = line.split('\t')
-                    if len(parts) >= 5:
-                        common_name = parts[-1].split('/CN=')[-1].strip()
-                        if common_name.lower() != "server":
-                            users.append({"common_name": common_name, "is_connected": False})
+        await publish_metrics("poller", REGISTRY.render(include=POLLER_METRICS), now, election.holder_id)
     except Exception as e:
-        logger.error(f"Error reading index file: {e}")
-        return users
-
-    status = await parse_openvpn_status()
+        logger.error(f"Failed to publish poller metrics for other workers: {e}")
+        return
+    metrics_published_at = now
+
+def current_status():
+    # Сводный статус всех серверов из их последних снимков
+    stats = [client for source in sources for client in source.snapshots.current.stats]
+    return {"clients": len(stats), "stats": stats}
+
+def plan_history(plan):
+    # (server_id, common_name, kind, at) - открытия и закрытия сессий цикла, в таком виде они же пишутся в session_events
+    return [(c[5], c[0], "opened", c[1]) for c in plan.new_connections] + \
+        [(server_id, name, "closed", at) for server_id, name, at in plan.closed]
+
+def publish_changes(history=()):
+    # Подписчикам уходят только изменения с последней рассылки. Сравниваем с разосланным снимком, а не с
+    # начальным снимком цикла: обновление, завершившееся после таймаута, попадает в следующую рассылку
+    current = {source.id: source.snapshots.current for source in sources}
+    changed = [server_id for server_id, snapshot in current.items()
+               if snapshot.version != published_snapshots.get(server_id, EMPTY_SNAPSHOT).version]
+    changes = diff_status(
+        [client for server_id in changed for client in published_snapshots.get(server_id, EMPTY_SNAPSHOT).stats],
+        [client for server_id in changed for client in current[server_id].stats],
+    ) if changed else {}
+    published_snapshots.update(current)
+    opened = [{"server_id": server_id, "common_name": name, "connected_at": at}
+              for server_id, name, kind, at in history if kind == "opened"]
+    closed = [{"server_id": server_id, "common_name": name, "disconnected_at": at}
+              for server_id, name, kind, at in history if kind == "closed"]
+    if opened or closed:
+        changes["history"] = {"opened": opened, "closed": closed}
+    if any(changes.values()):
+        broadcaster.publish("update", {"clients": current_status()["clients"], **changes})
+
+cert_inventory = CertificateInventory(INDEX_PATH)
+supervisor = TaskSupervisor()
+session_analytics = SessionAnalytics(storm_threshold=ANALYTICS_STORM_THRESHOLD, spike_factor=ANALYTICS_SPIKE_FACTOR)
+retention_job = RetentionJob(ARCHIVE_DIR, RETENTION_DAYS, parse_window(RETENTION_WINDOW), RETENTION_BATCH)
+poll_scheduler = PollScheduler(
+    update_connections,
+    POLL_INTERVAL,
+    has_changes=sources_have_changes if POLL_MODE == "changes" else None,
+    wakeup=sources_changed if any(source.management is not None for source in sources) else None,
+    debounce=MANAGEMENT_DEBOUNCE,
+    max_idle=POLL_MAX_IDLE,
+)
+
+def render_template(name, context):
+    # Jinja2Templates рендерит шаблон при создании ответа
+    with TEMPLATE_RENDER_SECONDS.time(template=name):
+        return templates.TemplateResponse(name, context)
+
+def shell_page(name):
+    # Страница без данных рендерится один раз; ссылки на статику содержат хеш файла
+    if name not in shell_pages:
+        versions = asset_versions("static")
+        with TEMPLATE_RENDER_SECONDS.time(template=name):
+            body = templates.get_template(name).render(
+                static=lambda asset: f"/static/{asset}?v={versions.get(asset, '')}"
+            ).encode()
+        shell_pages[name] = (body, content_etag(body))
+    return shell_pages[name]
+
+async def get_all_users(status):
+    await cert_inventory.refresh()
     connected_users = {client["common_name"] for client in status["stats"]}
-    for user in users:
-        user["is_connected"] = user["common_name"] in connected_users
-
-    try:
-        user_data = await get_all_users_from_db()
-        for user in users:
-            for data in user_data:
-                if data["common_name"] == user["common_name"]:
-                    user["email"] = data.get("email", "")
-                    user["description"] = data.get("description", "")
-                    break
-            else:
-                user["email"] = ""
-                user["description"] = ""
-    except Exception as e:
-        logger.error(f"Error reading users from DB: {e}")
+    user_data = {u["common_name"]: u for u in await get_all_users_from_db()}
 
+    users = []
+    for cert in cert_inventory.by_status("valid"):
+        if cert.common_name.lower() == "server":
+            continue
+        data = user_data.get(cert.common_name, {})
+        users.append({
+            "common_name": cert.common_name,
+            "is_connected": cert.common_name in connected_users,
+            "expires_at": cert.expires_at,
+            "email": data.get("email") or "",
+            "description": data.get("description") or "",
+        })
     return sorted(users, key=lambda x: x["common_name"])
 
-async def send_to_zabbix(metrics):
-    try:
-        for key, value in metrics.items():
-            cmd = [
-                ZABBIX_SENDER,
-                "-z", ZABBIX_SERVER.split(":")[0],
-                "-p", ZABBIX_SERVER.split(":")[1] if ":" in ZABBIX_SERVER else "10051",
-                "-s", ZABBIX_HOSTNAME,
-                "-k", key,
-                "-o", str(value)
-            ]
-            subprocess.run(cmd, check=True, capture_output=True, text=True)
-            logger.info(f"Sent to Zabbix: {key} = {value}")
-    except subprocess.CalledProcessError as e:
-        logger.error(f"Zabbix sender error: {e.stderr}")
-    except Exception as e:
-        logger.error(f"Error sending to Zabbix: {e}")
-
 @app.get("/")
 async def dashboard(request: Request, current_user: User = Depends(get_current_user)):
     if not current_user:
         return RedirectResponse(url="/login")
 
-    status = await parse_openvpn_status()
-    all_users = await get_all_users()
-    connections = await get_all_connections()
-    metrics = {"vpn.connected_clients": status["clients"]}
-    await send_to_zabbix(metrics)
-    return templates.TemplateResponse("dashboard.html", {
-        "request": request,
-        "status": status,
-        "all_users": all_users,
-        "connections": connections
-    })
+    # Оболочка статична, данные страница получает из /api/dashboard и /api/users
+    body, etag = shell_page("dashboard.html")
+    return cached_response(request, body, etag, "text/html; charset=utf-8")
+
+@app.get("/api/dashboard")
+async def api_dashboard(request: Request, current_user: User = Depends(get_api_user)):
+    # Обычно данные уже собраны поллером; до первого цикла собираются здесь
+    dashboard_data.update({source.id: source.snapshots.current for source in sources})
+    return dashboard_data.response(request)
+
+@app.get("/api/users")
+async def api_users(request: Request, current_user: User = Depends(get_api_user)):
+    body = json.dumps(await get_all_users(current_status()), ensure_ascii=False).encode()
+    return cached_response(request, body, content_etag(body), "application/json")
+
+@app.get("/api/status")
+async def api_status(current_user: User = Depends(get_api_user)):
+    status = current_status()
+    return {
+        "clients": status["clients"],
+        "servers": [source.info() for source in sources],
+        "poller": poll_scheduler.stats,
+        "task_restarts": supervisor.restarts,
+        "retention": retention_job.stats,
+        "analytics": session_analytics.stats,
+        "leader": election.info(),
+        "zabbix": zabbix_exporter.stats,
+        "subscribers": broadcaster.subscribers,
+        "stats": [dict(client) for client in status["stats"]]
+    }
+
+@app.get("/metrics")
+async def metrics(request: Request, current_user: Optional[User] = Depends(get_current_user)):
+    token_valid = METRICS_TOKEN and request.headers.get("Authorization") == f"Bearer {METRICS_TOKEN}"
+    if not (METRICS_PUBLIC or token_valid or current_user is not None):
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+    if election.is_leader:
+        return Response(REGISTRY.render(), media_type=METRICS_CONTENT_TYPE)
+    # Серии поллера есть только у лидера: остальные воркеры отдают его последнюю публикацию и свои метрики
+    published = await get_published_metrics("poller")
+    poller = f"# Poller metrics published by {published['published_by']} at {int(published['published_at'])}\n" \
+        f"{published['body']}" if published else ""
+    return Response(poller + REGISTRY.render(exclude=POLLER_METRICS), media_type=METRICS_CONTENT_TYPE)
+
+@app.get("/api/certificates")
+async def api_certificates(state: Optional[str] = Query(None, pattern="^(valid|revoked|expired)$"),
+                           current_user: User = Depends(get_api_user)):
+    await cert_inventory.refresh()
+    certificates = cert_inventory.by_status(state) if state else list(cert_inventory.certificates.values())
+    return {"items": [c.as_dict() for c in sorted(certificates, key=lambda c: c.common_name)]}
+
+@app.get("/api/certificates/expiring")
+async def api_certificates_expiring(days: int = Query(30, ge=0, le=3650), current_user: User = Depends(get_api_user)):
+    await cert_inventory.refresh()
+    return {"days": days, "items": [c.as_dict() for c in cert_inventory.expiring_within(days)]}
+
+@app.get("/api/stream")
+async def api_stream(request: Request, current_user: User = Depends(get_api_user)):
+    subscriber = broadcaster.subscribe()
+
+    def snapshot_event():
+        status = current_status()
+        return format_sse("snapshot", broadcaster.version, {
+            "clients": status["clients"],
+            "stats": [dict(client) for client in status["stats"]]
+        })
+
+    async def stream():
+        try:
+            yield snapshot_event()
+            while True:
+                try:
+                    event, event_id, data = await asyncio.wait_for(subscriber.queue.get(), STREAM_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keepalive\n\n"
+                    continue
+                # После переполнения очереди клиент получает полный снимок вместо пропущенных изменений
+                yield snapshot_event() if event == "resync" else format_sse(event, event_id, data)
+        finally:
+            broadcaster.unsubscribe(subscriber)
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def parse_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        first, second = cursor.split(":")
+        return int(first), int(second)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@app.get("/api/connections")
+async def api_connections(limit: int = Query(50, ge=1, le=500), cursor: Optional[str] = None, user: Optional[str] = None,
+                          since: Optional[int] = None, until: Optional[int] = None,
+                          state: Optional[str] = Query(None, pattern="^(open|closed)$"), server: Optional[str] = None,
+                          current_user: User = Depends(get_api_user)):
+    rows, next_position = await get_connections_page(limit, parse_cursor(cursor), user, since, until, state, server)
+    return {
+        "items": rows,
+        "next_cursor": f"{next_position[0]}:{next_position[1]}" if next_position else None
+    }
+
+@app.get("/api/traffic/top")
+async def api_traffic_top(since: Optional[int] = None, until: Optional[int] = None, limit: int = Query(10, ge=1, le=100),
+                          current_user: User = Depends(get_api_user)):
+    until = until or int(time.time())
+    since = since if since is not None else until - 86400
+    if since >= until:
+        raise HTTPException(status_code=400, detail="since must be before until")
+    return {"since": since, "until": until, "items": await get_top_talkers(since, until, limit)}
+
+@app.get("/api/traffic/series")
+async def api_traffic_series(since: Optional[int] = None, until: Optional[int] = None, user: Optional[str] = None,
+                             current_user: User = Depends(get_api_user)):
+    until = until or int(time.time())
+    since = since if since is not None else until - 3600
+    if since >= until:
+        raise HTTPException(status_code=400, detail="since must be before until")
+    bucket_seconds, points = await get_traffic_series(since, until, user)
+    return {"since": since, "until": until, "bucket_seconds": bucket_seconds, "points": points}
+
+@app.get("/api/archive")
+async def api_archive(current_user: User = Depends(get_api_user)):
+    return {"retention_days": RETENTION_DAYS, "months": await asyncio.to_thread(list_archives, ARCHIVE_DIR)}
+
+@app.get("/api/archive/connections")
+async def api_archive_connections(since: int, until: int, limit: int = Query(50, ge=1, le=500), cursor: Optional[str] = None,
+                                  user: Optional[str] = None, server: Optional[str] = None,
+                                  current_user: User = Depends(get_api_user)):
+    # Архивные месяцы открываются по запросу, только на чтение
+    if since >= until:
+        raise HTTPException(status_code=400, detail="since must be before until")
+    rows, next_position = await asyncio.to_thread(
+        query_archive, ARCHIVE_DIR, since, until, user, server, limit, parse_cursor(cursor)
+    )
+    return {
+        "items": rows,
+        "next_cursor": f"{next_position[0]}:{next_position[1]}" if next_position else None
+    }
+
+@app.get("/api/usage/daily")
+async def api_usage_daily(since: Optional[int] = None, until: Optional[int] = None, user: Optional[str] = None,
+                          server: Optional[str] = None, current_user: User = Depends(get_api_user)):
+    until = until or int(time.time())
+    since = since if since is not None else until - 30 * 86400
+    if since >= until:
+        raise HTTPException(status_code=400, detail="since must be before until")
+    return {"since": since, "until": until, "items": await get_daily_usage(since, until, user, server)}
+
+async def encode_rows(batches, columns, fmt):
+    # Пачки строк из курсора кодируются по одной: память не зависит от размера выгрузки
+    try:
+        if fmt == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(columns)
+            async for rows in batches:
+                writer.writerows(rows)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            if buffer.tell():
+                yield buffer.getvalue()
+        else:
+            async for rows in batches:
+                yield "".join(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n" for row in rows)
+    finally:
+        await batches.aclose()
+
+class ExportResponse(StreamingResponse):
+    # Слот освобождается по завершении ответа, а не в finally генератора: если клиент ушёл до первой пачки,
+    # генератор не запускается и его finally не выполнится
+    async def __call__(self, scope, receive, send):
+        global active_exports
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            active_exports -= 1
+
+def export_response(batches, columns, fmt, name):
+    # Слот занимается до возврата ответа, без await между проверкой и увеличением счётчика
+    global active_exports
+    if active_exports >= EXPORT_MAX_CONCURRENT:
+        raise HTTPException(status_code=429, detail="Too many exports in progress")
+    active_exports += 1
+    filename = f"{name}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.{fmt}"
+    return ExportResponse(encode_rows(batches, columns, fmt), media_type=EXPORT_MEDIA_TYPES[fmt],
+                          headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+@app.get("/api/export/sessions")
+async def api_export_sessions(format: str = Query("csv", pattern="^(csv|ndjson)$"), since: Optional[int] = None,
+                              until: Optional[int] = None, user: Optional[str] = None, server: Optional[str] = None,
+                              state: Optional[str] = Query(None, pattern="^(open|closed)$"),
+                              current_user: User = Depends(get_api_user)):
+    if since is not None and until is not None and since >= until:
+        raise HTTPException(status_code=400, detail="since must be before until")
+    return export_response(stream_sessions(since, until, user, server, state), SESSION_EXPORT_COLUMNS, format, "sessions")
+
+@app.get("/api/reports/usage")
+async def api_usage_report(format: str = Query("csv", pattern="^(csv|ndjson)$"),
+                           period: str = Query("month", pattern="^(day|month)$"), since: Optional[int] = None,
+                           until: Optional[int] = None, user: Optional[str] = None, server: Optional[str] = None,
+                           current_user: User = Depends(get_api_user)):
+    until = until or int(time.time())
+    since = since if since is not None else until - 30 * 86400
+    if since >= until:
+        raise HTTPException(status_code=400, detail="since must be before until")
+    return export_response(stream_usage_report(since, until, period, user, server), USAGE_REPORT_COLUMNS, format,
+                           f"usage-{period}")
+
+@app.get("/api/analytics/concurrency")
+async def api_analytics_concurrency(since: Optional[int] = None, until: Optional[int] = None, user: Optional[str] = None,
+                                    current_user: User = Depends(get_api_user)):
+    # Почасовые пики одновременных сессий: пользователя или всех вместе
+    until = until or int(time.time())
+    since = since if since is not None else until - 7 * 86400
+    if since >= until:
+        raise HTTPException(status_code=400, detail="since must be before until")
+    return {"since": since, "until": until, "user": user, "points": await get_concurrency_peaks(since, until, user or GLOBAL_KEY)}
+
+@app.get("/api/analytics/histograms")
+async def api_analytics_histograms(since: Optional[int] = None, until: Optional[int] = None,
+                                   current_user: User = Depends(get_api_user)):
+    until = until or int(time.time())
+    since = since if since is not None else until - 30 * 86400
+    if since >= until:
+        raise HTTPException(status_code=400, detail="since must be before until")
+    counts = {(row["metric"], row["le"]): row["count"] for row in await get_session_histograms(since, until)}
+    return {
+        "since": since,
+        "until": until,
+        "histograms": {
+            metric: [{"le": format_le(le), "count": counts.get((metric, format_le(le)), 0)} for le in buckets]
+            for metric, buckets in HISTOGRAMS.items()
+        },
+    }
+
+@app.get("/api/analytics/flags")
+async def api_analytics_flags(since: Optional[int] = None, user: Optional[str] = None,
+                              kind: Optional[str] = Query(None, pattern="^(reconnect_storm|traffic_spike)$"),
+                              limit: int = Query(100, ge=1, le=1000), current_user: User = Depends(get_api_user)):
+    since = since if since is not None else int(time.time()) - 7 * 86400
+    return {"since": since, "items": await get_session_flags(since, limit, user, kind)}
+
+def check_sysadmin_token(token):
+    if not token:
+        raise HTTPException(status_code=400, detail="Token is required")
+    if token != os.environ.get("AKELLAVK_TKN"):
+        raise HTTPException(status_code=403, detail="Invalid bearer token")
+
+def ovpn_exists(username):
+    return os.path.exists(os.path.join(KEYS_DIR, f"{username}.ovpn"))
+
+async def add_user_job(job, username, email, description):
+    await job_runner.run_command([ADDCLIENT_CMD, username, email])
+    await add_user_db(username, email, description)
+    await job_runner.record(job, {"username": username, "status": "added"})
+    logger.info(f"User {username} added successfully")
+
+async def revoke_user_job(job, username):
+    await job_runner.run_command([REVOKE_CMD, username], input="yes\n")
+    await remove_user_db(username)
+    await job_runner.record(job, {"username": username, "status": "revoked"})
+    logger.info(f"User {username} revoked successfully")
+
+async def bulk_add_job(job, rows):
+    added = []
+    for username, email, description in rows:
+        if ovpn_exists(username):
+            result = {"username": username, "status": "skipped", "error": "already exists"}
+        else:
+            try:
+                await job_runner.run_command([ADDCLIENT_CMD, username, email])
+                added.append((username, email, description))
+                result = {"username": username, "status": "added"}
+            except CommandError as e:
+                result = {"username": username, "status": "failed", "error": str(e)}
+        await job_runner.record(job, result)
+    # Записи в таблицу users - одной пачкой после выпуска всех сертификатов
+    await add_users_db(added)
+
+def install_crl():
+    # OpenVPN читает CRL при каждом подключении, поэтому файл заменяется целиком
+    tmp_path = f"{OPENVPN_CRL}.tmp"
+    shutil.copyfile(os.path.join(KEYS_DIR, "crl.pem"), tmp_path)
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, OPENVPN_CRL)
+
+def remove_ovpn_files(usernames):
+    for username in usernames:
+        try:
+            os.remove(os.path.join(KEYS_DIR, f"{username}.ovpn"))
+        except FileNotFoundError:
+            pass
+
+async def bulk_revoke_job(job, rows):
+    # Сертификаты отзываются без gen-crl, CRL пересобирается и устанавливается один раз после всех отзывов.
+    # Как и openvpn-revoke, удаляем .ovpn, иначе ovpn_exists не даст добавить пользователя повторно
+    revoked = []
+    for username, _, _ in rows:
+        try:
+            await job_runner.run_command([EASYRSA_BIN, "--batch", "revoke", username])
+            revoked.append(username)
+            result = {"username": username, "status": "revoked"}
+        except CommandError as e:
+            result = {"username": username, "status": "failed", "error": str(e)}
+        await job_runner.record(job, result)
+    if not revoked:
+        return
+    await job_runner.run_command([EASYRSA_BIN, "gen-crl"])
+    await asyncio.to_thread(install_crl)
+    await asyncio.to_thread(remove_ovpn_files, revoked)
+    await remove_users_db(revoked)
+
+def parse_users_csv(content):
+    rows = []
+    for record in csv.reader(io.StringIO(content)):
+        if not record or not record[0].strip() or record[0].strip().lower() == "username":
+            continue
+        username = record[0].strip()
+        if not USERNAME_PATTERN.match(username):
+            raise HTTPException(status_code=400, detail=f"Недопустимое имя пользователя: {username}")
+        email = record[1].strip() if len(record) > 1 else ""
+        description = record[2].strip() if len(record) > 2 else ""
+        rows.append((username, email, description))
+    if len(rows) > MAX_BULK_USERS:
+        raise HTTPException(status_code=400, detail=f"Не более {MAX_BULK_USERS} пользователей за раз")
+    return rows
 
 @app.post("/add_user")
 async def add_user(token: str = Depends(sysadmin_scheme), username: str = Form(...), email: str = Form(""), description: str = Form(""), current_user: User = Depends(get_current_active_user)):
+    # Имя уходит аргументом в openvpn-addclient, поэтому проверяется до запуска задачи
+    if not USERNAME_PATTERN.match(username):
+        raise HTTPException(status_code=400, detail=f"Недопустимое имя пользователя: {username}")
     try:
         if not current_user:
             return RedirectResponse(url="/login", status_code=statushttp.HTTP_303_SEE_OTHER)
-        if not token:
-            raise HTTPException(status_code=400, detail="Token is required")
-        if token != os.environ.get("AKELLAVK_TKN"):
-            raise HTTPException(status_code=403, detail="Invalid bearer token")
+        check_sysadmin_token(token)
         # Проверяем, существует ли файл .ovpn
-        ovpn_file = f"/etc/openvpn/easy-rsa/keys/{username}.ovpn"
-        if os.path.exists(ovpn_file):
+        if ovpn_exists(username):
             logger.error(f"User {username} already exists (OVPN file found)")
             raise HTTPException(status_code=400, detail=f"Пользователь {username} уже существует")
         else:
             logger.info(f"Пользователя не существует, добавляю {username}")
 
-        # Выполняем команду openvpn-addclient
-        cmd = ["/usr/local/bin/openvpn-addclient", username, email]
-        result = subprocess.run(cmd, check=True, capture_output=True, text=True)
-        await add_user_db(username, email, description)
-        logger.info(f"User {username} added successfully")
-        return {"message": f"Пользователь {username} добавлен успешно"}
-    except subprocess.CalledProcessError as e:
-        logger.error(f"Add user failed: {e.stderr}")
-        return {"error": f"Command failed with exit code {e.returncode}: {e.stderr}"}
+        # openvpn-addclient выполняется в фоне, статус доступен через /api/jobs/{id}
+        job = await job_runner.submit("add_user", lambda job: add_user_job(job, username, email, description))
+        return {"message": f"Добавление пользователя {username} запущено", "job_id": job.id}
     except Exception as e:
         logger.error(f"Add user error: {e}")
         return {"error": str(e)}
 
 @app.post("/revoke_user")
 async def revoke_user(token: str = Depends(sysadmin_scheme),username: str = Form(...), current_user: User = Depends(get_current_active_user)):
+    # Имя уходит аргументом в openvpn-revoke, поэтому проверяется до запуска задачи
+    if not USERNAME_PATTERN.match(username):
+        raise HTTPException(status_code=400, detail=f"Недопустимое имя пользователя: {username}")
     try:
         if not current_user:
             return RedirectResponse(url="/login", status_code=statushttp.HTTP_303_SEE_OTHER)
-        if not token:
-            raise HTTPException(status_code=400, detail="Token is required")
-        if token != os.environ.get("AKELLAVK_TKN"):
-            raise HTTPException(status_code=403, detail="Invalid bearer token")
-        subprocess.run(["/usr/local/bin/openvpn-revoke", username], input="yes\n", text=True, check=True, capture_output=True)
-        await remove_user_db(username)
-        logger.info(f"User {username} revoked successfully")
-        return {"message": f"Пользователь {username} удален успешно"}
-    except subprocess.CalledProcessError as e:
-        logger.error(f"Revoke user failed: {e.stderr}")
-        return {"error": f"Command failed with exit code {e.returncode}: {e.stderr}"}
+        check_sysadmin_token(token)
+        job = await job_runner.submit("revoke_user", lambda job: revoke_user_job(job, username))
+        return {"message": f"Удаление пользователя {username} запущено", "job_id": job.id}
     except Exception as e:
         logger.error(f"Revoke user error: {e}")
         return {"error": str(e)}
 
+@app.post("/api/users/bulk", status_code=statushttp.HTTP_202_ACCEPTED)
+async def bulk_users(token: str = Depends(sysadmin_scheme), action: str = Form(..., pattern="^(add|revoke)$"),
+                     file: UploadFile = File(...), current_user: User = Depends(get_api_user)):
+    check_sysadmin_token(token)
+    rows = parse_users_csv((await file.read()).decode("utf-8-sig"))
+    if not rows:
+        raise HTTPException(status_code=400, detail="CSV не содержит пользователей")
+    func = bulk_add_job if action == "add" else bulk_revoke_job
+    job = await job_runner.submit(f"bulk_{action}", lambda job: func(job, rows), total=len(rows))
+    return {"job_id": job.id, "total": len(rows)}
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str, current_user: User = Depends(get_api_user)):
+    job = await job_runner.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
 
 @app.post("/token")
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
@@ -317,8 +880,15 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
             detail="Incorrect username or password",
         )
 
-    # Проверяем пароль и статус пользователя
-    if not verify_password(form_data.password, user_data["password"]) or user_data["disabled"]:
+    # Проверяем пароль и статус пользователя (bcrypt в пуле потоков)
+    try:
+        password_ok = await verify_password_async(form_data.password, user_data["password"])
+    except HashingBusy:
+        raise HTTPException(
+            status_code=statushttp.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many login attempts, try again later",
+        )
+    if not password_ok or user_data["disabled"]:
         raise HTTPException(
             status_code=statushttp.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -343,7 +913,7 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
 
 @app.get("/login")
 async def login_page(request: Request):
-    return templates.TemplateResponse("login.html", {"request": request})
+    return render_template("login.html", {"request": request})
 
 @app.get("/logout")
 async def logout():
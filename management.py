@@ -0,0 +1,194 @@
+import asyncio
+import time
+import logging
+from collections import OrderedDict
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+BYTECOUNT_INTERVAL = 5
+RECONNECT_DELAY = 1
+RECONNECT_DELAY_MAX = 30
+MAX_DISCONNECTS = 10000
+
+
+def _format_time(epoch):
+    return datetime.fromtimestamp(epoch).strftime(TIME_FORMAT)
+
+
+class ManagementClient:
+    # Клиент management-интерфейса OpenVPN: ведёт список клиентов по уведомлениям
+    # >CLIENT:ESTABLISHED/DISCONNECT и >BYTECOUNT_CLI вместо чтения файла статуса
+    def __init__(self, address, password=None, bytecount_interval=BYTECOUNT_INTERVAL, changed=None):
+        self.address = address
+        self.password = password
+        self.bytecount_interval = bytecount_interval
+        self.connected = False
+        # Список клиентов полон только после ответа на "status 3" в текущем подключении
+        self.synced = False
+        self.revision = 0
+        # Несколько клиентов могут будить один общий цикл опроса
+        self.changed = changed if changed is not None else asyncio.Event()
+        self._clients = {}
+        self._disconnects = OrderedDict()
+        self._env_event = None
+        self._env = {}
+        self._in_status = False
+        self._status_clients = None
+        self._writer = None
+
+    async def _open(self):
+        if self.address.startswith("unix:"):
+            return await asyncio.open_unix_connection(self.address[len("unix:"):])
+        host, _, port = self.address.rpartition(":")
+        return await asyncio.open_connection(host, int(port))
+
+    async def run(self):
+        delay = RECONNECT_DELAY
+        while True:
+            try:
+                reader, writer = await self._open()
+                self._writer = writer
+                self.connected = True
+                delay = RECONNECT_DELAY
+                logger.info(f"Connected to OpenVPN management interface at {self.address}")
+                if self.password:
+                    await self._send(self.password)
+                await self._send(f"bytecount {self.bytecount_interval}")
+                await self._send("status 3")
+                while True:
+                    line = await reader.readline()
+                    if not line:
+                        raise ConnectionError("management interface closed the connection")
+                    self.handle_line(line.decode("utf-8", errors="replace").rstrip("\r\n"))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"OpenVPN management interface error: {e}, reconnecting in {delay}s")
+            finally:
+                self.connected = False
+                self.synced = False
+                if self._writer is not None:
+                    self._writer.close()
+                    self._writer = None
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RECONNECT_DELAY_MAX)
+
+    async def _send(self, command):
+        self._writer.write(f"{command}\n".encode())
+        await self._writer.drain()
+
+    def _touch(self):
+        self.revision += 1
+        self.changed.set()
+
+    def handle_line(self, line):
+        if line.startswith(">CLIENT:ENV,"):
+            self._handle_env(line[len(">CLIENT:ENV,"):])
+        elif line.startswith(">CLIENT:"):
+            event, _, args = line[len(">CLIENT:"):].partition(",")
+            self._env_event = (event, args.split(",")[0])
+            self._env = {}
+        elif line.startswith(">BYTECOUNT_CLI:"):
+            self._handle_bytecount(line[len(">BYTECOUNT_CLI:"):])
+        elif line.startswith(">"):
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Management notification: {line}")
+        elif line.startswith("HEADER\tCLIENT_LIST"):
+            self._in_status = True
+            self._status_clients = {}
+        elif self._in_status and line.startswith("CLIENT_LIST\t"):
+            self._handle_status_client(line.split("\t"))
+        elif self._in_status and line == "END":
+            # Полная синхронизация после (пере)подключения к management-интерфейсу
+            self._in_status = False
+            self._clients = self._status_clients
+            self._status_clients = None
+            self.synced = True
+            self._touch()
+        elif line.startswith("ERROR:"):
+            logger.error(f"Management interface: {line}")
+
+    def _handle_status_client(self, parts):
+        # CLIENT_LIST, CN, Real Address, Virtual Address, Virtual IPv6 Address, Bytes Received, Bytes Sent,
+        # Connected Since, Connected Since (time_t), Username, Client ID, Peer ID
+        if len(parts) < 11:
+            return
+        connected_since = int(parts[8]) if parts[8].isdigit() else int(time.time())
+        self._status_clients[parts[10]] = {
+            "common_name": parts[1],
+            "real_address": parts[2],
+            "bytes_received": int(parts[5]),
+            "bytes_sent": int(parts[6]),
+            "connected_since": connected_since,
+            "client_id": int(parts[10]) if parts[10].isdigit() else None,
+        }
+
+    def _handle_env(self, pair):
+        if self._env_event is None:
+            return
+        if pair != "END":
+            name, _, value = pair.partition("=")
+            self._env[name] = value
+            return
+        event, cid = self._env_event
+        env = self._env
+        self._env_event = None
+        self._env = {}
+        if event == "ESTABLISHED":
+            connected_since = int(env["time_unix"]) if env.get("time_unix", "").isdigit() else int(time.time())
+            self._clients[cid] = {
+                "common_name": env.get("common_name", ""),
+                "real_address": f"{env.get('trusted_ip', '')}:{env.get('trusted_port', '')}",
+                "bytes_received": 0,
+                "bytes_sent": 0,
+                "connected_since": connected_since,
+                "client_id": int(cid) if cid.isdigit() else None,
+            }
+            self._touch()
+        elif event == "DISCONNECT":
+            client = self._clients.pop(cid, None)
+            common_name = env.get("common_name") or (client and client["common_name"])
+            if common_name:
+                self._disconnects[common_name] = _format_time(time.time())
+                self._disconnects.move_to_end(common_name)
+                if len(self._disconnects) > MAX_DISCONNECTS:
+                    self._disconnects.popitem(last=False)
+            self._touch()
+
+    def _handle_bytecount(self, args):
+        cid, _, counters = args.partition(",")
+        client = self._clients.get(cid)
+        received, _, sent = counters.partition(",")
+        if client is None or not received.isdigit() or not sent.isdigit():
+            return
+        client["bytes_received"] = int(received)
+        client["bytes_sent"] = int(sent)
+        self.revision += 1
+
+    @property
+    def ready(self):
+        return self.connected and self.synced
+
+    def disconnect_times(self):
+        return dict(self._disconnects)
+
+    def signature(self):
+        return self.revision
+
+    async def status(self):
+        # Тот же формат, что и у parse_openvpn_status
+        stats = []
+        for client in self._clients.values():
+            connected_since = _format_time(client["connected_since"])
+            stats.append({
+                "common_name": client["common_name"],
+                "real_address": client["real_address"],
+                "bytes_received": client["bytes_received"],
+                "bytes_sent": client["bytes_sent"],
+                "connected_since": connected_since,
+                "updated": connected_since,
+                "client_id": client["client_id"],
+            })
+        return {"clients": len(stats), "stats": stats}
@@ -0,0 +1,193 @@
+import asyncio
+import functools
+import math
+import time
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм в секундах
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LOOP_LAG_INTERVAL = 0.5
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    pairs.extend(f'{name}="{value}"' for name, value in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Metric {self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def replace(self, values):
+        # Поллер заменяет семейство целиком: серии отключившихся клиентов исчезают
+        self._values = {self._key(labels): value for labels, value in values}
+
+    def samples(self):
+        for key, value in self._values.items():
+            yield self.name, _format_labels(self.labelnames, key), value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(f"{name}{labels} {_format_value(value)}" for name, labels, value in self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value, **labels):
+        self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+        counts = state[0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        state[1] += value
+        state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        for key, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, (("le", _format_value(bound)),))
+                yield f"{self.name}_bucket", labels, cumulative
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, count
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self, include=None, exclude=()):
+        metrics = self._metrics if include is None else include
+        return "".join(metric.render() + "\n" for metric in metrics if metric not in exclude)
+
+
+REGISTRY = Registry()
+
+CLIENT_RECEIVED_BYTES = REGISTRY.register(Counter(
+    "openvpn_client_received_bytes_total", "Bytes received from the client in the current session",
+    ("server", "common_name")))
+CLIENT_SENT_BYTES = REGISTRY.register(Counter(
+    "openvpn_client_sent_bytes_total", "Bytes sent to the client in the current session",
+    ("server", "common_name")))
+CONNECTED_CLIENTS = REGISTRY.register(Gauge(
+    "openvpn_connected_clients", "Clients in the latest status snapshot", ("server",)))
+SERVER_UP = REGISTRY.register(Gauge(
+    "openvpn_server_up", "Whether the server status was read in the last poll cycle", ("server",)))
+OPEN_SESSIONS = REGISTRY.register(Gauge(
+    "openvpn_open_sessions", "Open sessions in the connections table"))
+SESSIONS_OPENED = REGISTRY.register(Counter(
+    "openvpn_sessions_opened_total", "Sessions opened by the poller", ("server",)))
+SESSIONS_CLOSED = REGISTRY.register(Counter(
+    "openvpn_sessions_closed_total", "Sessions closed by the poller", ("server",)))
+
+STATUS_PARSE_SECONDS = REGISTRY.register(Histogram(
+    "openvpn_dashboard_status_parse_seconds", "Time to read and parse a server status", ("server",)))
+POLL_STAGE_SECONDS = REGISTRY.register(Histogram(
+    "openvpn_dashboard_poll_stage_seconds", "Duration of poll cycle stages", ("stage",)))
+POLL_OVERRUNS = REGISTRY.register(Counter(
+    "openvpn_dashboard_poll_overruns_total", "Poll cycles that did not fit into the poll interval"))
+POLL_SKIPPED_TICKS = REGISTRY.register(Counter(
+    "openvpn_dashboard_poll_skipped_ticks_total", "Scheduler ticks skipped after overruns"))
+POLL_FAILURES = REGISTRY.register(Counter(
+    "openvpn_dashboard_poll_failures_total", "Poll cycles that failed"))
+# Семейства, которые обновляет только поллер лидера; остальные воркеры отдают их из опубликованной лидером копии
+POLLER_METRICS = (
+    CLIENT_RECEIVED_BYTES, CLIENT_SENT_BYTES, CONNECTED_CLIENTS, SERVER_UP, OPEN_SESSIONS, SESSIONS_OPENED,
+    SESSIONS_CLOSED, STATUS_PARSE_SECONDS, POLL_STAGE_SECONDS, POLL_OVERRUNS, POLL_SKIPPED_TICKS, POLL_FAILURES,
+)
+
+DB_QUERY_SECONDS = REGISTRY.register(Histogram(
+    "openvpn_dashboard_db_query_seconds", "Latency of database functions", ("function",)))
+TEMPLATE_RENDER_SECONDS = REGISTRY.register(Histogram(
+    "openvpn_dashboard_template_render_seconds", "Template render time", ("template",)))
+EVENT_LOOP_LAG_SECONDS = REGISTRY.register(Histogram(
+    "openvpn_dashboard_event_loop_lag_seconds", "Delay of event loop wakeups over the scheduled time"))
+LOG_RECORDS_DROPPED = REGISTRY.register(Counter(
+    "openvpn_dashboard_log_records_dropped_total", "Log records dropped because the log queue was full"))
+
+
+def timed(histogram, **labels):
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with histogram.time(**labels):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def db_timed(func):
+    return timed(DB_QUERY_SECONDS, function=func.__name__)(func)
+
+
+async def measure_loop_lag(interval=LOOP_LAG_INTERVAL):
+    # Насколько позже запланированного просыпается event loop: блокирующий код в обработчиках виден сразу
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG_SECONDS.observe(max(0.0, loop.time() - expected))
@@ -0,0 +1,127 @@
+from dataclasses import dataclass, field
+from datetime import datetime
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+# Корректировка на keepalive (секунды), если время отключения не найдено в логе
+KEEPALIVE_FALLBACK = 15
+
+
+def to_epoch(value):
+    # Время из файла статуса и лога событий - локальное, в формате TIME_FORMAT
+    return int(datetime.strptime(value, TIME_FORMAT).timestamp())
+
+
+@dataclass
+class ReconcilePlan:
+    server_id: str = "default"
+    traffic_updates: list = field(default_factory=list)
+    new_connections: list = field(default_factory=list)
+    disconnects: list = field(default_factory=list)
+    # (common_name, байт получено, байт отправлено) за цикл
+    traffic_deltas: list = field(default_factory=list)
+    # (server_id, common_name, disconnected_at) закрытых сессий
+    closed: list = field(default_factory=list)
+    # (server_id, common_name) без точного времени отключения (использован fallback)
+    estimated: list = field(default_factory=list)
+
+    def extend(self, other):
+        for name in ("traffic_updates", "new_connections", "disconnects", "traffic_deltas", "closed", "estimated"):
+            getattr(self, name).extend(getattr(other, name))
+        return self
+
+
+def counter_delta(previous, current):
+    # Счётчик OpenVPN начинается с нуля при переподключении: меньшее значение - весь трафик нового счётчика.
+    # Без прежнего значения (сессия до миграции сырых счётчиков) текущий счётчик только запоминается
+    if previous is None:
+        return 0
+    return current - previous if current >= previous else current
+
+
+def session_key(item):
+    # CN уникален только вместе с Client ID: при переподключении между циклами OpenVPN выдаёт новый ID
+    return item["common_name"], item.get("client_id")
+
+
+def match_sessions(open_sessions, clients):
+    # Сессии без client_id (записанные до его появления или из статуса без Client ID) сопоставляются по CN.
+    # Сессии отсортированы по id по убыванию: первая открытая строка на ключ - актуальная, остальные - дубли
+    current = {}
+    legacy = {}
+    stale = []
+    for s in sorted(open_sessions, key=lambda s: s["id"], reverse=True):
+        target, key = (current, session_key(s)) if s["client_id"] is not None else (legacy, s["common_name"])
+        if key in target:
+            stale.append(s)
+        else:
+            target[key] = s
+    matched = []
+    seen = set()
+    for client in clients:
+        key = session_key(client)
+        if key in seen:
+            continue
+        seen.add(key)
+        session = current.pop(key, None) or legacy.pop(client["common_name"], None)
+        matched.append((client, session))
+    stale.extend(current.values())
+    stale.extend(legacy.values())
+    return matched, stale
+
+
+def sessions_to_close(open_sessions, clients):
+    return match_sessions(open_sessions, clients)[1]
+
+
+def build_plan(open_sessions, clients, disconnect_times, now, server_id="default"):
+    # open_sessions и clients относятся к одному серверу: CN уникален только в его пределах.
+    # В сессии хранятся монотонные итоги (bytes_*) и последние значения счётчиков OpenVPN (counter_*):
+    # итог растёт на разницу счётчиков, а после сброса счётчика - на его новое значение
+    plan = ReconcilePlan(server_id)
+    matched, stale = match_sessions(open_sessions, clients)
+
+    for client, session in matched:
+        counters = (client["bytes_received"], client["bytes_sent"])
+        if session is None:
+            received, sent = counters
+        else:
+            received = counter_delta(session["counter_received"], counters[0])
+            sent = counter_delta(session["counter_sent"], counters[1])
+        if received or sent:
+            plan.traffic_deltas.append((client["common_name"], received, sent))
+
+        if session is None:
+            plan.new_connections.append((
+                client["common_name"],
+                to_epoch(client["connected_since"]),
+                counters[0],
+                counters[1],
+                to_epoch(client["updated"]),
+                server_id,
+                client.get("client_id")
+            ))
+        elif (session["counter_received"], session["counter_sent"]) != counters or \
+                session["client_id"] != client.get("client_id"):
+            plan.traffic_updates.append((
+                (session["bytes_received"] or 0) + received,
+                (session["bytes_sent"] or 0) + sent,
+                counters[0],
+                counters[1],
+                to_epoch(client["updated"]),
+                client.get("client_id"),
+                session["id"]
+            ))
+
+    for s in stale:
+        disconnected_at = disconnect_times.get(s["common_name"])
+        disconnected_at = to_epoch(disconnected_at) if disconnected_at else None
+        # Событие старше начала сессии относится к предыдущему подключению
+        if disconnected_at is None or disconnected_at < s["connected_at"]:
+            disconnected_at = int(now) - KEEPALIVE_FALLBACK
+            plan.estimated.append((server_id, s["common_name"]))
+
+        duration_minutes = max(0, (disconnected_at - s["connected_at"]) // 60)
+        plan.disconnects.append((disconnected_at, duration_minutes, disconnected_at, s["id"]))
+        plan.closed.append((server_id, s["common_name"], disconnected_at))
+
+    return plan
@@ -0,0 +1,285 @@
+import argparse
+import asyncio
+import os
+import re
+import sqlite3
+import time
+import logging
+from datetime import datetime
+
+import db
+from db import get_archivable_connections, delete_archived_connections, enable_incremental_vacuum, \
+    incremental_vacuum, checkpoint_wal, get_auto_vacuum, AUTO_VACUUM_INCREMENTAL
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_PATTERN = re.compile(r"^connections-(\d{4}-\d{2})\.db$")
+ARCHIVE_COLUMNS = ("id", "server_id", "common_name", "client_id", "connected_at", "disconnected_at",
+                   "duration_minutes", "bytes_received", "bytes_sent", "last_updated")
+# Версия формата архива в PRAGMA user_version: до 1 трафик хранился в МБ и не было client_id
+ARCHIVE_VERSION = 1
+MIB = 1024 * 1024
+ARCHIVE_TABLE = '''
+    CREATE TABLE IF NOT EXISTS {name} (
+        id INTEGER PRIMARY KEY,
+        server_id TEXT NOT NULL,
+        common_name TEXT NOT NULL,
+        client_id INTEGER,
+        connected_at INTEGER NOT NULL,
+        disconnected_at INTEGER,
+        duration_minutes INTEGER,
+        bytes_received INTEGER,
+        bytes_sent INTEGER,
+        last_updated INTEGER
+    )
+'''
+ARCHIVE_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_connections_connected ON connections (connected_at, id)",
+    "CREATE INDEX IF NOT EXISTS idx_connections_cn_connected ON connections (common_name, connected_at)",
+]
+ARCHIVE_UPGRADE = [
+    ARCHIVE_TABLE.format(name="connections_new"),
+    '''
+    INSERT INTO connections_new (id, server_id, common_name, connected_at, disconnected_at, duration_minutes,
+                                 bytes_received, bytes_sent, last_updated)
+    SELECT id, server_id, common_name, connected_at, disconnected_at, duration_minutes,
+           CAST(ROUND(bytes_received * 1048576) AS INTEGER), CAST(ROUND(bytes_sent * 1048576) AS INTEGER),
+           last_updated
+    FROM connections
+    ''',
+    "DROP TABLE connections",
+    "ALTER TABLE connections_new RENAME TO connections",
+]
+
+
+def month_of(epoch):
+    return time.strftime("%Y-%m", time.gmtime(epoch))
+
+
+def months_between(since, until):
+    year, month = map(int, month_of(since).split("-"))
+    last = month_of(max(since, until - 1))
+    months = []
+    while True:
+        current = f"{year:04d}-{month:02d}"
+        months.append(current)
+        if current >= last:
+            return months
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def archive_path(archive_dir, month):
+    return os.path.join(archive_dir, f"connections-{month}.db")
+
+
+def prepare_archive(conn):
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version >= ARCHIVE_VERSION:
+        return
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'connections'").fetchone()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        for statement in ARCHIVE_UPGRADE if exists else [ARCHIVE_TABLE.format(name="connections")]:
+            conn.execute(statement)
+        for statement in ARCHIVE_INDEXES:
+            conn.execute(statement)
+        conn.execute(f"PRAGMA user_version = {ARCHIVE_VERSION}")
+
+
+def legacy_row(row):
+    # Архив старого формата открыт только для чтения: трафик переводится из МБ при выдаче
+    row = dict(row)
+    for column in ("bytes_received", "bytes_sent"):
+        if row[column] is not None:
+            row[column] = int(round(row[column] * MIB))
+    row.setdefault("client_id", None)
+    return row
+
+
+def write_archive(archive_dir, rows):
+    # Сессии раскладываются по месячным базам по времени подключения (UTC).
+    # INSERT OR IGNORE: повтор пачки после сбоя до удаления из основной базы не создаёт дублей
+    os.makedirs(archive_dir, exist_ok=True)
+    by_month = {}
+    for row in rows:
+        by_month.setdefault(month_of(row["connected_at"]), []).append(tuple(row[c] for c in ARCHIVE_COLUMNS))
+    for month, values in by_month.items():
+        conn = sqlite3.connect(archive_path(archive_dir, month))
+        try:
+            prepare_archive(conn)
+            conn.executemany(
+                f"INSERT OR IGNORE INTO connections ({', '.join(ARCHIVE_COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(ARCHIVE_COLUMNS))})",
+                values
+            )
+            conn.commit()
+        finally:
+            conn.close()
+    return sorted(by_month)
+
+
+def list_archives(archive_dir):
+    if not os.path.isdir(archive_dir):
+        return []
+    archives = []
+    for name in sorted(os.listdir(archive_dir)):
+        match = ARCHIVE_PATTERN.match(name)
+        if match:
+            archives.append({"month": match.group(1), "size_bytes": os.path.getsize(os.path.join(archive_dir, name))})
+    return archives
+
+
+def query_archive(archive_dir, since, until, common_name=None, server_id=None, limit=50, cursor=None):
+    # Keyset-пагинация по (connected_at, id) от новых к старым, по месячным архивам в обратном порядке
+    conditions = ["connected_at >= ?", "connected_at < ?"]
+    params = [since, until]
+    if cursor is not None:
+        conditions.append("(connected_at, id) < (?, ?)")
+        params.extend(cursor)
+    if common_name:
+        conditions.append("common_name = ?")
+        params.append(common_name)
+    if server_id:
+        conditions.append("server_id = ?")
+        params.append(server_id)
+    query = (f"SELECT * FROM connections WHERE {' AND '.join(conditions)} "
+             "ORDER BY connected_at DESC, id DESC LIMIT ?")
+
+    rows = []
+    for month in reversed(months_between(since, until)):
+        path = archive_path(archive_dir, month)
+        if cursor is not None and month > month_of(cursor[0]):
+            continue
+        if not os.path.exists(path):
+            continue
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        conn.row_factory = sqlite3.Row
+        try:
+            convert = legacy_row if conn.execute("PRAGMA user_version").fetchone()[0] < ARCHIVE_VERSION else dict
+            rows.extend(convert(row) for row in conn.execute(query, params + [limit - len(rows)]))
+        finally:
+            conn.close()
+        if len(rows) >= limit:
+            break
+    next_cursor = (rows[-1]["connected_at"], rows[-1]["id"]) if len(rows) == limit else None
+    return rows, next_cursor
+
+
+def parse_window(value):
+    # "2-5" - с 02:00 до 05:00 по локальному времени; пустая строка - без ограничений
+    if not value:
+        return None
+    start, _, end = value.partition("-")
+    return int(start) % 24, int(end) % 24
+
+
+class RetentionJob:
+    # Переносит закрытые сессии старше retention_days в месячные архивы и сжимает основную базу.
+    # Работает только в окне низкой нагрузки и небольшими пачками: поллер получает блокировку записи между ними
+    def __init__(self, archive_dir, retention_days, window=None, batch_size=5000, vacuum_pages=1000,
+                 pause=0.5, check_interval=600):
+        self.archive_dir = archive_dir
+        self.retention_days = retention_days
+        self.window = window
+        self.batch_size = batch_size
+        self.vacuum_pages = vacuum_pages
+        self.pause = pause
+        self.check_interval = check_interval
+        self.stats = {
+            "retention_days": retention_days,
+            "last_run": None,
+            "last_archived": 0,
+            "archived_total": 0,
+            "last_vacuum_pages": 0,
+            "freelist_pages": None,
+            "auto_vacuum": None,
+            "last_error": None,
+        }
+
+    def in_window(self, now=None):
+        if self.window is None:
+            return True
+        hour = datetime.fromtimestamp(now or time.time()).hour
+        start, end = self.window
+        return start <= hour < end if start <= end else hour >= start or hour < end
+
+    async def run(self):
+        while True:
+            if self.retention_days > 0 and self.in_window():
+                try:
+                    await self.run_once()
+                except Exception as e:
+                    self.stats["last_error"] = str(e)
+                    logger.error(f"Retention run failed: {e}")
+            await asyncio.sleep(self.check_interval)
+
+    async def run_once(self, now=None):
+        cutoff = int(now or time.time()) - self.retention_days * 86400
+        archived = await self.archive_expired(cutoff)
+        pages = await self.compact()
+        self.stats.update(last_run=time.time(), last_archived=archived, last_vacuum_pages=pages, last_error=None)
+        self.stats["archived_total"] += archived
+        if archived or pages:
+            logger.info(f"Retention: archived {archived} sessions closed before {cutoff}, released {pages} pages")
+        return archived, pages
+
+    async def archive_expired(self, cutoff):
+        total = 0
+        while self.in_window():
+            rows = await get_archivable_connections(cutoff, self.batch_size)
+            if not rows:
+                break
+            months = await asyncio.to_thread(write_archive, self.archive_dir, rows)
+            await delete_archived_connections(rows)
+            total += len(rows)
+            logger.debug(f"Archived {len(rows)} sessions into {', '.join(months)}")
+            await asyncio.sleep(self.pause)
+        return total
+
+    async def compact(self):
+        mode = await get_auto_vacuum()
+        if mode != AUTO_VACUUM_INCREMENTAL:
+            # Полный VACUUM для смены режима не запускается сам: на большой базе он надолго блокирует запись
+            if self.stats["auto_vacuum"] != mode:
+                logger.warning("Database is not in incremental auto_vacuum mode, skipping compaction; "
+                               "run 'python retention.py enable-incremental-vacuum' in a maintenance window")
+            self.stats["auto_vacuum"] = mode
+            await checkpoint_wal()
+            return 0
+        self.stats["auto_vacuum"] = mode
+        total = 0
+        while self.in_window():
+            released, remaining = await incremental_vacuum(self.vacuum_pages)
+            total += released
+            self.stats["freelist_pages"] = remaining
+            if remaining == 0 or released == 0:
+                break
+            await asyncio.sleep(self.pause)
+        await checkpoint_wal()
+        return total
+
+
+async def convert_database(path):
+    db.DB_PATH = path
+    await db.init_db()
+    try:
+        if await enable_incremental_vacuum():
+            logger.info(f"{path} converted to incremental auto_vacuum")
+        else:
+            logger.info(f"{path} already uses incremental auto_vacuum")
+    finally:
+        await db.close_db()
+
+
+def main():
+    # Обслуживание при остановленном приложении: python retention.py enable-incremental-vacuum [--db PATH]
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=("enable-incremental-vacuum",))
+    parser.add_argument("--db", default=db.DB_PATH)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(convert_database(args.db))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import asyncio
+import time
+import logging
+
+from metrics import POLL_OVERRUNS, POLL_SKIPPED_TICKS, POLL_FAILURES
+
+logger = logging.getLogger(__name__)
+
+RESTART_DELAY = 1
+RESTART_DELAY_MAX = 60
+
+
+class PollScheduler:
+    # Запускает цикл поллера по фиксированной сетке тиков: длительность цикла не сдвигает следующий тик.
+    # Если цикл не уложился в интервал, пропущенные тики не догоняются, а учитываются в статистике
+    def __init__(self, cycle, interval, has_changes=None, wakeup=None, debounce=0.2, max_idle=60):
+        self.cycle = cycle
+        self.interval = interval
+        # В режиме по изменениям тик без изменений источников пропускается, но не дольше max_idle секунд подряд
+        self.has_changes = has_changes
+        self.wakeup = wakeup
+        self.debounce = debounce
+        self.max_idle = max_idle
+        self.stats = {
+            "mode": "changes" if has_changes is not None else "interval",
+            "interval": interval,
+            "ticks": 0,
+            "wakeups": 0,
+            "cycles": 0,
+            "idle": 0,
+            "overruns": 0,
+            "skipped_ticks": 0,
+            "failures": 0,
+            "last_error": None,
+            "lag_ms": 0.0,
+            "last_cycle_at": None,
+            "last_duration_ms": None,
+            "timings": {},
+        }
+
+    async def _wait(self, deadline):
+        loop = asyncio.get_running_loop()
+        timeout = max(0.0, deadline - loop.time())
+        if self.wakeup is None:
+            await asyncio.sleep(timeout)
+            return False
+        try:
+            await asyncio.wait_for(self.wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        # Пауза, чтобы собрать пачку уведомлений в один цикл
+        await asyncio.sleep(self.debounce)
+        self.wakeup.clear()
+        return True
+
+    async def _should_run(self, woken, started, last_cycle):
+        if woken or self.has_changes is None or last_cycle is None or started - last_cycle >= self.max_idle:
+            return True
+        try:
+            return await self.has_changes()
+        except Exception as e:
+            logger.error(f"Change check failed, running the cycle anyway: {e}")
+            return True
+
+    async def _run_cycle(self):
+        started = time.perf_counter()
+        try:
+            timings = await self.cycle()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Ошибка одного цикла не останавливает опрос
+            self.stats["failures"] += 1
+            self.stats["last_error"] = str(e)
+            POLL_FAILURES.inc()
+            logger.error(f"Poll cycle failed: {e}")
+            return
+        self.stats["cycles"] += 1
+        self.stats["last_cycle_at"] = time.time()
+        self.stats["last_duration_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        if timings is None:
+            self.stats["failures"] += 1
+            POLL_FAILURES.inc()
+        else:
+            self.stats["timings"] = timings
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        last_cycle = None
+        woken = False
+        while True:
+            started = loop.time()
+            if woken:
+                self.stats["wakeups"] += 1
+            else:
+                self.stats["ticks"] += 1
+                self.stats["lag_ms"] = round((started - next_tick) * 1000, 2)
+                next_tick += self.interval
+
+            if await self._should_run(woken, started, last_cycle):
+                await self._run_cycle()
+                last_cycle = started
+            else:
+                self.stats["idle"] += 1
+
+            finished = loop.time()
+            if finished > next_tick:
+                missed = int((finished - next_tick) // self.interval) + 1
+                self.stats["overruns"] += 1
+                self.stats["skipped_ticks"] += missed
+                POLL_OVERRUNS.inc()
+                POLL_SKIPPED_TICKS.inc(missed)
+                next_tick += missed * self.interval
+                logger.warning(f"Poll cycle overran the {self.interval}s interval by "
+                               f"{round((finished - started - self.interval) * 1000)} ms, skipped {missed} tick(s)")
+            woken = await self._wait(next_tick)
+
+
+class TaskSupervisor:
+    # Фоновые задачи перезапускаются с экспоненциальной задержкой, если завершились или упали
+    def __init__(self, restart_delay=RESTART_DELAY, restart_delay_max=RESTART_DELAY_MAX):
+        self.restart_delay = restart_delay
+        self.restart_delay_max = restart_delay_max
+        self.restarts = {}
+        self._tasks = []
+
+    def start(self, name, factory):
+        self.restarts[name] = 0
+        task = asyncio.create_task(self._supervise(name, factory))
+        self._tasks.append(task)
+        return task
+
+    async def _supervise(self, name, factory):
+        delay = self.restart_delay
+        while True:
+            started = time.monotonic()
+            error = None
+            try:
+                await factory()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                error = e
+            # Задача, проработавшая дольше максимальной задержки, перезапускается снова быстро
+            if time.monotonic() - started > self.restart_delay_max:
+                delay = self.restart_delay
+            if error is not None:
+                logger.error(f"Task {name} crashed: {error}, restarting in {delay}s")
+            else:
+                logger.warning(f"Task {name} exited, restarting in {delay}s")
+            self.restarts[name] += 1
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.restart_delay_max)
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
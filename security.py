@@ -1,9 +1,39 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
 from passlib.context import CryptContext
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# bcrypt выполняется в отдельном ограниченном пуле потоков, чтобы не блокировать event loop
+HASH_WORKERS = 2
+HASH_MAX_PENDING = 16
+_hash_executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="bcrypt")
+_hash_slots = None
+
+
+class HashingBusy(Exception):
+    pass
+
+
 def verify_password(plain_password: str, hashed_password: str):
     return pwd_context.verify(plain_password, hashed_password)
 
 def get_password_hash(password: str):
-    return pwd_context.hash(password)
\ No newline at end of file
+    return pwd_context.hash(password)
+
+async def _run_hashing(func, *args):
+    global _hash_slots
+    if _hash_slots is None:
+        _hash_slots = asyncio.Semaphore(HASH_MAX_PENDING)
+    # При всплеске логинов лишние попытки отклоняются сразу, а не копятся в очереди
+    if _hash_slots.locked():
+        raise HashingBusy()
+    async with _hash_slots:
+        return await asyncio.get_running_loop().run_in_executor(_hash_executor, func, *args)
+
+async def verify_password_async(plain_password: str, hashed_password: str):
+    return await _run_hashing(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str):
+    return await _run_hashing(get_password_hash, password)
@@ -0,0 +1,80 @@
+import os
+import time
+import logging
+from dataclasses import dataclass, field
+from types import MappingProxyType
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class StatusSnapshot:
+    version: int = 0
+    clients: int = 0
+    stats: tuple = field(default_factory=tuple)
+    parsed_at: float = 0.0
+    parse_ms: float = 0.0
+
+    @property
+    def age(self):
+        return time.time() - self.parsed_at if self.parsed_at else None
+
+    def as_status(self):
+        return {"clients": self.clients, "stats": self.stats}
+
+    def info(self):
+        return {
+            "version": self.version,
+            "clients": self.clients,
+            "age_seconds": round(self.age, 3) if self.age is not None else None,
+            "parse_ms": self.parse_ms,
+        }
+
+
+class StatusSnapshotService:
+    # Парсит файл статуса только при изменении (mtime/size/inode) и публикует неизменяемый снимок.
+    # Для других источников (management-интерфейс) признак изменения передаётся через signature
+    def __init__(self, path, parse, signature=None):
+        self.path = path
+        self._parse = parse
+        self._get_signature = signature or self._stat_signature
+        self._signature = None
+        self.current = StatusSnapshot()
+
+    def _stat_signature(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def changed(self):
+        # Проверка изменения источника без разбора файла
+        signature = self._get_signature()
+        return signature is None or signature != self._signature
+
+    def adopt(self, snapshot):
+        # Снимок, опубликованный лидером: воркер-последователь сам источник не читает.
+        # Сигнатура сбрасывается, чтобы после избрания лидером источник был прочитан заново
+        self._signature = None
+        self.current = snapshot
+
+    async def refresh(self):
+        signature = self._get_signature()
+        if signature is not None and signature == self._signature:
+            return False
+
+        started = time.perf_counter()
+        status = await self._parse()
+        parse_ms = round((time.perf_counter() - started) * 1000, 2)
+
+        self._signature = signature
+        self.current = StatusSnapshot(
+            version=self.current.version + 1,
+            clients=status["clients"],
+            stats=tuple(MappingProxyType(dict(client)) for client in status["stats"]),
+            parsed_at=time.time(),
+            parse_ms=parse_ms,
+        )
+        logger.debug(f"Published status snapshot v{self.current.version}: {self.current.clients} clients in {parse_ms} ms")
+        return True
@@ -0,0 +1,179 @@
+import asyncio
+import json
+import logging
+from datetime import datetime
+
+from eventlog import EventLogTailer
+from management import ManagementClient
+from snapshot import StatusSnapshotService
+from metrics import STATUS_PARSE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SERVER_ID = "default"
+
+
+def parse_status_file(path):
+    # Отсутствующий или нечитаемый файл - не пустой сервер: OSError доходит до ServerSource.refresh,
+    # и сервер пропускается в этом цикле с сохранением его сессий
+    with open(path, 'r') as f:
+        lines = f.readlines()
+
+    clients = []
+    in_clients = False
+    total_clients = 0
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"Log lines: {lines[:10]}")
+
+    for line in lines:
+        line = line.strip()
+        if line.startswith("HEADER,ROUTING_TABLE"):
+            break
+        if in_clients:
+            if line.startswith("CLIENT_LIST"):
+                try:
+                    parts = line.split(',')
+                    if len(parts) >= 9:
+                        updated = datetime.fromtimestamp(int(parts[8])).strftime("%Y-%m-%d %H:%M:%S") if len(parts) > 8 and parts[8].isdigit() else datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                        clients.append({
+                            "common_name": parts[1],
+                            "real_address": parts[2],
+                            # Счётчики OpenVPN в байтах, перевод в МБ только при отображении
+                            "bytes_received": int(parts[5]),
+                            "bytes_sent": int(parts[6]),
+                            "connected_since": parts[7],
+                            "updated": updated,
+                            # Client ID различает переподключения с тем же CN
+                            "client_id": int(parts[10]) if len(parts) > 10 and parts[10].isdigit() else None,
+                        })
+                        total_clients += 1
+                    else:
+                        logger.warning(f"Skipping invalid line: {line}")
+                except Exception as e:
+                    logger.error(f"Error parsing line '{line}': {e}")
+        if line.startswith("HEADER,CLIENT_LIST"):
+            in_clients = True
+
+    logger.debug(f"Parsed {total_clients} clients from {path}")
+    return {"clients": total_clients, "stats": clients}
+
+async def parse_openvpn_status(path):
+    # Чтение файла в потоке: медленная сетевая ФС не блокирует event loop и другие источники
+    return await asyncio.to_thread(parse_status_file, path)
+
+
+class ServerSource:
+    # Один экземпляр OpenVPN: свой файл статуса (или management-интерфейс), лог событий и снимок
+    def __init__(self, server_id, status_path=None, event_log_path=None, management_address=None,
+                 management_password=None, wakeup=None):
+        self.id = server_id
+        self.status_path = status_path
+        self.event_log = EventLogTailer(event_log_path) if event_log_path else None
+        self.management = ManagementClient(management_address, management_password, changed=wakeup) \
+            if management_address else None
+        if self.management is not None:
+            self.snapshots = StatusSnapshotService(None, self._management_status, self.management.signature)
+        else:
+            self.snapshots = StatusSnapshotService(status_path, self._file_status)
+        self._pending_refresh = None
+        self._pending_events = None
+        self._pending_check = None
+
+    def _tag(self, status):
+        for client in status["stats"]:
+            client["server_id"] = self.id
+        return status
+
+    async def _file_status(self):
+        with STATUS_PARSE_SECONDS.time(server=self.id):
+            return self._tag(await parse_openvpn_status(self.status_path))
+
+    async def _management_status(self):
+        with STATUS_PARSE_SECONDS.time(server=self.id):
+            return self._tag(await self.management.status())
+
+    async def _await_pending(self, attr, factory, timeout):
+        # Зависшее чтение не перезапускается: следующий цикл дожидается уже начатой операции
+        pending = getattr(self, attr)
+        if pending is None or pending.done():
+            pending = asyncio.ensure_future(factory())
+            setattr(self, attr, pending)
+        return await asyncio.wait_for(asyncio.shield(pending), timeout)
+
+    async def has_changes(self, timeout):
+        if self.management is not None:
+            return self.snapshots.changed()
+        try:
+            return await self._await_pending("_pending_check", lambda: asyncio.to_thread(self.snapshots.changed), timeout)
+        except asyncio.TimeoutError:
+            # Пусть цикл попробует обновить источник и сам решит, пропускать ли его
+            return True
+
+    async def refresh(self, timeout):
+        # До полной синхронизации и без соединения список клиентов management-интерфейса неполон:
+        # по нему поллер закрыл бы живые сессии
+        if self.management is not None and not self.management.ready:
+            logger.warning(f"Server {self.id}: management interface is not synced yet")
+            return False
+        try:
+            await self._await_pending("_pending_refresh", self.snapshots.refresh, timeout)
+            return True
+        except asyncio.TimeoutError:
+            logger.warning(f"Server {self.id}: status refresh timed out after {timeout}s")
+        except Exception as e:
+            logger.error(f"Server {self.id}: status refresh failed: {e}")
+        return False
+
+    async def disconnect_times(self, timeout):
+        disconnect_times = {}
+        if self.event_log is not None:
+            try:
+                disconnect_times = await self._await_pending(
+                    "_pending_events", lambda: asyncio.to_thread(self.event_log.poll), timeout
+                )
+            except asyncio.TimeoutError:
+                logger.warning(f"Server {self.id}: event log read timed out after {timeout}s")
+                disconnect_times = self.event_log.disconnect_times()
+            except Exception as e:
+                logger.error(f"Error reading event log: {e}")
+                disconnect_times = self.event_log.disconnect_times()
+        if self.management is not None:
+            # Время из уведомлений >CLIENT:DISCONNECT точнее лога
+            disconnect_times.update(self.management.disconnect_times())
+        return disconnect_times
+
+    def disconnect_reason(self, common_name):
+        return self.event_log.reason(common_name) if self.event_log is not None else None
+
+    def info(self):
+        return {
+            "id": self.id,
+            **self.snapshots.current.info(),
+            "management_connected": self.management.connected if self.management is not None else None,
+        }
+
+
+def load_sources(config_path, default_status_path, default_event_log_path, default_management_address=None,
+                 default_management_password=None, wakeup=None):
+    # Список серверов задаётся JSON-файлом:
+    # [{"id": "udp1194", "status_path": "...", "event_log_path": "...", "management_address": "..."}]
+    if not config_path:
+        return [ServerSource(DEFAULT_SERVER_ID, default_status_path, default_event_log_path,
+                             default_management_address, default_management_password, wakeup)]
+
+    with open(config_path, "r") as f:
+        config = json.load(f)
+    sources = []
+    for entry in config:
+        sources.append(ServerSource(
+            entry["id"],
+            entry.get("status_path"),
+            entry.get("event_log_path"),
+            entry.get("management_address"),
+            entry.get("management_password"),
+            wakeup,
+        ))
+    if len({s.id for s in sources}) != len(sources):
+        raise ValueError(f"Duplicate server ids in {config_path}")
+    logger.info(f"Loaded {len(sources)} OpenVPN servers from {config_path}")
+    return sources
@@ -0,0 +1,207 @@
+// Обработка выхода
+document.getElementById('logoutBtn').addEventListener('click', () => {
+    fetch('/logout', { method: 'GET' })
+        .then(() => window.location.href = '/login');
+});
+function showAlert(message, type="success") {
+    const alertContainer = document.getElementById("alert-container");
+    alertContainer.innerHTML = `
+        <div class="alert alert-${type} alert-dismissible fade show" role="alert" id="auto-hide-alert">
+            ${message}
+            <button type="button" class="btn-close" data-bs-dismiss="alert"></button>
+        </div>`;
+    setTimeout(() => {
+        const alert = document.getElementById("auto-hide-alert");
+        if (alert) {
+            const bsAlert = bootstrap.Alert.getOrCreateInstance(alert);
+            bsAlert.close();
+        }
+    }, 3000);
+}
+
+// Выпуск и отзыв сертификатов выполняются фоновыми задачами
+async function waitForJob(jobId) {
+    while (true) {
+        await new Promise(resolve => setTimeout(resolve, 1000));
+        const response = await fetch(`/api/jobs/${jobId}`);
+        const job = await response.json();
+        if (!response.ok || job.status === "succeeded" || job.status === "failed") return job;
+    }
+}
+
+async function handleFormSubmit(event, url) {
+    event.preventDefault();
+    const form = event.target;
+    const formData = new FormData(form);
+
+    const response = await fetch(url, { method: "POST", headers: {
+            'Authorization': 'Bearer supermario' },  body: formData });
+    const result = await response.json();
+
+    if (result.job_id) {
+        showAlert(result.message, "info");
+        form.reset();
+        const job = await waitForJob(result.job_id);
+        if (job.status === "succeeded") {
+            showAlert(result.message.replace("запущено", "завершено"), "success");
+            setTimeout(() => location.reload(), 3000);
+        } else {
+            showAlert(job.error || (job.results[0] && job.results[0].error) || "Ошибка выполнения", "danger");
+        }
+    } else if (result.message) {
+        showAlert(result.message, "success");
+        form.reset();
+        setTimeout(() => location.reload(), 8000);
+    } else {
+        showAlert(result.error || result.detail || "Ошибка выполнения", "danger");
+    }
+}
+
+document.getElementById("addUserForm").addEventListener("submit", e => handleFormSubmit(e, "/add_user"));
+document.getElementById("revokeUserForm").addEventListener("submit", e => handleFormSubmit(e, "/revoke_user"));
+
+// История подключений подгружается постранично из /api/connections
+let historyCursor = null;
+let historyPages = 0;
+
+// API отдаёт трафик в байтах, таблицы и график показывают МБ
+function toMegabytes(bytes) {
+    return bytes == null ? null : Math.round(bytes / 1048576 * 100) / 100;
+}
+
+function formatTime(ts) {
+    return ts ? new Date(ts * 1000).toLocaleString('ru-RU') : null;
+}
+
+function historyParams() {
+    const form = new FormData(document.getElementById('historyFilter'));
+    const params = new URLSearchParams();
+    for (const name of ['user', 'state']) {
+        if (form.get(name)) params.set(name, form.get(name));
+    }
+    for (const name of ['since', 'until']) {
+        if (form.get(name)) params.set(name, Math.floor(new Date(form.get(name)).getTime() / 1000));
+    }
+    return params;
+}
+
+async function loadHistory(reset) {
+    const params = historyParams();
+    if (!reset && historyCursor) params.set('cursor', historyCursor);
+    const response = await fetch('/api/connections?' + params.toString());
+    if (!response.ok) return;
+    const page = await response.json();
+    const tbody = document.getElementById('historyRows');
+    if (reset) {
+        tbody.innerHTML = '';
+        historyPages = 0;
+    }
+    historyPages++;
+    for (const c of page.items) {
+        const row = tbody.insertRow();
+        for (const value of [c.server_id, c.common_name, formatTime(c.connected_at), formatTime(c.disconnected_at) || 'Активен',
+                             c.duration_minutes || '-', toMegabytes(c.bytes_received), toMegabytes(c.bytes_sent)]) {
+            row.insertCell().textContent = value ?? '';
+        }
+    }
+    historyCursor = page.next_cursor;
+    document.getElementById('historyMore').classList.toggle('d-none', !historyCursor);
+}
+
+document.getElementById('historyFilter').addEventListener('submit', e => {
+    e.preventDefault();
+    loadHistory(true);
+});
+document.getElementById('historyMore').addEventListener('click', () => loadHistory(false));
+document.getElementById('history-tab').addEventListener('shown.bs.tab', () => loadHistory(true));
+
+// Данные дашборда приходят из /api/dashboard: при неизменном снимке сервер отвечает 304
+const trafficChart = new Chart(document.getElementById('trafficChart').getContext('2d'), {
+    type: 'bar',
+    data: {
+        labels: [],
+        datasets: [{
+            label: 'Получено (МБ)',
+            data: [],
+            backgroundColor: 'rgba(75, 192, 192, 0.2)',
+            borderColor: 'rgba(75, 192, 192, 1)'
+        }, {
+            label: 'Отправлено (МБ)',
+            data: [],
+            backgroundColor: 'rgba(153, 102, 255, 0.2)',
+            borderColor: 'rgba(153, 102, 255, 1)'
+        }]
+    },
+    options: { scales: { y: { beginAtZero: true } } }
+});
+
+async function loadDashboard() {
+    const response = await fetch('/api/dashboard');
+    if (!response.ok) return;
+    const data = await response.json();
+    liveClients.clear();
+    for (const c of data.stats) liveClients.set(clientKey(c), c);
+    renderClients(data.chart);
+}
+
+async function loadUsers() {
+    const response = await fetch('/api/users');
+    if (!response.ok) return;
+    const tbody = document.getElementById('userRows');
+    tbody.innerHTML = '';
+    for (const user of await response.json()) {
+        const row = tbody.insertRow();
+        for (const value of [user.common_name, user.email || 'Не указан', user.description || 'Не указано']) {
+            row.insertCell().textContent = value;
+        }
+    }
+}
+
+// Живые обновления от поллера через Server-Sent Events
+// Ключ клиента - сервер, CN и Client ID, как client_key в events.py
+const liveClients = new Map();
+const clientKey = c => c.client_id == null ? `${c.server_id}/${c.common_name}` : `${c.server_id}/${c.common_name}/${c.client_id}`;
+const clientLabel = c => c.server_id === 'default' ? c.common_name : `${c.common_name} (${c.server_id})`;
+
+function renderClients(chart) {
+    const clients = [...liveClients.values()];
+    document.getElementById('clientCount').textContent = clients.length;
+    const tbody = document.getElementById('clientRows');
+    tbody.innerHTML = '';
+    for (const c of clients) {
+        const row = tbody.insertRow();
+        for (const value of [c.server_id, c.common_name, c.real_address, toMegabytes(c.bytes_received),
+                             toMegabytes(c.bytes_sent), c.connected_since]) {
+            row.insertCell().textContent = value;
+        }
+    }
+    // Готовые ряды графика сервер собирает один раз за цикл поллера
+    trafficChart.data.labels = chart ? chart.labels : clients.map(clientLabel);
+    trafficChart.data.datasets[0].data = (chart ? chart.bytes_received : clients.map(c => c.bytes_received)).map(toMegabytes);
+    trafficChart.data.datasets[1].data = (chart ? chart.bytes_sent : clients.map(c => c.bytes_sent)).map(toMegabytes);
+    trafficChart.update('none');
+}
+
+const stream = new EventSource('/api/stream');
+stream.addEventListener('snapshot', e => {
+    const data = JSON.parse(e.data);
+    liveClients.clear();
+    for (const c of data.stats) liveClients.set(clientKey(c), c);
+    renderClients();
+});
+stream.addEventListener('update', e => {
+    const data = JSON.parse(e.data);
+    for (const c of data.joined || []) liveClients.set(clientKey(c), c);
+    for (const key of data.left || []) liveClients.delete(key);
+    for (const [key, traffic] of Object.entries(data.traffic || {})) {
+        const c = liveClients.get(key);
+        if (c) Object.assign(c, traffic);
+    }
+    renderClients();
+    if (data.history && document.getElementById('history-tab').classList.contains('active') && historyPages <= 1) {
+        loadHistory(true);
+    }
+});
+
+loadDashboard();
+loadUsers();
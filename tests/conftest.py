@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(scope="session")
+def main(tmp_path_factory):
+    # Приложение импортируется один раз; лог и блокировка лидера - во временном каталоге
+    root = tmp_path_factory.mktemp("app")
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv("LOG_FILE", str(root / "server.log"))
+        mp.setenv("LEADER_LOCK", str(root / "poller.lock"))
+        mp.setenv("ARCHIVE_DIR", str(root / "archive"))
+        import main
+    return main
@@ -0,0 +1,39 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import ClientDisconnect
+
+COLUMNS = ("common_name", "bytes_received")
+SCOPE = {"type": "http", "asgi": {"spec_version": "2.4"}}
+
+
+async def batches():
+    yield [("alice", 1)]
+
+
+def test_export_slots_are_claimed_before_streaming(main, monkeypatch):
+    monkeypatch.setattr(main, "EXPORT_MAX_CONCURRENT", 2)
+    monkeypatch.setattr(main, "active_exports", 0)
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    async def disconnected(message):
+        raise OSError("client went away")
+
+    async def scenario():
+        # Запросы приходят одновременно: ни один ответ ещё не начал отдавать данные
+        first, second = (main.export_response(batches(), COLUMNS, "csv", "sessions") for _ in range(2))
+        with pytest.raises(HTTPException) as rejected:
+            main.export_response(batches(), COLUMNS, "csv", "sessions")
+        assert rejected.value.status_code == 429
+        await first(SCOPE, None, send)
+        # Клиент ушёл до первой пачки: генератор не запускался, слот всё равно освобождается
+        with pytest.raises(ClientDisconnect):
+            await second(SCOPE, None, disconnected)
+
+    asyncio.run(scenario())
+    assert main.active_exports == 0
+    assert b"alice,1" in b"".join(m.get("body", b"") for m in sent)
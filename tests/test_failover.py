@@ -0,0 +1,130 @@
+import json
+import os
+import signal
+import socket
+import sqlite3
+import subprocess
+import sys
+import time
+import urllib.request
+
+from benchmarks.generators import BASE_TIME, status_clients, write_status
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Воркер как у uvicorn --workers: отдельный процесс с main:app, путь к базе подменяется до импорта приложения
+WORKER = (
+    "import sys, db; db.DB_PATH = sys.argv[1]; import uvicorn; "
+    "uvicorn.run('main:app', host='127.0.0.1', port=int(sys.argv[2]), log_level='warning')"
+)
+TIMEOUT = 30
+POLL_INTERVAL = 0.5
+LEADER_RETRY = 0.2
+# Запуск задач лидера и первый цикл опроса
+TAKEOVER_MARGIN = 0.5
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(check, message, timeout=TIMEOUT):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        result = check()
+        if result:
+            return result
+        time.sleep(0.02)
+    raise AssertionError(message)
+
+
+def query(db_path, sql, params=()):
+    try:
+        with sqlite3.connect(db_path, timeout=5) as conn:
+            return conn.execute(sql, params).fetchall()
+    except sqlite3.OperationalError:
+        # Таблиц ещё нет, пока воркер не выполнил миграции
+        return []
+
+
+def snapshot_holder(db_path):
+    rows = query(db_path, "SELECT published_by FROM status_snapshots")
+    return rows[0][0] if rows else None
+
+
+def test_follower_takes_over_polling_after_leader_is_killed(tmp_path):
+    status_path = tmp_path / "status.log"
+    clients = status_clients(3, now=BASE_TIME)
+    write_status(status_path, clients, now=BASE_TIME)
+    (tmp_path / "events.log").write_text("")
+    servers = tmp_path / "servers.json"
+    servers.write_text(json.dumps([{
+        "id": "default", "status_path": str(status_path), "event_log_path": str(tmp_path / "events.log"),
+    }]))
+    db_path = str(tmp_path / "connections.db")
+    env = {
+        **os.environ,
+        "SERVERS_CONFIG": str(servers),
+        "LEADER_LOCK": str(tmp_path / "poller.lock"),
+        "LOG_FILE": str(tmp_path / "server.log"),
+        "ARCHIVE_DIR": str(tmp_path / "archive"),
+        "POLL_INTERVAL": str(POLL_INTERVAL),
+        "POLL_MODE": "interval",
+        "LEADER_RETRY": str(LEADER_RETRY),
+        "FOLLOWER_SYNC_INTERVAL": "0.2",
+        "METRICS_PUBLIC": "1",
+        "ADMIN_USERNAME": "admin",
+        "ADMIN_PASSWORD": "admin",
+    }
+    ports = [free_port(), free_port()]
+    workers = {}
+    try:
+        for port in ports:
+            process = subprocess.Popen([sys.executable, "-c", WORKER, db_path, str(port)], cwd=ROOT, env=env)
+            workers[process.pid] = (process, port)
+            # Первый воркер успевает стать лидером до запуска второго
+            if len(workers) == 1:
+                wait_for(lambda: snapshot_holder(db_path), "no worker published a status snapshot")
+
+        leader_pid = int(snapshot_holder(db_path).rsplit(":", 1)[1])
+        assert leader_pid in workers
+        follower_pid = next(pid for pid in workers if pid != leader_pid)
+        follower, follower_port = workers[follower_pid]
+
+        # Серии поллера на последователе - из публикации лидера
+        def follower_metrics():
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{follower_port}/metrics", timeout=2) as response:
+                    body = response.read().decode()
+            except OSError:
+                return None
+            return body if f"published by {socket.gethostname()}:{leader_pid}" in body else None
+        metrics = wait_for(follower_metrics, "follower does not serve the leader's poller metrics")
+        assert 'openvpn_connected_clients{server="default"} 3' in metrics
+
+        killed_at = time.time()
+        workers[leader_pid][0].send_signal(signal.SIGKILL)
+        workers[leader_pid][0].wait()
+        write_status(status_path, clients + status_clients(1, seed=1, now=BASE_TIME + 60, names=["newcomer"]),
+                     now=BASE_TIME + 60)
+
+        # Новый лидер публикует свой первый снимок не позже чем через интервал опроса
+        wait_for(lambda: snapshot_holder(db_path) == f"{socket.gethostname()}:{follower_pid}",
+                 "follower did not take over snapshot publishing")
+        takeover = time.time() - killed_at
+        assert takeover <= POLL_INTERVAL + TAKEOVER_MARGIN, f"takeover took {takeover:.2f}s"
+        wait_for(lambda: query(db_path, "SELECT 1 FROM connections WHERE common_name = 'newcomer'"),
+                 "new leader did not record the new session")
+        # Последователи рассылают history по этому журналу
+        assert query(db_path, "SELECT kind FROM session_events WHERE common_name = 'newcomer'") == [("opened",)]
+        assert follower.poll() is None
+    finally:
+        for process, _ in workers.values():
+            if process.poll() is None:
+                process.send_signal(signal.SIGTERM)
+        for process, _ in workers.values():
+            try:
+                process.wait(10)
+            except subprocess.TimeoutExpired:
+                process.kill()
@@ -0,0 +1,130 @@
+import asyncio
+import os
+import stat
+
+import httpx
+import pytest
+
+import db
+from auth import User, get_api_user, get_current_active_user
+from jobs import JobRunner
+
+TOKEN = "sysadmin-token"
+# Заглушки openvpn-addclient и easy-rsa: пишут вызовы в calls.log, имена fail* и ghost завершаются ошибкой
+ADDCLIENT = '''#!/bin/sh
+echo "add $1" >> "$FAKE_PKI_DIR/calls.log"
+case "$1" in fail*) echo "cannot build $1" >&2; exit 1;; esac
+touch "$FAKE_PKI_DIR/$1.ovpn"
+'''
+EASYRSA = '''#!/bin/sh
+echo "$*" >> "$FAKE_PKI_DIR/calls.log"
+case "$*" in
+    gen-crl) echo "crl" > "$FAKE_PKI_DIR/crl.pem" ;;
+    *"revoke ghost") echo "no certificate for ghost" >&2; exit 1 ;;
+esac
+'''
+
+
+def script(path, body):
+    path.write_text(body)
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    return str(path)
+
+
+@pytest.fixture
+def pki(main, tmp_path, monkeypatch):
+    keys = tmp_path / "keys"
+    keys.mkdir()
+    monkeypatch.setenv("FAKE_PKI_DIR", str(keys))
+    monkeypatch.setenv("AKELLAVK_TKN", TOKEN)
+    monkeypatch.setattr(main, "KEYS_DIR", str(keys))
+    monkeypatch.setattr(main, "ADDCLIENT_CMD", script(tmp_path / "addclient", ADDCLIENT))
+    monkeypatch.setattr(main, "EASYRSA_BIN", script(tmp_path / "easyrsa", EASYRSA))
+    monkeypatch.setattr(main, "OPENVPN_CRL", str(tmp_path / "crl.pem"))
+    monkeypatch.setattr(main, "job_runner", JobRunner(lock_path=str(keys)))
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "connections.db"))
+    main.app.dependency_overrides[get_api_user] = lambda: User(username="admin")
+    main.app.dependency_overrides[get_current_active_user] = lambda: User(username="admin")
+    yield keys
+    main.app.dependency_overrides.clear()
+
+
+def calls(keys):
+    return (keys / "calls.log").read_text().splitlines()
+
+
+def run_api(main, scenario):
+    async def wrapper():
+        await db.init_db()
+        try:
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test",
+                                         headers={"Authorization": f"Bearer {TOKEN}"}) as client:
+                return await scenario(client)
+        finally:
+            await db.close_db()
+    return asyncio.run(wrapper())
+
+
+async def wait_job(client, job_id):
+    for _ in range(500):
+        job = (await client.get(f"/api/jobs/{job_id}")).json()
+        if job["status"] not in ("queued", "running"):
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+async def bulk(client, action, names):
+    response = await client.post("/api/users/bulk", data={"action": action},
+                                 files={"file": ("users.csv", "".join(f"{name},{name}@example.com\n" for name in names))})
+    assert response.status_code == 202
+    return await wait_job(client, response.json()["job_id"])
+
+
+def test_bulk_revoke_regenerates_crl_once(main, pki):
+    for name in ("alice", "bob"):
+        (pki / f"{name}.ovpn").write_text("")
+
+    job = run_api(main, lambda client: bulk(client, "revoke", ["alice", "bob", "ghost"]))
+    assert job["status"] == "failed" and job["done"] == job["total"] == 3
+    assert [(r["username"], r["status"]) for r in job["results"]] == \
+        [("alice", "revoked"), ("bob", "revoked"), ("ghost", "failed")]
+    assert calls(pki) == ["--batch revoke alice", "--batch revoke bob", "--batch revoke ghost", "gen-crl"]
+    assert os.path.exists(main.OPENVPN_CRL)
+    assert not (pki / "alice.ovpn").exists() and not (pki / "bob.ovpn").exists()
+
+
+def test_bulk_add_reports_each_user(main, pki):
+    (pki / "alice.ovpn").write_text("")
+
+    async def scenario(client):
+        job = await bulk(client, "add", ["alice", "carol", "failing"])
+        return job, [u["common_name"] for u in await db.get_all_users_from_db()]
+
+    job, users = run_api(main, scenario)
+    assert job["status"] == "failed"
+    assert [(r["username"], r["status"]) for r in job["results"]] == \
+        [("alice", "skipped"), ("carol", "added"), ("failing", "failed")]
+    assert "cannot build failing" in job["results"][2]["error"]
+    assert users == ["carol"]
+    assert calls(pki) == ["add carol", "add failing"]
+
+
+def test_job_status_is_shared_between_runners(main, pki):
+    async def scenario(client):
+        job = await main.job_runner.submit("check", lambda job: main.job_runner.run_command(["false"]))
+        finished = await wait_job(client, job.id)
+        # Другой воркер видит задачу через базу
+        return finished, await JobRunner().get(job.id)
+
+    finished, shared = run_api(main, scenario)
+    assert finished["status"] == "failed" and "exit code 1" in finished["error"]
+    assert shared == finished
+
+
+def test_add_user_rejects_invalid_name(main, pki):
+    async def scenario(client):
+        return await client.post("/add_user", data={"username": "../etc", "email": ""})
+
+    response = run_api(main, scenario)
+    assert response.status_code == 400
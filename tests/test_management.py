@@ -0,0 +1,144 @@
+import asyncio
+
+import management
+from management import ManagementClient
+from sources import ServerSource
+
+HEADER = ("HEADER\tCLIENT_LIST\tCommon Name\tReal Address\tVirtual Address\tVirtual IPv6 Address\tBytes Received\t"
+          "Bytes Sent\tConnected Since\tConnected Since (time_t)\tUsername\tClient ID\tPeer ID\tData Channel Cipher")
+
+
+def client_line(common_name, client_id, received, sent, connected_at=1735689600):
+    return (f"CLIENT_LIST\t{common_name}\t203.0.113.{client_id}:5000\t10.8.0.{client_id}\t\t{received}\t{sent}\t"
+            f"2025-01-01 00:00:00\t{connected_at}\tUNDEF\t{client_id}\t{client_id}\tAES-256-GCM")
+
+
+class FakeManagement:
+    # Management-интерфейс OpenVPN: на "status 3" отдаёт заготовленный статус, затем уведомления >CLIENT:.
+    # Каждое следующее подключение получает следующий сценарий, после последнего соединение держится открытым
+    def __init__(self, scenarios):
+        self.scenarios = scenarios
+        self.commands = []
+        self.connections = 0
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def _handle(self, reader, writer):
+        status, notifications = self.scenarios[min(self.connections, len(self.scenarios) - 1)]
+        last = self.connections >= len(self.scenarios) - 1
+        self.connections += 1
+        writer.write(b">INFO:OpenVPN Management Interface Version 5 -- type 'help' for more info\r\n")
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            command = line.decode().strip()
+            self.commands.append(command)
+            if command == "status 3":
+                writer.write("".join(f"{row}\r\n" for row in [HEADER, *status, "END"]).encode())
+                writer.write("".join(f"{row}\r\n" for row in notifications).encode())
+                await writer.drain()
+                if not last:
+                    break
+        writer.close()
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+
+async def wait_for(condition, timeout=5):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "condition not met in time"
+        await asyncio.sleep(0.01)
+
+
+def test_status_and_notifications(monkeypatch):
+    monkeypatch.setattr(management, "RECONNECT_DELAY", 0.01)
+    notifications = [
+        ">CLIENT:ESTABLISHED,7",
+        ">CLIENT:ENV,common_name=carol",
+        ">CLIENT:ENV,trusted_ip=198.51.100.7",
+        ">CLIENT:ENV,trusted_port=40000",
+        ">CLIENT:ENV,time_unix=1735689700",
+        ">CLIENT:ENV,END",
+        ">BYTECOUNT_CLI:7,1500,2500",
+        ">CLIENT:DISCONNECT,3",
+        ">CLIENT:ENV,common_name=alice",
+        ">CLIENT:ENV,END",
+    ]
+    status = [client_line("alice", 3, 100, 200), client_line("bob", 4, 300, 400)]
+
+    async def scenario():
+        fake = FakeManagement([(status, notifications)])
+        port = await fake.start()
+        client = ManagementClient(f"127.0.0.1:{port}", bytecount_interval=5)
+        task = asyncio.create_task(client.run())
+        await wait_for(lambda: "carol" in {c["common_name"] for c in client._clients.values()}
+                       and client._clients["7"]["bytes_sent"] == 2500 and "3" not in client._clients)
+        result = await client.status()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await fake.stop()
+        return fake, client, result
+
+    fake, client, result = asyncio.run(scenario())
+    assert fake.commands[:2] == ["bytecount 5", "status 3"]
+    sessions = {c["common_name"]: c for c in result["stats"]}
+    assert set(sessions) == {"bob", "carol"}
+    assert sessions["bob"]["bytes_received"] == 300 and sessions["bob"]["client_id"] == 4
+    assert sessions["carol"]["real_address"] == "198.51.100.7:40000"
+    assert (sessions["carol"]["bytes_received"], sessions["carol"]["bytes_sent"], sessions["carol"]["client_id"]) == (1500, 2500, 7)
+    assert "alice" in client.disconnect_times()
+
+
+def test_reconnect_resyncs_clients(monkeypatch):
+    monkeypatch.setattr(management, "RECONNECT_DELAY", 0.01)
+    first = [client_line("alice", 3, 100, 200), client_line("bob", 4, 300, 400)]
+    # Пока клиент был отключён, alice переподключилась с новым Client ID, а bob ушёл
+    second = [client_line("alice", 9, 10, 20, 1735690000)]
+
+    async def scenario():
+        fake = FakeManagement([(first, []), (second, [])])
+        port = await fake.start()
+        client = ManagementClient(f"127.0.0.1:{port}")
+        task = asyncio.create_task(client.run())
+        await wait_for(lambda: fake.connections == 2 and set(client._clients) == {"9"})
+        result = await client.status()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await fake.stop()
+        return fake, result
+
+    fake, result = asyncio.run(scenario())
+    assert fake.commands.count("status 3") == 2
+    assert [(c["common_name"], c["client_id"], c["bytes_received"]) for c in result["stats"]] == [("alice", 9, 10)]
+
+
+def test_source_is_skipped_until_management_is_synced(monkeypatch):
+    monkeypatch.setattr(management, "RECONNECT_DELAY", 0.01)
+    status = [client_line("alice", 3, 100, 200), client_line("bob", 4, 300, 400)]
+
+    async def scenario():
+        fake = FakeManagement([(status, [])])
+        port = await fake.start()
+        source = ServerSource("udp1194", management_address=f"127.0.0.1:{port}")
+        # Пустой список до подключения не должен закрывать открытые сессии
+        before = await source.refresh(1)
+        task = asyncio.create_task(source.management.run())
+        await wait_for(lambda: source.management.ready)
+        synced = await source.refresh(1), source.snapshots.current.clients
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        after = await source.refresh(1)
+        await fake.stop()
+        return before, synced, after
+
+    before, synced, after = asyncio.run(scenario())
+    assert before is False
+    assert synced == (True, 2)
+    assert after is False
@@ -0,0 +1,43 @@
+import asyncio
+import sqlite3
+
+import db
+
+
+def legacy_db(path):
+    # База до миграций: время строками, трафик в МБ
+    conn = sqlite3.connect(path)
+    for statement in db.BASE_SCHEMA:
+        conn.execute(statement)
+    conn.execute(
+        "INSERT INTO connections (common_name, connected_at, disconnected_at, duration_minutes, bytes_received, "
+        "bytes_sent, last_updated) VALUES ('user1', '2025-01-01 00:00:00', '2025-01-01 01:00:00', 60, 3.0, 1.5, "
+        "'2025-01-01 01:00:00')"
+    )
+    conn.commit()
+    conn.close()
+
+
+def test_concurrent_migrations_apply_each_version_once(tmp_path):
+    path = str(tmp_path / "connections.db")
+    legacy_db(path)
+    db.DB_PATH = path
+
+    async def scenario():
+        # Два воркера стартуют одновременно на одной старой базе
+        first, second = await db._connect(), await db._connect()
+        try:
+            return await asyncio.gather(db.migrate(first), db.migrate(second))
+        finally:
+            await first.close()
+            await second.close()
+
+    assert asyncio.run(scenario()) == [db.MIGRATIONS[-1][0]] * 2
+    conn = sqlite3.connect(path)
+    connected_at, bytes_received, bytes_sent = conn.execute(
+        "SELECT connected_at, bytes_received, bytes_sent FROM connections"
+    ).fetchone()
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == db.MIGRATIONS[-1][0]
+    conn.close()
+    assert abs(connected_at - 1735689600) <= 14 * 3600
+    assert (bytes_received, bytes_sent) == (3 * 1048576, 1572864)
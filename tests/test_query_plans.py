@@ -0,0 +1,54 @@
+import asyncio
+import re
+import sqlite3
+
+import pytest
+
+import db
+
+NOW = 1735689600
+
+
+@pytest.fixture(scope="module")
+def seeded_db(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("plans") / "connections.db")
+
+    async def seed():
+        db.DB_PATH = path
+        await db.init_db()
+        await db.apply_connection_changes(
+            [], [(f"user{i}", NOW - i * 60, i, i, NOW, "default", i) for i in range(50)], [(NOW, 1, NOW, 1)],
+            [(f"user{i}", i, i) for i in range(50)], NOW
+        )
+        await db.close_db()
+
+    asyncio.run(seed())
+    conn = sqlite3.connect(path)
+    yield conn
+    conn.close()
+
+
+# Запросы строятся теми же функциями и константами db.py, что и в рабочем коде
+HOT_QUERIES = {
+    "open connections": (db.OPEN_CONNECTIONS_QUERY, []),
+    "traffic update": (db.TRAFFIC_UPDATE_QUERY, [0, 0, 0, 0, NOW, 1, 1]),
+    "disconnect": (db.DISCONNECT_QUERY, [NOW, 1, NOW, 1]),
+    "credentials": (db.CREDENTIALS_QUERY, ["admin"]),
+    "archivable": (db.ARCHIVABLE_QUERY, [NOW, 100]),
+    "concurrency peaks": (db.CONCURRENCY_PEAKS_QUERY, ["*", NOW - 86400, NOW]),
+    "history page": db.connections_page_query(50),
+    "history next page": db.connections_page_query(50, cursor=(NOW, 10)),
+    "history by user": db.connections_page_query(50, common_name="user1", since=NOW - 86400),
+    "top talkers": db.top_talkers_query(NOW - 86400, NOW),
+    "traffic series": db.traffic_series_query(NOW - 3600, NOW, "user1")[1:],
+    "session export": db.sessions_export_query(NOW - 86400, NOW),
+    "session flags": db.session_flags_query(NOW - 86400),
+}
+
+
+@pytest.mark.parametrize("name", sorted(HOT_QUERIES))
+def test_hot_query_avoids_full_scan(seeded_db, name):
+    query, params = HOT_QUERIES[name]
+    plan = [row[-1] for row in seeded_db.execute(f"EXPLAIN QUERY PLAN {query}", params)]
+    full_scans = [detail for detail in plan if re.match(r"SCAN (TABLE )?\w+$", detail)]
+    assert not full_scans, f"{name} scans the whole table: {plan}"
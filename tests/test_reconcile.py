@@ -0,0 +1,28 @@
+from reconcile import build_plan
+
+NOW = 1735689600
+
+
+def open_session(counter_received, counter_sent, bytes_received=3145728, bytes_sent=1048576):
+    return {"id": 1, "server_id": "default", "common_name": "alice", "client_id": None, "connected_at": NOW - 3600,
+            "bytes_received": bytes_received, "bytes_sent": bytes_sent,
+            "counter_received": counter_received, "counter_sent": counter_sent}
+
+
+def live_client(received, sent):
+    return {"common_name": "alice", "bytes_received": received, "bytes_sent": sent,
+            "connected_since": "2025-01-01 00:00:00", "updated": "2025-01-01 01:00:00", "client_id": 5}
+
+
+def test_legacy_session_adopts_counters_without_delta():
+    # Сессия из базы до сырых счётчиков: итог в МБ округлён, прежнего значения счётчика нет
+    plan = build_plan([open_session(None, None)], [live_client(3140000, 1040000)], {}, NOW)
+    assert plan.traffic_deltas == []
+    assert len(plan.traffic_updates) == 1
+    assert plan.traffic_updates[0][:4] == (3145728, 1048576, 3140000, 1040000)
+
+
+def test_counter_reset_adds_new_counter():
+    plan = build_plan([open_session(3140000, 1040000)], [live_client(1000, 2000)], {}, NOW)
+    assert plan.traffic_deltas == [("alice", 1000, 2000)]
+    assert plan.traffic_updates[0][:4] == (3145728 + 1000, 1048576 + 2000, 1000, 2000)
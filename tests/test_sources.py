@@ -0,0 +1,24 @@
+import asyncio
+
+from benchmarks.generators import write_status
+from sources import ServerSource
+
+
+def test_unreadable_status_file_skips_the_server(tmp_path):
+    status_path = tmp_path / "status.log"
+    source = ServerSource("udp1194", str(status_path))
+
+    async def scenario():
+        missing = await source.refresh(1)
+        write_status(status_path, 3)
+        read = await source.refresh(1), source.snapshots.current.version, source.snapshots.current.clients
+        status_path.unlink()
+        removed = await source.refresh(1)
+        return missing, read, removed
+
+    missing, read, removed = asyncio.run(scenario())
+    assert missing is False
+    assert read == (True, 1, 3)
+    # Прежний снимок остаётся, версия не растёт
+    assert removed is False
+    assert (source.snapshots.current.version, source.snapshots.current.clients) == (1, 3)
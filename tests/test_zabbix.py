@@ -0,0 +1,73 @@
+import asyncio
+import json
+import struct
+
+from zabbix import ZBX_HEADER, ZabbixExporter
+
+
+class FakeTrapper:
+    # Минимальный Zabbix trapper: принимает запрос sender data и отвечает заданным статусом
+    def __init__(self, response="success"):
+        self.response = response
+        self.requests = []
+        self.headers = []
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def _handle(self, reader, writer):
+        header = await reader.readexactly(len(ZBX_HEADER) + 8)
+        self.headers.append(header)
+        length = struct.unpack("<Q", header[len(ZBX_HEADER):])[0]
+        self.requests.append(json.loads(await reader.readexactly(length)))
+        payload = json.dumps({"response": self.response, "info": "processed: 2; failed: 0"}).encode()
+        writer.write(ZBX_HEADER + struct.pack("<Q", len(payload)) + payload)
+        await writer.drain()
+        writer.close()
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+
+def test_flush_sends_batch_to_trapper():
+    async def scenario():
+        trapper = FakeTrapper()
+        port = await trapper.start()
+        exporter = ZabbixExporter(f"127.0.0.1:{port}", "vpn-host", max_batch=10, timeout=2)
+        exporter.collect({"vpn.clients": 3, "vpn.sessions.new": 1}, clock=1735689600)
+        await exporter.flush()
+        await trapper.stop()
+        return trapper, exporter
+
+    trapper, exporter = asyncio.run(scenario())
+    header = trapper.headers[0]
+    assert header.startswith(b"ZBXD\x01")
+    request = trapper.requests[0]
+    assert struct.unpack("<Q", header[5:])[0] == len(json.dumps(request).encode())
+    assert request["request"] == "sender data"
+    assert request["data"] == [
+        {"host": "vpn-host", "key": "vpn.clients", "value": "3", "clock": 1735689600},
+        {"host": "vpn-host", "key": "vpn.sessions.new", "value": "1", "clock": 1735689600},
+    ]
+    assert exporter.stats["sent"] == 2
+    assert exporter.stats["queued"] == 0
+
+
+def test_rejected_batch_is_requeued():
+    async def scenario():
+        trapper = FakeTrapper(response="failed")
+        port = await trapper.start()
+        exporter = ZabbixExporter(f"127.0.0.1:{port}", "vpn-host", timeout=2, retries=2, backoff=0)
+        exporter.collect({"vpn.clients": 3})
+        await exporter.flush()
+        await trapper.stop()
+        return trapper, exporter
+
+    trapper, exporter = asyncio.run(scenario())
+    assert len(trapper.requests) == 2
+    assert exporter.stats["failed_batches"] == 1
+    assert "rejected" in exporter.stats["last_error"]
+    assert exporter.stats["queued"] == 1
@@ -0,0 +1,132 @@
+import asyncio
+import json
+import struct
+import time
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+ZBX_HEADER = b"ZBXD\x01"
+MAX_QUEUE = 10000
+MAX_BATCH = 1000
+
+
+def pack_request(data):
+    payload = json.dumps({"request": "sender data", "data": data, "clock": int(time.time())}).encode("utf-8")
+    return ZBX_HEADER + struct.pack("<Q", len(payload)) + payload
+
+
+async def read_response(reader):
+    header = await reader.readexactly(len(ZBX_HEADER) + 8)
+    if not header.startswith(ZBX_HEADER):
+        raise ValueError(f"Unexpected Zabbix response header: {header!r}")
+    length = struct.unpack("<Q", header[len(ZBX_HEADER):])[0]
+    return json.loads(await reader.readexactly(length))
+
+
+class ZabbixExporter:
+    # Копит метрики от поллера и отправляет их одной пачкой раз в интервал по протоколу Zabbix sender
+    def __init__(self, server, hostname, interval=60, max_queue=MAX_QUEUE, max_batch=MAX_BATCH,
+                 timeout=5, retries=3, backoff=1.0):
+        host, _, port = server.partition(":")
+        self.host = host
+        self.port = int(port or 10051)
+        self.hostname = hostname
+        self.interval = interval
+        self.max_queue = max_queue
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self._queue = deque()
+        self._traffic = {}
+        self.stats = {"queued": 0, "sent": 0, "dropped": 0, "failed_batches": 0, "last_error": None, "last_flush": None}
+
+    def collect(self, metrics, clock=None):
+        clock = int(clock or time.time())
+        for key, value in metrics.items():
+            if len(self._queue) >= self.max_queue:
+                self._queue.popleft()
+                self.stats["dropped"] += 1
+            self._queue.append({"host": self.hostname, "key": key, "value": str(value), "clock": clock})
+        self.stats["queued"] = len(self._queue)
+
+    def collect_traffic(self, clients, clock=None):
+        # Скорость считаем по разнице счётчиков между циклами поллера
+        clock = clock or time.time()
+        # Счётчики ведутся по (сервер, CN, Client ID), а скорость CN суммируется по всем подключениям.
+        # После переподключения счётчик начинается заново: такой интервал пропускается
+        rates = {}
+        current = {}
+        for client in clients:
+            name = client["common_name"]
+            key = (client.get("server_id"), name, client.get("client_id"))
+            received = client["bytes_received"]
+            sent = client["bytes_sent"]
+            current[key] = (received, sent, clock)
+            previous = self._traffic.get(key)
+            if previous and clock > previous[2] and received >= previous[0] and sent >= previous[1]:
+                elapsed = clock - previous[2]
+                rx, tx = rates.get(name, (0, 0))
+                rates[name] = (rx + (received - previous[0]) / elapsed, tx + (sent - previous[1]) / elapsed)
+        self._traffic = current
+        metrics = {}
+        for name, (rx, tx) in rates.items():
+            metrics[f"vpn.client.rx_rate[{name}]"] = round(rx, 2)
+            metrics[f"vpn.client.tx_rate[{name}]"] = round(tx, 2)
+        self.collect(metrics, clock)
+
+    async def _send(self, batch):
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), self.timeout)
+        try:
+            writer.write(pack_request(batch))
+            await writer.drain()
+            response = await asyncio.wait_for(read_response(reader), self.timeout)
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+        if response.get("response") != "success":
+            raise ValueError(f"Zabbix rejected batch: {response}")
+        return response.get("info", "")
+
+    async def flush(self):
+        while self._queue:
+            batch = [self._queue.popleft() for _ in range(min(self.max_batch, len(self._queue)))]
+            for attempt in range(self.retries):
+                try:
+                    info = await self._send(batch)
+                    self.stats["sent"] += len(batch)
+                    self.stats["last_flush"] = time.time()
+                    logger.debug(f"Sent {len(batch)} metrics to Zabbix: {info}")
+                    break
+                except Exception as e:
+                    self.stats["last_error"] = str(e)
+                    if attempt + 1 < self.retries:
+                        await asyncio.sleep(self.backoff * 2 ** attempt)
+            else:
+                self.stats["failed_batches"] += 1
+                logger.error(f"Zabbix sender error, {len(batch)} metrics returned to queue: {self.stats['last_error']}")
+                self._requeue(batch)
+                break
+        self.stats["queued"] = len(self._queue)
+
+    def _requeue(self, batch):
+        # Неотправленная пачка возвращается в начало очереди, лишнее сверх лимита отбрасывается
+        free = self.max_queue - len(self._queue)
+        if free < len(batch):
+            self.stats["dropped"] += len(batch) - max(free, 0)
+            batch = batch[len(batch) - max(free, 0):]
+        self._queue.extendleft(reversed(batch))
+
+    async def run(self):
+        try:
+            while True:
+                await asyncio.sleep(self.interval)
+                await self.flush()
+        except asyncio.CancelledError:
+            await self.flush()
+            raise